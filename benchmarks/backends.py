@@ -0,0 +1,161 @@
+"""
+确定性替身模型
+接口与 GroundingDINOModel / BLIP2Model 相同，按配置的计算代价模拟耗时，
+输出只由图像内容和提示决定，便于在无权重的 CPU 机器上测试调度、缓存和 I/O。
+"""
+import hashlib
+import time
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from src.models.blip2 import BLIP2Model
+from src.models.decoding import resolve_decoding, trim_answer
+from src.models.grounding_dino import GroundingDINOModel
+from src.utils.cache import LRUCache, image_hash
+from src.utils.detections import Detections
+from src.utils.profiling import get_profiler
+
+
+ANSWERS = ["a chair", "two", "on the table", "yes", "no", "a living room",
+           "white", "next to the sofa", "three", "a lamp"]
+
+
+class SimulatedCost:
+    """
+    模拟计算代价：一次批量调用耗时 base_ms + Σ(per_item_ms + per_mpixel_ms × 百万像素)
+
+    base_ms 只在每批计算一次，对应 GPU 上的启动和权重读取开销，批量越大摊销越多。
+    """
+
+    def __init__(self, base_ms: float = 0.0, per_item_ms: float = 0.0,
+                 per_mpixel_ms: float = 0.0, mode: str = "sleep"):
+        """
+        Args:
+            base_ms: 每次调用的固定耗时
+            per_item_ms: 每个样本的耗时
+            per_mpixel_ms: 每百万像素的耗时
+            mode: "sleep" 释放 GIL（模拟 GPU/原生代码），"spin" 占用 CPU
+        """
+        if mode not in ("sleep", "spin"):
+            raise ValueError(f"未知的模拟方式: {mode}")
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.per_mpixel_ms = per_mpixel_ms
+        self.mode = mode
+
+    def __call__(self, images: List[Image.Image]):
+        pixels = sum(image.size[0] * image.size[1] for image in images) / 1e6
+        seconds = (self.base_ms + self.per_item_ms * len(images)
+                   + self.per_mpixel_ms * pixels) / 1000
+        if seconds <= 0:
+            return
+        if self.mode == "sleep":
+            time.sleep(seconds)
+        else:
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                pass
+
+
+def _rng(image: Image.Image, text: str) -> np.random.Generator:
+    digest = hashlib.blake2b(f"{image_hash(image)}:{text}".encode(), digest_size=8).digest()
+    return np.random.default_rng(int.from_bytes(digest, "little"))
+
+
+class StandInGroundingModel(GroundingDINOModel):
+    """Grounding DINO 替身：每个短语确定性地生成 0-3 个框"""
+
+    version = "standin-groundingdino"
+
+    def __init__(self, cost: SimulatedCost = None):
+        # 不加载权重；build_captions / match_label 沿用父类实现
+        self.device = "cpu"
+        self.model_path = None
+        self.model = None
+        self.cost = cost or SimulatedCost()
+
+    @staticmethod
+    def text_cache_stats():
+        return {}
+
+    def _generate(self, image: Image.Image, caption: str,
+                  box_threshold: float) -> Detections:
+        phrases = [p.strip() for p in caption.lower().split('.') if p.strip()]
+        rng = _rng(image, caption)
+        width, height = image.size
+        counts = rng.integers(0, 4, len(phrases))
+        n = int(counts.sum())
+        corners = rng.uniform(0, 1, (n, 2, 2))
+        lo, hi = corners.min(axis=1), corners.max(axis=1)
+        boxes = np.concatenate([lo, hi], axis=1) * [width, height, width, height]
+        scores = rng.uniform(0.2, 0.95, n)
+        detections = Detections(boxes, scores, np.repeat(np.arange(len(phrases)), counts),
+                                phrases)
+        order = np.argsort(-detections.scores, kind='stable')
+        return detections[order].filter(box_threshold)
+
+    def detect(self, image: Image.Image, text_prompt: str,
+               box_threshold: float = 0.3, text_threshold: float = 0.25,
+               nms_threshold: float = 0.5) -> Detections:
+        return self.detect_batch([image], [text_prompt], box_threshold)[0]
+
+    def detect_batch(self, images: List[Image.Image], captions,
+                     box_threshold: float = 0.3, text_threshold: float = 0.25,
+                     max_batch_size: int = 8,
+                     nms_threshold: float = 0.5) -> List[Detections]:
+        if isinstance(captions, str):
+            captions = [captions] * len(images)
+        results = []
+        for start in range(0, len(images), max_batch_size):
+            batch = list(zip(images[start:start + max_batch_size],
+                             captions[start:start + max_batch_size]))
+            # 阶段名称与真实模型一致，剖析结果可直接对比
+            profiler = get_profiler()
+            with profiler.stage("detect", batch=len(batch)):
+                with profiler.stage("detect.forward"):
+                    self.cost([image for image, _ in batch])
+                with profiler.stage("detect.postprocess"):
+                    results.extend(self._generate(image, caption, box_threshold)
+                                   for image, caption in batch)
+        return results
+
+
+class StandInBLIP2Model(BLIP2Model):
+    """BLIP-2 替身：答案由图像内容和提示确定"""
+
+    version = "standin-blip2"
+
+    def __init__(self, cost: SimulatedCost = None):
+        self.device = "cpu"
+        self.model_name = "standin"
+        self.precision = "fp32"
+        self.processor = None
+        self.model = None
+        self.embedding_cache = LRUCache(0)
+        self.cost = cost or SimulatedCost()
+
+    def generate(self, image: Image.Image, prompt: str, max_length: Optional[int] = None,
+                 decoding: Union[str, Dict, None] = None) -> str:
+        return self.generate_batch([image], [prompt], max_length=max_length,
+                                   decoding=decoding)[0]
+
+    def generate_batch(self, images: List[Image.Image], prompts: List[str],
+                       max_length: Optional[int] = None, max_batch_size: int = 8,
+                       decoding: Union[str, Dict, None] = None) -> List[str]:
+        if len(images) != len(prompts):
+            raise ValueError(f"图像数量 ({len(images)}) 与提示数量 ({len(prompts)}) 不一致")
+        # 解码配置只影响答案截断，模拟代价不变
+        config = resolve_decoding(decoding)
+        texts = []
+        for start in range(0, len(images), max_batch_size):
+            batch_images = images[start:start + max_batch_size]
+            batch_prompts = prompts[start:start + max_batch_size]
+            with get_profiler().stage("generate", batch=len(batch_images)):
+                with get_profiler().stage("generate.decode"):
+                    self.cost(batch_images)
+                texts.extend(trim_answer(ANSWERS[int(_rng(image, prompt).integers(len(ANSWERS)))],
+                                         config.get('stop'), config.get('max_words'))
+                             for image, prompt in zip(batch_images, batch_prompts))
+        return texts
@@ -0,0 +1,273 @@
+"""
+BLIP-2 精度模式与解码配置对比
+在固定的 VQA 问题集上比较各精度模式（fp32 / bf16 / int8 / int8-qformer ...）和
+解码配置（beam3 / greedy / greedy-short ...）的加载耗时、权重大小、峰值内存、延迟、
+生成 token 数，以及答案相对参考组合的变化
+
+用法:
+    # 合成图像 + 固定问题（只比较与参考组合的答案一致率）
+    python benchmarks/precision_benchmark.py --precisions fp32 bf16 int8 --output benchmarks/results/precision.json
+
+    # 带标注的问题集，额外报告准确率及其相对参考组合的差值
+    python benchmarks/precision_benchmark.py --vqa_set data/vqa_eval.jsonl
+
+    # 解码配置的延迟 / 质量权衡（参考组合为第一个精度 + 第一个解码配置）
+    python benchmarks/precision_benchmark.py --precisions fp32 --decodings beam3 greedy greedy-short
+
+问题集为 JSONL，每行 {"image": 路径, "question": 问题, "answer": 标注答案或答案列表}
+（question 也可写作 text，answer 可省略）。
+
+每个精度模式在独立子进程中运行，峰值内存互不影响；同一精度的各解码配置共用一次模型加载。
+"""
+import argparse
+import json
+import os
+import re
+import string
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.run_benchmarks import make_images, parse_resolution, peak_rss_bytes, summarize  # noqa: E402
+from src.models.registry import get_rss_bytes  # noqa: E402
+from src.utils.config import load_config  # noqa: E402
+
+
+DEFAULT_QUESTIONS = [
+    "What room is this?",
+    "How many chairs are there?",
+    "What color is the wall?",
+    "Is there a table in the image?",
+    "What is on the floor?",
+]
+
+_ARTICLES = re.compile(r"\b(a|an|the)\b")
+
+
+def normalize_answer(text: str) -> str:
+    """小写、去标点和冠词、合并空白（VQA 评测的常用规范化）"""
+    text = text.lower().translate(str.maketrans("", "", string.punctuation))
+    return " ".join(_ARTICLES.sub(" ", text).split())
+
+
+def load_vqa_set(args):
+    """
+    读取问题集
+
+    Returns:
+        (images, items)：items 为 {'image': 图像下标, 'question', 'answers'} 列表
+    """
+    from PIL import Image
+
+    if not args.vqa_set:
+        images = make_images(parse_resolution(args.resolution), args.num_images, seed=0)
+        items = [{'image': i, 'question': question, 'answers': []}
+                 for i in range(len(images)) for question in DEFAULT_QUESTIONS]
+        return images, items
+
+    images, index, items = [], {}, []
+    base_dir = os.path.dirname(os.path.abspath(args.vqa_set))
+    with open(args.vqa_set, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            path = record['image']
+            if not os.path.isabs(path):
+                path = os.path.join(base_dir, path)
+            if path not in index:
+                index[path] = len(images)
+                images.append(Image.open(path).convert('RGB'))
+            answers = record.get('answer', [])
+            items.append({
+                'image': index[path],
+                'question': record.get('question') or record['text'],
+                'answers': [answers] if isinstance(answers, str) else list(answers),
+            })
+    return images, items
+
+
+def run_worker(args):
+    """子进程：加载一个精度模式，按每个解码配置回答整个问题集，最后一行输出 JSON 列表"""
+    from src.models.blip2 import BLIP2Model
+    from src.utils.profiling import get_profiler, output_nbytes
+
+    images, items = load_vqa_set(args)
+
+    rss_before = get_rss_bytes()
+    start = time.perf_counter()
+    model = BLIP2Model(model_name=args.model, device=args.device, precision=args.worker,
+                       quantized_cache_dir=args.quantized_cache_dir)
+    load_time = time.perf_counter() - start
+    if model.model is None:
+        raise RuntimeError(f"模型加载失败: {args.model}")
+    load_rss = get_rss_bytes() - rss_before
+    weights = sum(output_nbytes(value) for value in model.model.state_dict().values())
+
+    def answer(batch, decoding):
+        return model.answer_batch([images[item['image']] for item in batch],
+                                  [item['question'] for item in batch],
+                                  max_batch_size=len(batch), decoding=decoding)
+
+    # generate.new_tokens 计数器统计实际生成的 token 数
+    profiler = get_profiler()
+    profiler.enable()
+    results = []
+    for decoding in args.decodings:
+        for _ in range(args.warmup):
+            answer(items[:args.batch_size], decoding)
+        # 图像嵌入缓存会让后面的配置少算视觉编码，每个配置都从空缓存开始
+        model.embedding_cache.clear()
+        profiler.reset()
+
+        answers, latencies = [], []
+        begin = time.perf_counter()
+        for i in range(0, len(items), args.batch_size):
+            batch = items[i:i + args.batch_size]
+            start = time.perf_counter()
+            answers.extend(answer(batch, decoding))
+            latencies.append((time.perf_counter() - start) * 1000)
+        elapsed = time.perf_counter() - begin
+        model.embedding_cache.clear()
+
+        results.append({
+            'precision': args.worker,
+            'decoding': decoding,
+            'effective_precision': model.effective_precision,
+            'load_time_s': load_time,
+            'load_rss_mb': load_rss / 1024**2,
+            'weights_mb': weights / 1024**2,
+            'peak_rss_mb': peak_rss_bytes() / 1024**2,
+            **summarize(latencies, len(items), elapsed),
+            'new_tokens': profiler.stats()['counters'].get('generate.new_tokens', 0) / max(len(items), 1),
+            'answer_words': sum(len(a.split()) for a in answers) / max(len(answers), 1),
+            'answers': answers,
+        })
+    print(json.dumps(results, ensure_ascii=False))
+
+
+def accuracy(answers, items):
+    """与标注答案完全匹配（规范化后）的比例，无标注时返回 None"""
+    labeled = [(answer, item) for answer, item in zip(answers, items) if item['answers']]
+    if not labeled:
+        return None
+    correct = sum(normalize_answer(answer) in {normalize_answer(a) for a in item['answers']}
+                  for answer, item in labeled)
+    return correct / len(labeled)
+
+
+def compare_runs(results, items, reference: tuple):
+    """以参考组合 (精度, 解码配置) 为基准计算一致率、准确率差值、加速比和权重压缩比"""
+    ref = next(r for r in results if (r['precision'], r['decoding']) == reference)
+    ref_answers = [normalize_answer(a) for a in ref['answers']]
+    ref_accuracy = accuracy(ref['answers'], items)
+    for result in results:
+        answers = [normalize_answer(a) for a in result['answers']]
+        result['agreement'] = sum(a == b for a, b in zip(answers, ref_answers)) / max(len(answers), 1)
+        result['accuracy'] = accuracy(result['answers'], items)
+        result['accuracy_delta'] = (None if ref_accuracy is None
+                                    else result['accuracy'] - ref_accuracy)
+        result['speedup'] = ref['latency_ms']['mean'] / max(result['latency_ms']['mean'], 1e-9)
+        result['weights_ratio'] = result['weights_mb'] / max(ref['weights_mb'], 1e-9)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="BLIP-2 精度模式与解码配置对比")
+    parser.add_argument("--precisions", nargs="+", default=["fp32", "bf16", "int8"],
+                        help="对比的精度模式，见 src.models.blip2.PRECISIONS")
+    parser.add_argument("--reference", type=str, default=None,
+                        help="参考精度（默认为 --precisions 的第一个）")
+    parser.add_argument("--decodings", nargs="+", default=["beam3"],
+                        help="对比的解码配置，见 src.models.decoding.DECODING_PROFILES")
+    parser.add_argument("--reference_decoding", type=str, default=None,
+                        help="参考解码配置（默认为 --decodings 的第一个）")
+    parser.add_argument("--config", type=str, default="config.yaml",
+                        help="读取 model.blip2_model 和 model.quantized_cache_dir")
+    parser.add_argument("--model", type=str, default=None, help="覆盖配置中的 BLIP-2 模型")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--quantized_cache_dir", type=str, default=None,
+                        help="覆盖配置中的量化模型缓存目录")
+    parser.add_argument("--vqa_set", type=str, default=None, help="问题集 JSONL")
+    parser.add_argument("--num_images", type=int, default=8,
+                        help="未指定 --vqa_set 时的合成图像数（每张图像提问全部固定问题）")
+    parser.add_argument("--resolution", type=str, default="640x480")
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1, help="预热批数，不计入统计")
+    parser.add_argument("--output", type=str, default=None, help="结果 JSON 路径")
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    model_config = load_config(args.config).get('model', {})
+    args.model = args.model or model_config.get('blip2_model', "Salesforce/blip2-opt-2.7b")
+    if args.quantized_cache_dir is None:
+        args.quantized_cache_dir = model_config.get('quantized_cache_dir')
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    reference = (args.reference or args.precisions[0],
+                 args.reference_decoding or args.decodings[0])
+    precisions = list(dict.fromkeys([reference[0]] + args.precisions))
+    args.decodings = list(dict.fromkeys([reference[1]] + args.decodings))
+    _, items = load_vqa_set(args)
+
+    results = []
+    for precision in precisions:
+        print(f"运行 {precision} ...")
+        command = [sys.executable, os.path.abspath(__file__), "--worker", precision,
+                   "--config", args.config, "--model", args.model, "--device", args.device,
+                   "--num_images", str(args.num_images), "--resolution", args.resolution,
+                   "--batch_size", str(args.batch_size), "--warmup", str(args.warmup),
+                   "--decodings", *args.decodings]
+        if args.quantized_cache_dir:
+            command += ["--quantized_cache_dir", args.quantized_cache_dir]
+        if args.vqa_set:
+            command += ["--vqa_set", args.vqa_set]
+        proc = subprocess.run(command, capture_output=True, text=True, encoding='utf-8')
+        if proc.returncode != 0:
+            print(proc.stdout[-2000:])
+            print(proc.stderr[-2000:])
+            print(f"[ERROR] {precision} 运行失败")
+            sys.exit(1)
+        results.extend(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    compare_runs(results, items, reference)
+
+    print(f"\n参考组合: {reference[0]} / {reference[1]}，{len(items)} 个问题")
+    print(f"{'精度':<14}{'实际':<14}{'解码':<14}{'加载(s)':>9}{'权重(MB)':>11}{'峰值(MB)':>11}"
+          f"{'平均(ms)':>11}{'加速':>8}{'token':>8}{'词数':>7}{'一致率':>9}{'准确率差':>10}")
+    for r in results:
+        delta = "-" if r['accuracy_delta'] is None else f"{r['accuracy_delta']:+.3f}"
+        print(f"{r['precision']:<14}{r['effective_precision']:<14}{r['decoding']:<14}"
+              f"{r['load_time_s']:>9.1f}{r['weights_mb']:>11.1f}{r['peak_rss_mb']:>11.0f}"
+              f"{r['latency_ms']['mean']:>11.1f}{r['speedup']:>7.2f}x"
+              f"{r['new_tokens']:>8.1f}{r['answer_words']:>7.1f}"
+              f"{r['agreement']:>9.1%}{delta:>10}")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'reference': {'precision': reference[0], 'decoding': reference[1]},
+                'args': vars(args),
+                'questions': [{'image': item['image'], 'question': item['question'],
+                               'answers': item['answers']} for item in items],
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
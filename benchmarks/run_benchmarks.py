@@ -0,0 +1,333 @@
+"""
+推理基准测试
+统计各任务在不同批大小和分辨率下的延迟分位数（p50/p95/p99）、吞吐量和峰值内存
+
+用法:
+    # 替身模型（无需权重，CPU 即可运行）
+    python benchmarks/run_benchmarks.py --backend standin --output benchmarks/results/standin.json
+
+    # 真实模型
+    python benchmarks/run_benchmarks.py --backend real --device cuda --output benchmarks/results/gpu.json
+
+    # 与上一次结果对比，吞吐量或 p50 退化超过容差时返回非零退出码
+    python benchmarks/run_benchmarks.py --backend standin --compare benchmarks/results/standin.json
+
+场景:
+    batch       每次调用 InferenceService.handle_batch 处理 batch_size 个请求
+    concurrent  启用动态批处理，batch_size 个线程并发调用 handle
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.models.registry import get_rss_bytes  # noqa: E402
+from src.serving.service import InferenceService  # noqa: E402
+from src.utils.cache import ResultCache  # noqa: E402
+from src.utils.profiling import get_profiler  # noqa: E402
+
+
+TASK_TEXTS = {
+    'grounding': "chair . table . lamp",
+    'counting': "chair",
+    'vqa': "What is in the room?",
+}
+
+
+def peak_rss_bytes() -> int:
+    """进程启动以来的峰值常驻内存"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return get_rss_bytes()
+
+
+def parse_resolution(text: str):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def make_images(resolution, count: int, seed: int = 0):
+    """生成确定性的合成图像（低频图案加噪声，接近真实图像的压缩率）"""
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        coarse = rng.integers(0, 256, (max(1, height // 32), max(1, width // 32), 3),
+                              dtype=np.uint8)
+        image = Image.fromarray(coarse).resize((width, height), Image.BILINEAR)
+        noise = rng.integers(-8, 8, (height, width, 3))
+        pixels = np.clip(np.asarray(image, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+        images.append(Image.fromarray(pixels))
+    return images
+
+
+def summarize(latencies_ms, num_requests: int, elapsed: float) -> dict:
+    latencies = np.asarray(latencies_ms, dtype=np.float64)
+    return {
+        'requests': num_requests,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'mean': float(latencies.mean()),
+            'max': float(latencies.max()),
+        },
+        'throughput_rps': num_requests / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def run_batch_scenario(service, task, images, paths, batch_size, iterations, warmup,
+                       from_disk):
+    """handle_batch 场景：一次调用内所有请求的延迟等于该批的耗时"""
+    from src.serving.batch import _load_image
+
+    text = TASK_TEXTS[task]
+    latencies = []
+    start_time = None
+    for step in range(warmup + iterations):
+        if step == warmup:
+            start_time = time.perf_counter()
+        offset = step * batch_size
+        indices = [(offset + i) % len(images) for i in range(batch_size)]
+        requests = [{'id': str(i), 'task': task, 'text': text} for i in indices]
+
+        t0 = time.perf_counter()
+        batch_images = ([_load_image(paths[i]) for i in indices] if from_disk
+                        else [images[i] for i in indices])
+        responses = service.handle_batch(requests, batch_images)
+        elapsed = (time.perf_counter() - t0) * 1000
+
+        errors = [r['error'] for r in responses if 'error' in r]
+        if errors:
+            raise RuntimeError(f"{task} 请求失败: {errors[0]}")
+        if step >= warmup:
+            latencies.extend([elapsed] * batch_size)
+
+    return summarize(latencies, iterations * batch_size, time.perf_counter() - start_time)
+
+
+def run_concurrent_scenario(service, task, paths, concurrency, iterations, warmup):
+    """动态批处理场景：concurrency 个线程各自串行发送请求"""
+    text = TASK_TEXTS[task]
+    latencies = []
+    lock = threading.Lock()
+
+    def client(worker: int, count: int, record: bool):
+        for i in range(count):
+            path = paths[(worker * count + i) % len(paths)]
+            t0 = time.perf_counter()
+            service.handle({'task': task, 'image': path, 'text': text})
+            if record:
+                with lock:
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda w: client(w, warmup, False), range(concurrency)))
+        start_time = time.perf_counter()
+        list(pool.map(lambda w: client(w, iterations, True), range(concurrency)))
+        elapsed = time.perf_counter() - start_time
+
+    return summarize(latencies, iterations * concurrency, elapsed)
+
+
+def build_service(args) -> InferenceService:
+    result_cache = ResultCache(max_bytes=64 * 1024**2) if args.result_cache else None
+    serving_config = {'max_batch_size': max(args.batch_sizes), 'max_wait_ms': args.max_wait_ms,
+                      'coalesce': True}
+
+    if args.backend == "real":
+        service = InferenceService.from_config(args.config, device=args.device)
+        service.result_cache = result_cache
+        service.serving_config.update(serving_config)
+        return service
+
+    from benchmarks.backends import SimulatedCost, StandInBLIP2Model, StandInGroundingModel
+    models = {
+        'grounding_dino': StandInGroundingModel(SimulatedCost(
+            args.detect_base_ms, args.detect_item_ms, args.detect_mpixel_ms, args.cost_mode)),
+        'blip2': StandInBLIP2Model(SimulatedCost(
+            args.vqa_base_ms, args.vqa_item_ms, args.vqa_mpixel_ms, args.cost_mode)),
+    }
+    return InferenceService(device="cpu", serving_config=serving_config,
+                            result_cache=result_cache, models=models)
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> bool:
+    """
+    与基线结果对比
+
+    Returns:
+        是否存在超过容差的退化（p50 变慢或吞吐量下降）
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {
+            (r['scenario'], r['task'], r['resolution'], r['batch_size']): r
+            for r in json.load(f)['results']
+        }
+
+    regressed = False
+    print(f"\n与基线对比: {baseline_path}")
+    print(f"{'场景':<12}{'任务':<11}{'分辨率':<11}{'批大小':>6}{'p50 变化':>12}{'吞吐变化':>12}")
+    for r in results:
+        key = (r['scenario'], r['task'], r['resolution'], r['batch_size'])
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        p50_change = r['latency_ms']['p50'] / max(old['latency_ms']['p50'], 1e-9) - 1
+        rps_change = r['throughput_rps'] / max(old['throughput_rps'], 1e-9) - 1
+        flag = ""
+        if p50_change > tolerance or rps_change < -tolerance:
+            regressed = True
+            flag = "  <- 退化"
+        print(f"{r['scenario']:<12}{r['task']:<11}{r['resolution']:<11}{r['batch_size']:>6}"
+              f"{p50_change:>+12.1%}{rps_change:>+12.1%}{flag}")
+    return regressed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="推理基准测试")
+    parser.add_argument("--backend", choices=["standin", "real"], default="standin",
+                        help="standin: 确定性替身模型；real: 加载真实模型")
+    parser.add_argument("--tasks", nargs="+", default=["grounding", "counting", "vqa"],
+                        choices=list(TASK_TEXTS))
+    parser.add_argument("--scenarios", nargs="+", default=["batch", "concurrent"],
+                        choices=["batch", "concurrent"])
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 4, 8],
+                        help="批大小（concurrent 场景中为并发线程数）")
+    parser.add_argument("--resolutions", nargs="+", default=["320x240", "640x480", "1280x960"])
+    parser.add_argument("--iterations", type=int, default=20,
+                        help="每个配置的计时轮数（concurrent 场景为每个线程的请求数）")
+    parser.add_argument("--warmup", type=int, default=2, help="预热轮数，不计入统计")
+    parser.add_argument("--unique_images", type=int, default=0,
+                        help="每个分辨率的不同图像数，0 表示每个请求都用新图像；"
+                             "配合 --result_cache 控制缓存命中率")
+    parser.add_argument("--result_cache", action="store_true", help="启用结果缓存")
+    parser.add_argument("--from_disk", action="store_true",
+                        help="batch 场景中从磁盘读取并解码图像（计入延迟）")
+    parser.add_argument("--max_wait_ms", type=float, default=10.0,
+                        help="concurrent 场景的凑批等待时间")
+    parser.add_argument("--output", type=str, default=None, help="结果 JSON 路径")
+    parser.add_argument("--profile", action="store_true",
+                        help="开启分阶段计时，每组结果附带各阶段耗时汇总")
+    parser.add_argument("--compare", type=str, default=None, help="基线结果 JSON 路径")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="对比时允许的相对退化（默认 10%%）")
+
+    real_group = parser.add_argument_group("真实模型")
+    real_group.add_argument("--config", type=str, default="config.yaml")
+    real_group.add_argument("--device", type=str, default=None)
+
+    cost_group = parser.add_argument_group("替身模型的模拟代价（毫秒）")
+    cost_group.add_argument("--cost_mode", choices=["sleep", "spin"], default="sleep",
+                            help="sleep 模拟 GPU（释放 GIL），spin 模拟 CPU 计算")
+    cost_group.add_argument("--detect_base_ms", type=float, default=20.0)
+    cost_group.add_argument("--detect_item_ms", type=float, default=8.0)
+    cost_group.add_argument("--detect_mpixel_ms", type=float, default=10.0)
+    cost_group.add_argument("--vqa_base_ms", type=float, default=30.0)
+    cost_group.add_argument("--vqa_item_ms", type=float, default=15.0)
+    cost_group.add_argument("--vqa_mpixel_ms", type=float, default=5.0)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    profiler = get_profiler()
+    if args.profile:
+        profiler.enable()
+    service = build_service(args)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for resolution_text in args.resolutions:
+            resolution = parse_resolution(resolution_text)
+            max_requests = (args.warmup + args.iterations) * max(args.batch_sizes)
+            num_images = args.unique_images or max_requests
+            images = make_images(resolution, num_images, seed=sum(resolution))
+            paths = []
+            for i, image in enumerate(images):
+                path = os.path.join(tmp_dir, f"{resolution_text}_{i}.jpg")
+                image.save(path, quality=90)
+                paths.append(path)
+
+            for scenario in args.scenarios:
+                if scenario == "concurrent":
+                    service.enable_batching()
+                for task in args.tasks:
+                    for batch_size in args.batch_sizes:
+                        if args.result_cache:
+                            service.result_cache.memory.clear()
+                        profiler.reset()
+                        if scenario == "batch":
+                            stats = run_batch_scenario(service, task, images, paths,
+                                                       batch_size, args.iterations,
+                                                       args.warmup, args.from_disk)
+                        else:
+                            stats = run_concurrent_scenario(service, task, paths, batch_size,
+                                                            args.iterations, args.warmup)
+                        stats = {
+                            'scenario': scenario,
+                            'task': task,
+                            'resolution': resolution_text,
+                            'batch_size': batch_size,
+                            **stats,
+                            'rss_mb': get_rss_bytes() / 1024**2,
+                            'peak_rss_mb': peak_rss_bytes() / 1024**2,
+                        }
+                        if args.profile:
+                            stats['stages'] = profiler.stats()['stages']
+                        results.append(stats)
+                        latency = stats['latency_ms']
+                        print(f"{scenario:<11}{task:<10}{resolution_text:>10} bs={batch_size:<3}"
+                              f" p50={latency['p50']:8.1f}ms p95={latency['p95']:8.1f}ms"
+                              f" p99={latency['p99']:8.1f}ms"
+                              f" {stats['throughput_rps']:8.1f} req/s"
+                              f" peak={stats['peak_rss_mb']:.0f}MB")
+                if scenario == "concurrent" and service.scheduler is not None:
+                    service.scheduler.close()
+                    service.scheduler = None
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'backend': args.backend,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.backend == "real":
+        report['meta']['health'] = service.health()
+    service.close()
+
+    # 先与基线对比，再写结果（输出路径可以与基线相同）
+    regressed = bool(args.compare) and compare(results, args.compare, args.tolerance)
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {args.output}")
+
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
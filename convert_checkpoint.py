@@ -0,0 +1,41 @@
+"""
+将 Grounding DINO 的 .pth checkpoint 转换为 safetensors
+转换后的文件可以直接内存映射加载，加载时不执行 pickle，只需转换一次
+
+用法:
+    python convert_checkpoint.py groundingdino_swinb_cogcoor.pth
+    # 然后在 config.yaml 中设置 model.grounding_model: "groundingdino_swinb_cogcoor.safetensors"
+"""
+import argparse
+import os
+import sys
+import time
+
+from src.utils.weights import convert_checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将 .pth checkpoint 转换为 safetensors")
+    parser.add_argument("checkpoint", type=str, help="原始 .pth 文件")
+    parser.add_argument("--output", type=str, default=None,
+                        help="输出路径（默认与输入同名，扩展名为 .safetensors）")
+    parser.add_argument("--force", action="store_true", help="覆盖已存在的输出文件")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.checkpoint):
+        print(f"[ERROR] 文件不存在: {args.checkpoint}")
+        sys.exit(1)
+    output = args.output or os.path.splitext(args.checkpoint)[0] + ".safetensors"
+    if os.path.exists(output) and not args.force:
+        print(f"输出文件已存在: {output}（使用 --force 覆盖）")
+        return
+
+    print(f"正在转换: {args.checkpoint} -> {output}")
+    start = time.perf_counter()
+    info = convert_checkpoint(args.checkpoint, output)
+    print(f"转换完成: {info['tensors']} 个张量，{info['bytes'] / 1024**2:.1f} MB，"
+          f"耗时 {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
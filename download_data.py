@@ -1,14 +1,290 @@
 """
 下载 NYU Depth V2 数据集的脚本
-支持断点续传和进度显示
+支持分段并发下载、断点续传、进度显示和 SHA-256 校验
 """
 import os
+import hashlib
+import json
+import threading
+import time
+import urllib.error
 import urllib.request
 import argparse
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 import sys
 
 
+BUFFER_SIZE = 1024 * 1024        # 每次读取 1 MB
+PROGRESS_INTERVAL = 0.5           # 进度输出间隔（秒）
+STATE_SAVE_INTERVAL = 2.0         # 分段状态保存间隔（秒）
+
+
+class ProgressReporter:
+    """限频的进度输出，避免每个数据块都刷新终端"""
+    
+    def __init__(self, total_size, initial=0, interval=PROGRESS_INTERVAL):
+        self.total_size = total_size
+        self.downloaded = initial
+        self.interval = interval
+        self._last = 0.0
+        self._start = time.monotonic()
+        self._start_bytes = initial
+        self._lock = threading.Lock()
+    
+    def update(self, nbytes):
+        with self._lock:
+            self.downloaded += nbytes
+            now = time.monotonic()
+            if now - self._last < self.interval:
+                return
+            self._last = now
+        self.print_progress()
+    
+    def print_progress(self):
+        elapsed = max(time.monotonic() - self._start, 1e-6)
+        speed = (self.downloaded - self._start_bytes) / elapsed / (1024**2)
+        downloaded_gb = self.downloaded / (1024**3)
+        if self.total_size > 0:
+            percent = (self.downloaded / self.total_size) * 100
+            total_gb = self.total_size / (1024**3)
+            print(f"\r进度: {percent:.1f}% ({downloaded_gb:.2f} GB / {total_gb:.2f} GB) "
+                  f"{speed:.1f} MB/s", end='', flush=True)
+        else:
+            print(f"\r已下载: {downloaded_gb:.2f} GB {speed:.1f} MB/s", end='', flush=True)
+
+
+def sha256_file(path, buffer_size=8 * 1024 * 1024):
+    """计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(buffer_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_sha256(path, expected_sha256):
+    """
+    校验文件 SHA-256
+    
+    Returns:
+        (是否通过, 实际哈希)。未提供期望值时只计算哈希并视为通过
+    """
+    print(f"正在计算 SHA-256: {path}")
+    actual = sha256_file(path)
+    print(f"SHA-256: {actual}")
+    if expected_sha256 and actual.lower() != expected_sha256.lower():
+        print(f"警告: SHA-256 不匹配 (期望: {expected_sha256})")
+        return False, actual
+    return True, actual
+
+
+def _read_sidecar(sidecar):
+    """读取 .sha256 文件中的哈希，文件为空或内容不完整时返回 None"""
+    try:
+        fields = sidecar.read_text(encoding='utf-8').split()
+    except OSError:
+        return None
+    if not fields or len(fields[0]) != 64:
+        return None
+    try:
+        int(fields[0], 16)
+    except ValueError:
+        return None
+    return fields[0]
+
+
+def _finish(dest_path, expected_sha256):
+    """校验 SHA-256，通过后写入 <dest>.sha256 供后续运行比对"""
+    ok, actual = verify_sha256(dest_path, expected_sha256)
+    if ok:
+        sidecar = dest_path.with_name(dest_path.name + '.sha256')
+        sidecar.write_text(f"{actual}  {dest_path.name}\n", encoding='utf-8')
+    return ok
+
+
+def is_complete(file_path, url=None, expected_sha256=None):
+    """
+    判断已存在的文件是否完整
+    
+    优先使用期望的 SHA-256，其次使用下载时记录的 .sha256 文件，
+    最后与服务器报告的文件大小比较（大小一致时重新计算哈希并写入 .sha256）。
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return False
+    
+    sidecar = file_path.with_name(file_path.name + '.sha256')
+    if not expected_sha256 and sidecar.exists():
+        expected_sha256 = _read_sidecar(sidecar)
+        if expected_sha256 is None:
+            print(f"警告: {sidecar} 为空或不完整，视为未校验")
+    if expected_sha256:
+        return verify_sha256(file_path, expected_sha256)[0]
+    
+    if url:
+        try:
+            total_size, _ = probe_url(url)
+        except Exception:
+            return False
+        if total_size > 0 and file_path.stat().st_size == total_size:
+            return _finish(file_path, None)
+    return False
+
+
+def probe_url(url, timeout=30):
+    """
+    查询文件大小以及服务器是否支持 Range 请求
+    
+    Returns:
+        (total_size, accepts_ranges)，大小未知时为 0
+    """
+    req = urllib.request.Request(url, headers={'Range': 'bytes=0-0'})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        if response.status == 206 and 'Content-Range' in response.headers:
+            total = response.headers['Content-Range'].split('/')[-1]
+            return (int(total) if total.isdigit() else 0), True
+        return int(response.headers.get('Content-Length', 0)), False
+
+
+def _load_state(state_path, url, total_size, num_segments):
+    """读取分段下载状态，不匹配时重新划分"""
+    if state_path.exists():
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state['url'] == url and state['total_size'] == total_size:
+                return state
+        except (json.JSONDecodeError, KeyError):
+            pass
+    
+    segment_size = -(-total_size // num_segments)
+    segments = [[start, min(start + segment_size, total_size) - 1, 0]
+                for start in range(0, total_size, segment_size)]
+    return {'url': url, 'total_size': total_size, 'segments': segments}
+
+
+def _save_state(state_path, state, lock):
+    with lock:
+        data = json.dumps(state)
+    tmp_path = state_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(tmp_path, state_path)
+
+
+def _download_segment(url, part_path, segment, lock, progress, buffer_size, timeout,
+                      stop=None):
+    """
+    下载一个字节区间，segment = [start, end, 已下载字节]，原地更新进度
+    
+    stop 被设置时在当前数据块写完后返回（已写入的字节已计入 segment）。
+    """
+    start, end, done = segment
+    if start + done > end:
+        return
+    req = urllib.request.Request(url, headers={'Range': f'bytes={start + done}-{end}'})
+    with urllib.request.urlopen(req, timeout=timeout) as response, \
+            open(part_path, 'r+b') as f:
+        if response.status != 206:
+            raise IOError(f"服务器未返回分段内容 (HTTP {response.status})")
+        f.seek(start + done)
+        while True:
+            if stop is not None and stop.is_set():
+                return
+            chunk = response.read(buffer_size)
+            if not chunk:
+                break
+            f.write(chunk)
+            with lock:
+                segment[2] += len(chunk)
+            progress.update(len(chunk))
+    if start + segment[2] <= end:
+        raise IOError(f"分段 {start}-{end} 未下载完整")
+
+
+def download_file_parallel(url, dest_path, num_segments=8, expected_sha256=None,
+                           buffer_size=BUFFER_SIZE, timeout=60):
+    """
+    分段并发下载文件，支持按分段断点续传和 SHA-256 校验
+    
+    数据写入 <dest>.part，分段进度保存在 <dest>.part.json；
+    全部完成后重命名为目标文件。服务器不支持 Range 时退回单连接下载。
+    
+    Args:
+        url: 下载链接
+        dest_path: 保存路径
+        num_segments: 并发分段数
+        expected_sha256: 期望的 SHA-256（None 时只计算不比较）
+        buffer_size: 每次读取的字节数
+        timeout: 连接超时（秒）
+        
+    Returns:
+        下载并校验成功返回 True
+    """
+    dest_path = Path(dest_path)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    total_size, accepts_ranges = probe_url(url, timeout)
+    if not accepts_ranges or total_size <= 0 or num_segments <= 1:
+        print("服务器不支持分段下载，使用单连接下载")
+        if not download_file_with_resume(url, dest_path):
+            return False
+        return _finish(dest_path, expected_sha256)
+    
+    part_path = dest_path.with_name(dest_path.name + '.part')
+    state_path = dest_path.with_name(dest_path.name + '.part.json')
+    state = _load_state(state_path, url, total_size, num_segments)
+    
+    # 预分配文件，各分段按偏移写入
+    if not part_path.exists() or part_path.stat().st_size != total_size:
+        with open(part_path, 'ab') as f:
+            f.truncate(total_size)
+    
+    downloaded = sum(segment[2] for segment in state['segments'])
+    print(f"文件总大小: {total_size / (1024**3):.2f} GB，分段数: {len(state['segments'])}")
+    if downloaded:
+        print(f"继续下载，已完成: {downloaded / (1024**3):.2f} GB")
+    
+    lock = threading.Lock()
+    stop = threading.Event()
+    progress = ProgressReporter(total_size, initial=downloaded)
+    errors = []
+    
+    with ThreadPoolExecutor(max_workers=len(state['segments'])) as pool:
+        futures = [pool.submit(_download_segment, url, part_path, segment, lock,
+                               progress, buffer_size, timeout, stop)
+                   for segment in state['segments']]
+        try:
+            while not all(future.done() for future in futures):
+                wait(futures, timeout=STATE_SAVE_INTERVAL)
+                _save_state(state_path, state, lock)
+        except BaseException:
+            # KeyboardInterrupt 等：通知分段线程停止，线程池退出时等待它们写完当前数据块
+            stop.set()
+            raise
+        finally:
+            _save_state(state_path, state, lock)
+        for future in futures:
+            if future.exception() is not None:
+                errors.append(future.exception())
+    
+    progress.print_progress()
+    print()
+    if errors:
+        print(f"下载失败: {errors[0]}")
+        print("可以重新运行继续下载（支持断点续传）")
+        return False
+    
+    os.replace(part_path, dest_path)
+    state_path.unlink()
+    print("下载完成!")
+    return _finish(dest_path, expected_sha256)
+
+
 def download_file_with_resume(url, dest_path):
     """
     下载文件并支持断点续传
@@ -52,27 +328,18 @@ def download_file_with_resume(url, dest_path):
             # 打开文件（追加模式如果已存在）
             mode = 'ab' if existing_size > 0 else 'wb'
             with open(dest_path, mode) as f:
-                downloaded = existing_size
-                block_size = 8192
+                progress = ProgressReporter(total_size, initial=existing_size)
                 
                 while True:
-                    chunk = response.read(block_size)
+                    chunk = response.read(BUFFER_SIZE)
                     if not chunk:
                         break
                     
                     f.write(chunk)
-                    downloaded += len(chunk)
-                    
-                    # 显示进度
-                    if total_size > 0:
-                        percent = (downloaded / total_size) * 100
-                        downloaded_gb = downloaded / (1024**3)
-                        total_gb = total_size / (1024**3)
-                        print(f"\r进度: {percent:.1f}% ({downloaded_gb:.2f} GB / {total_gb:.2f} GB)", 
-                              end='', flush=True)
-                    else:
-                        downloaded_gb = downloaded / (1024**3)
-                        print(f"\r已下载: {downloaded_gb:.2f} GB", end='', flush=True)
+                    # 显示进度（限频）
+                    progress.update(len(chunk))
+                
+                progress.print_progress()
         
         print("\n下载完成!")
         
@@ -103,6 +370,10 @@ def main():
                        help="数据保存目录")
     parser.add_argument("--force", action="store_true",
                        help="强制重新下载（删除已存在的文件）")
+    parser.add_argument("--segments", type=int, default=8,
+                       help="并发下载的分段数（1 表示单连接）")
+    parser.add_argument("--sha256", type=str, default=None,
+                       help="期望的 SHA-256，下载完成后校验")
     args = parser.parse_args()
     
     data_dir = Path(args.data_dir)
@@ -134,25 +405,25 @@ def main():
             file_path.unlink()
         
         # 检查是否已经完整下载
-        if file_path.exists():
+        if is_complete(file_path, url, args.sha256):
             file_size = file_path.stat().st_size
-            expected_size = 2.8 * (1024**3)  # 约 2.8 GB
-            
-            if file_size >= expected_size * 0.95:  # 允许 5% 的误差
-                print(f"\n文件已存在且大小正常: {file_path}")
-                print(f"文件大小: {file_size / (1024**3):.2f} GB")
-                response = input("是否重新下载? (y/n): ")
-                if response.lower() != 'y':
-                    print("跳过下载")
-                    continue
+            print(f"\n文件已存在且校验通过: {file_path}")
+            print(f"文件大小: {file_size / (1024**3):.2f} GB")
+            response = input("是否重新下载? (y/n): ")
+            if response.lower() != 'y':
+                print("跳过下载")
+                continue
+            file_path.unlink()
         
         try:
             print(f"\n开始下载: {filename}")
-            success = download_file_with_resume(url, file_path)
+            success = download_file_parallel(url, file_path,
+                                             num_segments=args.segments,
+                                             expected_sha256=args.sha256)
             if success:
                 print(f"\n[OK] {filename} 下载成功!")
             else:
-                print(f"\n[WARN] {filename} 下载完成但大小可能不完整")
+                print(f"\n[WARN] {filename} 下载未完成或校验失败")
         except KeyboardInterrupt:
             print("\n\n下载已中断")
             print("可以重新运行此脚本继续下载（支持断点续传）")
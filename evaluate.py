@@ -8,6 +8,7 @@ from torchvision import transforms
 from tqdm import tqdm
 
 from src.data.dataset import NYUDepthV2Dataset
+from src.utils.config import load_config
 from src.tasks.grounding import GroundingTask
 from src.tasks.counting import CountingTask
 from src.tasks.vqa import VQATask
@@ -63,9 +64,12 @@ def main():
                        help="数据集路径")
     parser.add_argument("--device", type=str, default="cuda",
                        help="设备类型")
+    parser.add_argument("--config", type=str, default="config.yaml",
+                       help="配置文件路径（读取数据划分比例和 VQA 解码配置）")
     args = parser.parse_args()
     
     device = args.device if torch.cuda.is_available() else "cpu"
+    data_config = load_config(args.config).get('data', {})
     
     # 创建数据加载器
     transform = transforms.Compose([
@@ -76,7 +80,11 @@ def main():
     test_dataset = NYUDepthV2Dataset(
         data_path=args.data_path,
         split="test",
-        transform=transform
+        transform=transform,
+        # 与 train.py 使用相同的划分比例
+        split_ratios=(data_config.get('train_split', 0.8),
+                      data_config.get('val_split', 0.1),
+                      data_config.get('test_split', 0.1))
     )
     
     test_loader = DataLoader(
@@ -89,7 +97,7 @@ def main():
     # 初始化任务
     grounding_task = GroundingTask(device=device)
     counting_task = CountingTask(device=device)
-    vqa_task = VQATask(device=device)
+    vqa_task = VQATask(device=device, config_path=args.config)
     
     print("=" * 50)
     print("开始评估")
@@ -5,20 +5,22 @@
 import numpy as np
 from PIL import Image
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import argparse
+import importlib.util
+import os
 import sys
 import io
 
 # 设置输出编码为 UTF-8
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-try:
-    import h5py
-    USE_H5PY = True
-except ImportError:
+USE_H5PY = importlib.util.find_spec("h5py") is not None
+if USE_H5PY:
+    from src.data.mat import MatData
+else:
     try:
         import scipy.io
-        USE_H5PY = False
     except ImportError:
         raise ImportError("需要安装 h5py 或 scipy 来读取 .mat 文件")
 
@@ -27,8 +29,11 @@ def load_mat_file(mat_file_path):
     """
     加载 .mat 文件（支持 v7.3 格式）
     
+    v7.3 格式不会一次性读入内存，返回的 images/depths/labels 为惰性视图，
+    按索引读取所需的帧。
+    
     Returns:
-        dict: 包含 images, depths, labels 等数据
+        MatData 或 dict: 包含 images, depths, labels 等数据
     """
     mat_file = Path(mat_file_path)
     if not mat_file.exists():
@@ -37,40 +42,157 @@ def load_mat_file(mat_file_path):
     if USE_H5PY:
         # 使用 h5py 读取 MATLAB v7.3 格式
         print(f"使用 h5py 加载 MATLAB v7.3 文件: {mat_file}")
-        with h5py.File(str(mat_file), 'r') as f:
-            # MATLAB v7.3 格式中，数据以引用形式存储
-            images_ref = f['images']
-            # 获取实际数据
-            images = np.array(images_ref)
-            # 转置：MATLAB 存储为 (3, 480, 640, N)，需要转为 (N, 480, 640, 3)
-            if images.ndim == 4 and images.shape[0] == 3:
-                images = np.transpose(images, (3, 1, 2, 0))
-            return {'images': images}
+        return MatData(str(mat_file))
     else:
         # 使用 scipy.io 读取旧格式
         print(f"使用 scipy.io 加载 .mat 文件: {mat_file}")
         data = scipy.io.loadmat(str(mat_file))
-        images = data['images']  # Shape: (1449, 3, 480, 640)
+        images = data['images']  # Shape: (480, 640, 3, N)
         # 转换为 (N, H, W, C) 格式
-        if images.ndim == 4 and images.shape[1] == 3:
+        if images.ndim == 4 and images.shape[2] == 3:
+            images = np.transpose(images, (3, 0, 1, 2))
+        elif images.ndim == 4 and images.shape[1] == 3:
             images = np.transpose(images, (0, 2, 3, 1))
-        return {'images': images}
+        result = {'images': images}
+        for key in ('depths', 'labels'):
+            if key in data:
+                # (480, 640, N) -> (N, 480, 640)
+                result[key] = np.transpose(data[key], (2, 0, 1))
+        return result
+
+
+def to_uint8_rgb(img):
+    """
+    将单帧转换为 uint8 RGB (H, W, 3)
+    
+    整数类型直接转换；只有浮点类型才检查是否在 0-1 范围内需要放大。
+    """
+    # 处理不同的图像格式
+    if img.ndim == 3:
+        # (H, W, C) 格式；否则可能是 (C, H, W) 格式
+        if img.shape[2] != 3:
+            img = np.transpose(img, (1, 2, 0))
+    elif img.ndim == 2:
+        # 灰度图，转换为 RGB
+        img = np.stack([img, img, img], axis=2)
+    else:
+        raise ValueError(f"不支持的图像维度: {img.ndim}")
+    
+    # 归一化到 0-255（浮点且值在 0-1 范围内）
+    if np.issubdtype(img.dtype, np.floating) and img.max() <= 1.0:
+        img = img * 255
+    return img.astype(np.uint8)
+
+
+def depth_to_image(depth):
+    """将深度图（米）按帧内最大值归一化为 8 位灰度图"""
+    depth = np.asarray(depth, dtype=np.float32)
+    max_depth = float(depth.max())
+    if max_depth <= 0:
+        return np.zeros(depth.shape, dtype=np.uint8)
+    return (depth / max_depth * 255).astype(np.uint8)
+
+
+def select_indices(total, num_images=None, indices=None, index_range=None, stride=1):
+    """
+    计算要导出的帧索引
+    
+    Args:
+        total: 数据集帧数
+        num_images: 最多导出的帧数（None 表示不限）
+        indices: 显式索引列表，如 [0, 5, 10]
+        index_range: (start, stop) 区间
+        stride: 步长
+        
+    Returns:
+        去重且升序的索引列表
+    """
+    if indices:
+        selected = [i + total if i < 0 else i for i in indices]
+    else:
+        start, stop = index_range if index_range else (0, total)
+        selected = range(start, min(stop, total))
+    selected = sorted({i for i in selected if 0 <= i < total})[::max(1, stride)]
+    if num_images is not None:
+        selected = selected[:num_images]
+    return selected
+
+
+def _output_paths(output_dir, index, fmt, save_depth):
+    paths = [output_dir / f"test_image_{index:04d}.{fmt}"]
+    if save_depth:
+        paths.append(output_dir / f"test_depth_{index:04d}.png")
+    return paths
 
 
-def extract_images(mat_file_path, output_dir, num_images=5):
+def _save_frames(images, depths, indices, output_dir, fmt, quality, save_depth):
+    """编码并保存一组帧，返回已保存的文件名"""
+    save_kwargs = {'quality': quality} if fmt == "jpg" else {}
+    saved = []
+    for k, index in enumerate(indices):
+        image_path, *depth_path = _output_paths(output_dir, index, fmt, save_depth)
+        Image.fromarray(to_uint8_rgb(images[k])).save(image_path, **save_kwargs)
+        saved.append(image_path.name)
+        if depth_path:
+            Image.fromarray(depth_to_image(depths[k])).save(depth_path[0])
+            saved.append(depth_path[0].name)
+    return saved
+
+
+def _export_worker(mat_file_path, indices, output_dir, fmt, quality, save_depth):
+    """
+    进程池任务：打开自己的 HDF5 句柄，读取一组相邻帧并编码保存
+    """
+    with MatData(str(mat_file_path)) as data:
+        images = data['images'][indices]
+        depths = data['depths'][indices] if save_depth else None
+    return _save_frames(images, depths, indices, Path(output_dir), fmt,
+                        quality, save_depth)
+
+
+def _group_indices(indices, group_len):
+    """按 HDF5 分块边界将升序索引分组，每个进程读取整块"""
+    groups = []
+    for index in indices:
+        if groups and index // group_len == groups[-1][0] // group_len:
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+    return groups
+
+
+def extract_images(mat_file_path, output_dir, num_images=5, indices=None,
+                   index_range=None, stride=1, fmt="jpg", quality=95,
+                   save_depth=False, overwrite=False, workers=None):
     """
     从 NYU Depth V2 .mat 文件中提取图像
     
+    v7.3 格式使用进程池并行导出：每个进程打开自己的 HDF5 句柄，
+    读取按分块对齐的一组帧并独立编码。
+    
     Args:
         mat_file_path: .mat 文件路径
         output_dir: 输出目录
-        num_images: 提取的图像数量
+        num_images: 提取的图像数量（None 表示不限）
+        indices: 显式指定的帧索引列表
+        index_range: (start, stop) 帧区间
+        stride: 步长
+        fmt: 输出格式，"jpg" 或 "png"
+        quality: JPEG 质量
+        save_depth: 是否同时保存深度可视化图
+        overwrite: 是否覆盖已存在的文件
+        workers: 进程数，默认为 CPU 核数
     """
     print(f"正在加载数据集: {mat_file_path}")
     data = load_mat_file(mat_file_path)
     
+    if save_depth and 'depths' not in data:
+        if USE_H5PY and isinstance(data, MatData):
+            data.close()
+        raise ValueError(f"数据集中没有 depths，无法导出深度图（去掉 --depth 重试）: {mat_file_path}")
+    
     # 提取图像数据
-    images = data['images']  # Shape: (N, H, W, C) 或 (N, 3, H, W)
+    images = data['images']  # Shape: (N, H, W, C)
     print(f"数据集包含 {len(images)} 张图像")
     print(f"图像形状: {images.shape}")
     
@@ -78,47 +200,56 @@ def extract_images(mat_file_path, output_dir, num_images=5):
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # 提取图像
-    num_images = min(num_images, len(images))
-    print(f"\n正在提取 {num_images} 张测试图像...")
+    selected = select_indices(len(images), num_images, indices, index_range, stride)
+    if not overwrite:
+        pending = [i for i in selected
+                   if not all(p.exists() for p in _output_paths(output_dir, i, fmt, save_depth))]
+        if len(pending) < len(selected):
+            print(f"跳过已存在的 {len(selected) - len(pending)} 张图像")
+    else:
+        pending = selected
     
-    for i in range(num_images):
-        # 获取图像
-        img = images[i]
-        
-        # 处理不同的图像格式
-        if img.ndim == 3:
-            # (H, W, C) 格式
-            if img.shape[2] == 3:
-                # RGB 图像
-                img = img.astype(np.uint8)
-            else:
-                # 可能是 (C, H, W) 格式
-                img = np.transpose(img, (1, 2, 0))
-                img = img.astype(np.uint8)
-        elif img.ndim == 2:
-            # 灰度图，转换为 RGB
-            img = np.stack([img, img, img], axis=2).astype(np.uint8)
+    print(f"\n正在提取 {len(pending)} 张测试图像...")
+    workers = workers or os.cpu_count() or 1
+    
+    if USE_H5PY and isinstance(data, MatData):
+        group_len = max(images.chunk_len, 8)
+        data.close()
+        groups = _group_indices(pending, group_len)
+        if workers > 1 and len(groups) > 1:
+            done = 0
+            with ProcessPoolExecutor(max_workers=min(workers, len(groups))) as pool:
+                futures = [pool.submit(_export_worker, mat_file_path, group, str(output_dir),
+                                       fmt, quality, save_depth) for group in groups]
+                for future in as_completed(futures):
+                    done += len(future.result())
+                    print(f"\r  已保存 {done} 个文件", end='', flush=True)
+            print()
         else:
-            raise ValueError(f"不支持的图像维度: {img.ndim}")
-        
-        # 归一化到 0-255（如果值在 0-1 范围内）
-        if img.max() <= 1.0:
-            img = (img * 255).astype(np.uint8)
-        
-        pil_img = Image.fromarray(img)
-        
-        # 保存图像
-        output_path = output_dir / f"test_image_{i:04d}.jpg"
-        pil_img.save(output_path)
-        print(f"  [{i+1}/{num_images}] 已保存: {output_path.name}")
+            for group in groups:
+                saved = _export_worker(mat_file_path, group, str(output_dir),
+                                       fmt, quality, save_depth)
+                for name in saved:
+                    print(f"  已保存: {name}")
+    else:
+        # scipy 读取的数据已在内存中，直接在本进程中导出
+        depths = data.get('depths') if save_depth else None
+        for i in pending:
+            for name in _save_frames(images[[i]], None if depths is None else depths[[i]],
+                                     [i], output_dir, fmt, quality, save_depth):
+                print(f"  已保存: {name}")
     
     print(f"\n[OK] 测试图像已保存到: {output_dir}")
-    print(f"   共 {num_images} 张图像")
+    print(f"   共 {len(selected)} 张图像")
     
     return output_dir
 
 
+def _parse_range(value):
+    start, _, stop = value.partition(":")
+    return int(start or 0), int(stop) if stop else sys.maxsize
+
+
 def main():
     parser = argparse.ArgumentParser(description="从 NYU Depth V2 数据集提取测试图像")
     parser.add_argument("--mat_file", type=str, 
@@ -127,13 +258,38 @@ def main():
     parser.add_argument("--output_dir", type=str,
                        default="./data/nyu_depth_v2/test_images",
                        help="输出目录")
-    parser.add_argument("--num_images", type=int, default=5,
-                       help="提取的图像数量")
+    parser.add_argument("--num_images", type=int, default=None,
+                       help="提取的图像数量（未指定索引时默认 5）")
+    parser.add_argument("--indices", type=str, default=None,
+                       help="逗号分隔的帧索引，如 0,5,10")
+    parser.add_argument("--range", type=str, default=None, dest="index_range",
+                       help="帧区间 start:stop，如 0:100")
+    parser.add_argument("--stride", type=int, default=1,
+                       help="帧步长")
+    parser.add_argument("--format", type=str, default="jpg", choices=["jpg", "png"],
+                       dest="fmt", help="输出格式")
+    parser.add_argument("--quality", type=int, default=95,
+                       help="JPEG 质量 (1-100)")
+    parser.add_argument("--depth", action="store_true",
+                       help="同时导出深度可视化图")
+    parser.add_argument("--overwrite", action="store_true",
+                       help="覆盖已存在的文件")
+    parser.add_argument("--workers", type=int, default=None,
+                       help="并行进程数（默认 CPU 核数）")
     
     args = parser.parse_args()
     
+    indices = [int(i) for i in args.indices.split(",")] if args.indices else None
+    index_range = _parse_range(args.index_range) if args.index_range else None
+    num_images = args.num_images
+    if num_images is None and indices is None and index_range is None:
+        num_images = 5
+    
     try:
-        extract_images(args.mat_file, args.output_dir, args.num_images)
+        extract_images(args.mat_file, args.output_dir, num_images,
+                       indices=indices, index_range=index_range, stride=args.stride,
+                       fmt=args.fmt, quality=args.quality, save_depth=args.depth,
+                       overwrite=args.overwrite, workers=args.workers)
     except FileNotFoundError as e:
         print(f"[ERROR] 错误: {e}")
         print("\n请先下载数据集:")
@@ -1,31 +1,158 @@
 """
 推理脚本：对单张图像进行 grounding、counting 或 VQA
+
+默认作为推理服务的客户端运行；服务未启动时在本进程中加载模型。
+启动常驻服务: python inference.py --serve [--port 8765 | --socket /tmp/robot.sock]
+批处理模式:   python inference.py --manifest requests.jsonl --output_jsonl results.jsonl
+              python inference.py --image_dir images/ --task vqa --text "..." --output_jsonl results.jsonl
 """
 import argparse
-from PIL import Image
-from src.tasks.grounding import GroundingTask
-from src.tasks.counting import CountingTask
-from src.tasks.vqa import VQATask
-from src.utils.visualization import visualize_results
+import os
+# 只导入标准库客户端；PIL、torch 等在需要本地推理或读取图像时再导入
+from src.serving.client import (InferenceClient, ServerUnavailableError,
+                                DEFAULT_SERVER_URL)
 
 
-def main():
+def build_parser():
     parser = argparse.ArgumentParser(description="家居机器人推理脚本")
-    parser.add_argument("--image", type=str, required=True,
+    parser.add_argument("--image", type=str,
                        help="输入图像路径")
-    parser.add_argument("--task", type=str, required=True,
+    parser.add_argument("--task", type=str,
                        choices=["grounding", "counting", "vqa"],
                        help="任务类型")
     parser.add_argument("--text", type=str, default="",
                        help="文本提示（grounding/counting）或问题（vqa）")
+    parser.add_argument("--decoding", type=str, default=None,
+                       help="VQA 解码配置：greedy-short / greedy / beam3 / beam<N> / sampling（默认读取配置文件）")
     parser.add_argument("--output", type=str, default="output.jpg",
                        help="输出图像路径")
-    parser.add_argument("--device", type=str, default="cuda",
-                       help="设备类型")
+    parser.add_argument("--device", type=str, default=None,
+                       help="设备类型（默认读取配置文件）")
+    parser.add_argument("--config", type=str, default="config.yaml",
+                       help="配置文件路径")
+    parser.add_argument("--profile", action="store_true",
+                       help="开启分阶段计时（本进程推理时打印汇总，服务模式提供 /metrics）")
+    parser.add_argument("--trace_output", type=str, default=None,
+                       help="本进程推理结束后保存 Chrome trace JSON 的路径（需 --profile）")
+    
+    # 服务模式
+    server_group = parser.add_argument_group("服务模式")
+    server_group.add_argument("--serve", action="store_true",
+                              help="启动常驻推理服务（模型只加载一次）")
+    server_group.add_argument("--host", type=str, default="127.0.0.1",
+                              help="服务监听地址")
+    server_group.add_argument("--port", type=int, default=8765,
+                              help="服务监听端口")
+    server_group.add_argument("--socket", type=str, default=None,
+                              help="Unix socket 路径（服务端监听或客户端连接）")
+    server_group.add_argument("--server", type=str, default=DEFAULT_SERVER_URL,
+                              help="客户端连接的服务地址")
+    server_group.add_argument("--local", action="store_true",
+                              help="不连接服务，直接在本进程中加载模型")
+    server_group.add_argument("--no_batching", action="store_true",
+                              help="服务端禁用动态批处理")
+    
+    # 批处理模式
+    batch_group = parser.add_argument_group("批处理模式")
+    batch_group.add_argument("--manifest", type=str, default=None,
+                             help="JSONL 请求清单，每行 {id, task, image, text}")
+    batch_group.add_argument("--image_dir", type=str, default=None,
+                             help="图像目录，对每张图像执行 --task/--text")
+    batch_group.add_argument("--output_jsonl", type=str, default="results.jsonl",
+                             help="结果输出文件（JSONL，逐批追加）")
+    batch_group.add_argument("--batch_size", type=int, default=8,
+                             help="每次批量推理的请求数")
+    batch_group.add_argument("--num_workers", type=int, default=4,
+                             help="图像预取线程数")
+    batch_group.add_argument("--no_resume", action="store_true",
+                             help="覆盖已有输出，不跳过已完成的请求")
+    return parser
+
+
+def report_profile(args):
+    """打印本进程的分阶段计时汇总，并按需保存 Chrome trace"""
+    from src.utils.profiling import get_profiler
+    profiler = get_profiler()
+    stages = profiler.stats()['stages']
+    if not args.profile or not stages:
+        return
+    print("分阶段计时:")
+    for name, stats in stages.items():
+        print(f"  {name:28s} 调用 {stats['calls']:4d} 次  "
+              f"平均 {stats['wall_ms_mean']:9.2f} ms  CPU {stats['cpu_ms_total']:9.2f} ms  "
+              f"张量 {stats['bytes_total'] / 1024**2:8.2f} MB")
+    if args.trace_output:
+        profiler.save_chrome_trace(args.trace_output)
+        print(f"Chrome trace 已保存到: {args.trace_output}")
+
+
+def run_batch_mode(args, parser):
+    """批处理模式：在本进程中加载模型，逐批写出结果"""
+    from src.serving.batch import run_batch, read_manifest, scan_directory
+    from src.serving.service import InferenceService
+    
+    if args.manifest:
+        requests = read_manifest(args.manifest)
+    else:
+        if not args.task or not args.text:
+            parser.error("--image_dir 需要同时指定 --task 和 --text")
+        requests = scan_directory(args.image_dir, args.task, args.text)
+    
+    service = InferenceService.from_config(args.config, device=args.device)
+    stats = run_batch(
+        service, requests, args.output_jsonl,
+        batch_size=args.batch_size,
+        num_workers=args.num_workers,
+        resume=not args.no_resume
+    )
+    service.close()
+    report_profile(args)
+    
+    print(f"批处理完成: 共 {stats['total']} 条，跳过 {stats['skipped']} 条，"
+          f"成功 {stats['completed']} 条，失败 {stats['failed']} 条")
+    print(f"结果已保存到: {args.output_jsonl}")
+
+
+def run_request(args, request):
+    """优先发送到推理服务，服务不可用时在本进程中执行"""
+    if not args.local:
+        client = InferenceClient(url=args.server, socket_path=args.socket)
+        try:
+            return client.infer(request)
+        except ServerUnavailableError:
+            print("未检测到推理服务，在本进程中加载模型")
     
+    from src.serving.service import InferenceService
+    service = InferenceService.from_config(args.config, device=args.device)
+    response = service.handle(request)
+    report_profile(args)
+    return response
+
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
+    if args.profile:
+        from src.utils.profiling import get_profiler
+        get_profiler().enable()
+    
+    if args.serve:
+        from src.serving.service import InferenceService
+        from src.serving.server import serve
+        service = InferenceService.from_config(args.config, device=args.device)
+        serve(service, host=args.host, port=args.port, socket_path=args.socket,
+              batching=False if args.no_batching else None)
+        return
+    
+    if args.manifest or args.image_dir:
+        run_batch_mode(args, parser)
+        return
+    
+    if not args.image or not args.task:
+        parser.error("需要 --image 和 --task 参数（或使用 --serve 启动服务）")
     
     # 加载图像
+    from PIL import Image
     try:
         image = Image.open(args.image).convert('RGB')
         print(f"已加载图像: {args.image}")
@@ -33,15 +160,25 @@ def main():
         print(f"加载图像失败: {e}")
         return
     
+    if not args.text:
+        if args.task == "vqa":
+            print("错误: vqa 任务需要 --text 参数（问题）")
+        else:
+            print(f"错误: {args.task} 任务需要 --text 参数")
+        return
+    
+    request = {
+        'task': args.task,
+        'image': os.path.abspath(args.image),
+        'text': args.text,
+    }
+    if args.decoding:
+        request['decoding'] = args.decoding
+    
     # 执行任务
     if args.task == "grounding":
-        if not args.text:
-            print("错误: grounding 任务需要 --text 参数")
-            return
-        
         print(f"执行 Grounding 任务: {args.text}")
-        task = GroundingTask(device=args.device)
-        results = task.ground(args.text, image)
+        results = run_request(args, request)['results']
         
         print(f"检测到 {len(results)} 个物体:")
         for i, result in enumerate(results):
@@ -49,34 +186,23 @@ def main():
                   f"bbox={result['bbox']}")
         
         # 可视化结果
+        from src.utils.visualization import visualize_results
         visualize_results(image, results, args.output)
         print(f"结果已保存到: {args.output}")
     
     elif args.task == "counting":
-        if not args.text:
-            print("错误: counting 任务需要 --text 参数")
-            return
-        
         print(f"执行 Counting 任务: {args.text}")
-        task = CountingTask(device=args.device)
-        count = task.count(args.text, image)
+        count = run_request(args, request)['count']
         
         print(f"检测到 {count} 个 '{args.text}'")
     
     elif args.task == "vqa":
-        if not args.text:
-            print("错误: vqa 任务需要 --text 参数（问题）")
-            return
-        
         print(f"执行 VQA 任务")
         print(f"问题: {args.text}")
-        task = VQATask(device=args.device)
-        answer = task.answer(args.text, image)
+        answer = run_request(args, request)['answer']
         
         print(f"答案: {answer}")
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -3,6 +3,7 @@
 """
 import sys
 import io
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 # 设置输出编码为 UTF-8
@@ -117,6 +118,213 @@ def test_inference():
         return False
 
 
+class _RangeRequestHandler(BaseHTTPRequestHandler):
+    """支持 Range 请求的本地 HTTP 服务，替代真实数据集服务器"""
+    
+    payload = b""
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        data = self.payload
+        range_header = self.headers.get('Range')
+        if range_header:
+            start, _, end = range_header.split('=')[1].partition('-')
+            start, end = int(start), int(end) if end else len(data) - 1
+            end = min(end, len(data) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+            body = data[start:end + 1]
+        else:
+            self.send_response(200)
+            body = data
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_download():
+    """测试分段下载（使用本地 HTTP 服务）"""
+    print("\n" + "=" * 60)
+    print("测试5: 分段下载与 SHA-256 校验")
+    print("=" * 60)
+    
+    try:
+        import hashlib
+        import os
+        import tempfile
+        import threading
+        from download_data import download_file_parallel
+        
+        payload = os.urandom(3 * 1024 * 1024 + 12345)
+        expected_sha256 = hashlib.sha256(payload).hexdigest()
+        
+        handler = type("Handler", (_RangeRequestHandler,), {'payload': payload})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/nyu.mat"
+        
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                dest = Path(tmp_dir) / "nyu.mat"
+                ok = download_file_parallel(url, dest, num_segments=4,
+                                            expected_sha256=expected_sha256,
+                                            buffer_size=64 * 1024)
+                ok = ok and dest.read_bytes() == payload
+        finally:
+            server.shutdown()
+            server.server_close()
+        
+        print("[OK] 分段下载正常" if ok else "[ERROR] 分段下载结果不正确")
+        return ok
+    except Exception as e:
+        print(f"[ERROR] 测试失败: {e}")
+        return False
+
+
+def test_benchmark():
+    """测试基准测试脚本（替身模型，不计模拟代价）"""
+    print("\n" + "=" * 60)
+    print("测试6: 基准测试（替身模型）")
+    print("=" * 60)
+    
+    try:
+        import json
+        import subprocess
+        import tempfile
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = Path(tmp_dir) / "bench.json"
+            result = subprocess.run(
+                [sys.executable, "benchmarks/run_benchmarks.py",
+                 "--iterations", "2", "--warmup", "1", "--batch_sizes", "1", "2",
+                 "--resolutions", "160x120", "--detect_base_ms", "0",
+                 "--detect_item_ms", "0", "--detect_mpixel_ms", "0",
+                 "--vqa_base_ms", "0", "--vqa_item_ms", "0", "--vqa_mpixel_ms", "0",
+                 "--output", str(output)],
+                capture_output=True,
+                text=True,
+                encoding='utf-8'
+            )
+            if result.returncode != 0:
+                print(result.stdout[-2000:])
+                print(result.stderr[-2000:])
+                print("[ERROR] 基准测试脚本运行失败")
+                return False
+            report = json.loads(output.read_text(encoding='utf-8'))
+        
+        # 3 个任务 × 2 个场景 × 2 个批大小
+        ok = len(report['results']) == 12 and all(
+            r['latency_ms']['p99'] >= r['latency_ms']['p50'] for r in report['results']
+        )
+        print("[OK] 基准测试结果完整" if ok else "[ERROR] 基准测试结果不完整")
+        return ok
+    except Exception as e:
+        print(f"[ERROR] 测试失败: {e}")
+        return False
+
+
+# 启动时间预算：(说明, 导入/执行的代码, 耗时上限毫秒)
+STARTUP_BUDGETS = [
+    ("src 各子包", "import src.models, src.tasks, src.serving, src.data", 100),
+    ("inference.py 客户端", "import inference; inference.build_parser().parse_args([])", 100),
+    ("读取配置", "from src.utils.config import load_config; load_config('config.yaml')", 200),
+]
+# 以上代码都不应导入的重量级依赖
+HEAVY_MODULES = ("torch", "transformers", "PIL", "numpy")
+
+
+def test_startup():
+    """测试启动时间：参数解析、配置读取和客户端不导入重量级依赖"""
+    print("\n" + "=" * 60)
+    print("测试7: 启动时间")
+    print("=" * 60)
+    
+    try:
+        import json
+        import subprocess
+        
+        ok = True
+        for name, code, budget_ms in STARTUP_BUDGETS:
+            # 新解释器中计时，排除已导入模块的影响
+            probe = (
+                "import json, sys, time\n"
+                "start = time.perf_counter()\n"
+                f"{code}\n"
+                "elapsed = (time.perf_counter() - start) * 1000\n"
+                f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+                "print(json.dumps({'ms': elapsed, 'heavy': heavy}))\n"
+            )
+            result = subprocess.run(
+                [sys.executable, "-c", probe],
+                capture_output=True,
+                text=True,
+                encoding='utf-8'
+            )
+            if result.returncode != 0:
+                print(result.stderr[-2000:])
+                print(f"[ERROR] {name}: 执行失败")
+                ok = False
+                continue
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            passed = stats['ms'] <= budget_ms and not stats['heavy']
+            status = "[OK]" if passed else "[ERROR]"
+            detail = f"，导入了 {', '.join(stats['heavy'])}" if stats['heavy'] else ""
+            print(f"{status} {name}: {stats['ms']:.1f} ms（预算 {budget_ms} ms）{detail}")
+            ok = ok and passed
+        return ok
+    except Exception as e:
+        print(f"[ERROR] 测试失败: {e}")
+        return False
+
+
+def test_decoding():
+    """测试解码参数：max_length 换算与 greedy-short 的答案截断"""
+    print("\n" + "=" * 60)
+    print("测试8: 解码参数")
+    print("=" * 60)
+    
+    try:
+        from types import SimpleNamespace
+        from src.models.decoding import (max_new_tokens_for, resolve_decoding,
+                                         should_stop, trim_answer)
+        
+        # 提示 6 个 token，旧默认 max_length=50 留出 44 个新 token；预算不足时至少生成 1 个
+        ok = max_new_tokens_for(50, 6) == 44 and max_new_tokens_for(8, 12) == 1
+        
+        # greedy-short 在句末句号处截断，不截断小数
+        short = resolve_decoding("greedy-short")
+        answers = {"3.5": "3.5", "yes.": "yes", "two. There are": "two", "\nthree\n": "three"}
+        ok = ok and all(
+            trim_answer(text, short['stop'], short['max_words']) == expected
+            for text, expected in answers.items()
+        ) and not should_stop("3.", short['stop'], short['max_words'])
+        
+        try:
+            import torch
+            from src.models.blip2 import BLIP2Model
+        except ImportError:
+            print("[SKIP] 未安装 torch / transformers，跳过 BLIP2Model 参数检查")
+        else:
+            # 新版 transformers：32 个图像占位 token + 6 个提示 token
+            fake = SimpleNamespace(
+                model=SimpleNamespace(config=SimpleNamespace(num_query_tokens=32,
+                                                             image_token_index=50265)),
+                processor=None,
+            )
+            fake._image_token_index = lambda: BLIP2Model._image_token_index(fake)
+            kwargs = BLIP2Model._generate_kwargs(fake, resolve_decoding("beam3"), 50,
+                                                 torch.zeros(2, 38, dtype=torch.long))
+            ok = ok and kwargs['max_new_tokens'] == 44 and 'max_length' not in kwargs
+        
+        print("[OK] 解码参数正常" if ok else "[ERROR] 解码参数不正确")
+        return ok
+    except Exception as e:
+        print(f"[ERROR] 测试失败: {e}")
+        return False
+
+
 def main():
     """运行所有测试"""
     print("\n" + "=" * 60)
@@ -138,6 +346,18 @@ def main():
     # 测试4: 推理功能
     results.append(("推理功能", test_inference()))
     
+    # 测试5: 分段下载
+    results.append(("分段下载", test_download()))
+    
+    # 测试6: 基准测试
+    results.append(("基准测试", test_benchmark()))
+    
+    # 测试7: 启动时间
+    results.append(("启动时间", test_startup()))
+    
+    # 测试8: 解码参数
+    results.append(("解码参数", test_decoding()))
+    
     # 汇总结果
     print("\n" + "=" * 60)
     print("测试结果汇总")
@@ -0,0 +1,16 @@
+"""
+数据模块
+
+数据集依赖 torch，按需导入，使 .mat 读取工具不必加载 torch
+"""
+from ..utils.lazy import lazy_exports
+
+# 公开名称 -> 所在子模块
+_LAZY_ATTRS = {
+    'NYUDepthV2Dataset': 'dataset',
+    'convert_mat_to_memmap': 'dataset',
+    'LazyMatArray': 'mat',
+    'MatData': 'mat',
+}
+
+__getattr__, __dir__, __all__ = lazy_exports(__name__, _LAZY_ATTRS)
@@ -0,0 +1,209 @@
+"""
+NYU Depth V2 数据集
+首次使用时将 labeled .mat 转换为内存映射数组：
+    images.npy  uint8   (N, H, W, 3)
+    depths.npy  float16 (N, H, W)
+    labels.npy  uint16  (N, H, W)
+    splits.json 各划分的样本索引
+DataLoader 的多个 worker 通过 mmap 共享页缓存，不各自持有副本。
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Sequence
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import Dataset
+
+from .mat import MatData
+
+
+MAT_FILENAME = "nyu_depth_v2_labeled.mat"
+MEMMAP_DIRNAME = "memmap"
+SPLITS = ("train", "val", "test")
+
+
+def convert_mat_to_memmap(mat_path: str, output_dir: str,
+                          split_ratios: Sequence[float] = (0.8, 0.1, 0.1),
+                          seed: int = 42, chunk_size: int = 64) -> Path:
+    """
+    将 labeled .mat 一次性转换为内存映射数组和划分索引
+
+    Args:
+        mat_path: nyu_depth_v2_labeled.mat 路径
+        output_dir: 输出目录
+        split_ratios: train/val/test 比例
+        seed: 划分随机种子
+        chunk_size: 每次从 HDF5 读取的帧数
+
+    Returns:
+        输出目录
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"正在转换数据集: {mat_path} -> {output_dir}")
+    with MatData(str(mat_path)) as data:
+        sources = {
+            'images': (data['images'], np.uint8),
+            'depths': (data['depths'], np.float16),
+            'labels': (data['labels'], np.uint16),
+        }
+        num_samples = len(data['images'])
+
+        for key, (source, dtype) in sources.items():
+            # 先写临时文件，完成后再重命名，避免中断留下不完整的数组
+            tmp_path = output_dir / f"{key}.tmp.npy"
+            array = np.lib.format.open_memmap(
+                tmp_path, mode='w+', dtype=dtype, shape=source.shape
+            )
+            for start in range(0, num_samples, chunk_size):
+                stop = min(start + chunk_size, num_samples)
+                array[start:stop] = source[start:stop]
+            array.flush()
+            del array
+            os.replace(tmp_path, output_dir / f"{key}.npy")
+            print(f"  {key}: {source.shape} {np.dtype(dtype).name}")
+
+    splits = write_splits(output_dir, num_samples, split_ratios, seed)
+    print(f"转换完成: train={len(splits['train'])}, val={len(splits['val'])}, "
+          f"test={len(splits['test'])}")
+    return output_dir
+
+
+def write_splits(output_dir: str, num_samples: int,
+                 split_ratios: Sequence[float] = (0.8, 0.1, 0.1),
+                 seed: int = 42) -> Dict:
+    """
+    随机划分样本索引并写入 splits.json（同一种子和比例得到相同划分）
+
+    Args:
+        output_dir: 输出目录
+        num_samples: 样本总数
+        split_ratios: train/val/test 比例
+        seed: 划分随机种子
+
+    Returns:
+        划分字典，包含各划分索引及 num_samples, seed, split_ratios
+    """
+    rng = np.random.RandomState(seed)
+    order = rng.permutation(num_samples)
+    bounds = np.cumsum([int(round(r * num_samples)) for r in split_ratios[:-1]])
+    splits = {
+        name: sorted(int(i) for i in part)
+        for name, part in zip(SPLITS, np.split(order, bounds))
+    }
+    splits['num_samples'] = num_samples
+    splits['seed'] = seed
+    splits['split_ratios'] = [float(r) for r in split_ratios]
+    tmp_path = Path(output_dir) / "splits.tmp.json"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(splits, f)
+    os.replace(tmp_path, Path(output_dir) / "splits.json")
+    return splits
+
+
+class NYUDepthV2Dataset(Dataset):
+    """NYU Depth V2 数据集类（内存映射，O(1) 随机访问）"""
+
+    def __init__(self, data_path: str = "./data/nyu_depth_v2", split: str = "train",
+                 transform=None, image_size: Sequence[int] = None,
+                 split_ratios: Sequence[float] = (0.8, 0.1, 0.1)):
+        """
+        初始化数据集
+
+        Args:
+            data_path: 数据集目录（包含 nyu_depth_v2_labeled.mat）
+            split: "train" / "val" / "test"
+            transform: 作用于 PIL RGB 图像的变换（如 torchvision.transforms）
+            image_size: [H, W]，未提供 transform 时用于缩放图像；
+                        深度和标签图始终按此尺寸缩放
+            split_ratios: train/val/test 比例，必须与已有 splits.json 记录的一致
+                          （训练和评估共用同一划分）
+
+        Raises:
+            ValueError: split_ratios 与 splits.json 不一致
+        """
+        if split not in SPLITS:
+            raise ValueError(f"未知划分: {split}，可选: {', '.join(SPLITS)}")
+
+        self.data_path = Path(data_path)
+        self.split = split
+        self.transform = transform
+        self.image_size = tuple(image_size) if image_size else None
+        self.memmap_dir = self.data_path / MEMMAP_DIRNAME
+
+        if not (self.memmap_dir / "splits.json").exists():
+            mat_path = self.data_path / MAT_FILENAME
+            if not mat_path.exists():
+                raise FileNotFoundError(f"数据集文件不存在: {mat_path}\n"
+                                        f"请先运行: python download_data.py")
+            convert_mat_to_memmap(mat_path, self.memmap_dir, split_ratios)
+
+        with open(self.memmap_dir / "splits.json", 'r', encoding='utf-8') as f:
+            splits = json.load(f)
+        ratios = [float(r) for r in split_ratios]
+        # 不覆盖已有划分：训练和评估的比例不同会让测试集混入训练样本
+        if 'split_ratios' in splits and splits['split_ratios'] != ratios:
+            raise ValueError(f"{self.memmap_dir / 'splits.json'} 的划分比例 "
+                             f"{splits['split_ratios']} 与当前 {ratios} 不一致；"
+                             f"请使用相同的 split_ratios，或删除该文件后重新划分")
+        self.indices = np.asarray(splits[split], dtype=np.int64)
+
+        # 内存映射在首次访问时打开，每个 worker 进程各自映射同一文件
+        self._arrays: Dict[str, np.ndarray] = None
+
+    def _open(self) -> Dict[str, np.ndarray]:
+        if self._arrays is None:
+            self._arrays = {
+                key: np.load(self.memmap_dir / f"{key}.npy", mmap_mode='r')
+                for key in ('images', 'depths', 'labels')
+            }
+        return self._arrays
+
+    def __getstate__(self):
+        # 不将已打开的内存映射序列化到 worker 进程
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _resize(self, tensor: torch.Tensor, mode: str) -> torch.Tensor:
+        if self.image_size is None or tuple(tensor.shape[-2:]) == self.image_size:
+            return tensor
+        kwargs = {'align_corners': False} if mode == "bilinear" else {}
+        return F.interpolate(tensor[None], size=self.image_size, mode=mode, **kwargs)[0]
+
+    def __getitem__(self, idx: int) -> Dict:
+        """
+        Returns:
+            字典: image (3, H, W), depth (1, H, W) float32 米,
+                  label (H, W) int64, index 原始样本编号
+        """
+        arrays = self._open()
+        i = int(self.indices[idx])
+
+        rgb = arrays['images'][i]
+        if self.transform is not None:
+            image = self.transform(Image.fromarray(np.asarray(rgb)))
+        else:
+            image = torch.from_numpy(np.array(rgb)).permute(2, 0, 1).float() / 255.0
+            image = self._resize(image, "bilinear")
+
+        depth = torch.from_numpy(arrays['depths'][i].astype(np.float32))[None]
+        depth = self._resize(depth, "bilinear")
+
+        label = torch.from_numpy(arrays['labels'][i].astype(np.int64))
+        label = self._resize(label[None].float(), "nearest")[0].long()
+
+        return {
+            'image': image,
+            'depth': depth,
+            'label': label,
+            'index': i,
+        }
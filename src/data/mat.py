@@ -0,0 +1,157 @@
+"""
+NYU Depth V2 .mat 文件读取
+MATLAB v7.3 格式（HDF5）按帧惰性读取
+"""
+import h5py
+import numpy as np
+
+
+class LazyMatArray:
+    """
+    MATLAB v7.3 (HDF5) 数据集的惰性视图
+
+    只在索引时读取所需的帧，并逐帧转置为 (H, W[, C]) 布局。
+    h5py 读出的 MATLAB 数组维度顺序与 MATLAB 相反：
+    MATLAB 中 (480, 640, 3, N) 的 images 在 h5py 中为 (N, 3, 640, 480)。
+    """
+
+    def __init__(self, dataset, frame_axis: int = 0):
+        """
+        Args:
+            dataset: h5py.Dataset
+            frame_axis: 帧所在的维度（0 或最后一维）
+        """
+        self.dataset = dataset
+        self.frame_axis = frame_axis % dataset.ndim
+        frame_shape = [n for axis, n in enumerate(dataset.shape) if axis != self.frame_axis]
+        if self.frame_axis == 0:
+            # (N, C, W, H) -> 每帧 (H, W, C)
+            frame_shape = frame_shape[::-1]
+        elif len(frame_shape) == 3:
+            # (C, H, W, N) -> 每帧 (H, W, C)
+            frame_shape = frame_shape[1:] + frame_shape[:1]
+        self.frame_shape = tuple(frame_shape)
+        # 帧维度上的 HDF5 分块长度，用于合并相邻读取
+        chunks = dataset.chunks
+        self.chunk_len = chunks[self.frame_axis] if chunks else 1
+
+    @property
+    def shape(self):
+        return (len(self),) + self.frame_shape
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    def __len__(self):
+        return self.dataset.shape[self.frame_axis]
+
+    def _read(self, start: int, stop: int, step: int = 1) -> np.ndarray:
+        """读取 [start, stop) 区间的帧，返回 (n, H, W[, C])"""
+        index = [slice(None)] * self.dataset.ndim
+        index[self.frame_axis] = slice(start, stop, step)
+        block = self.dataset[tuple(index)]
+        if self.frame_axis == 0:
+            axes = (0,) + tuple(range(block.ndim - 1, 0, -1))
+        elif block.ndim == 4:
+            axes = (3, 1, 2, 0)
+        else:
+            axes = (block.ndim - 1,) + tuple(range(block.ndim - 1))
+        return np.ascontiguousarray(np.transpose(block, axes))
+
+    def _runs(self, indices: np.ndarray):
+        """将升序索引合并为读取区间；间隔小于一个分块时合并读取"""
+        runs = []
+        start = prev = int(indices[0])
+        for i in indices[1:]:
+            i = int(i)
+            if i - prev > self.chunk_len:
+                runs.append((start, prev + 1))
+                start = i
+            prev = i
+        runs.append((start, prev + 1))
+        return runs
+
+    def read_indices(self, indices) -> np.ndarray:
+        """
+        按任意顺序的索引列表读取帧
+
+        Returns:
+            (len(indices), H, W[, C])，顺序与 indices 一致
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.size == 0:
+            return np.empty((0,) + self.frame_shape, dtype=self.dtype)
+        indices = np.where(indices < 0, indices + len(self), indices)
+        if indices.min() < 0 or indices.max() >= len(self):
+            raise IndexError(f"索引超出范围 [0, {len(self)})")
+
+        unique = np.unique(indices)
+        out = np.empty((len(unique),) + self.frame_shape, dtype=self.dtype)
+        for start, stop in self._runs(unique):
+            block = self._read(start, stop)
+            lo, hi = np.searchsorted(unique, [start, stop])
+            out[lo:hi] = block[unique[lo:hi] - start]
+        return out[np.searchsorted(unique, indices)]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            index = int(index)
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError(f"索引超出范围: {index}")
+            return self._read(index, index + 1)[0]
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step > 0:
+                return self._read(start, stop, step)
+            return self.read_indices(range(start, stop, step))
+        return self.read_indices(index)
+
+    def __iter__(self):
+        for start in range(0, len(self), self.chunk_len):
+            yield from self._read(start, min(start + self.chunk_len, len(self)))
+
+
+class MatData:
+    """
+    已打开的 .mat 文件，images / depths / labels 以 LazyMatArray 形式访问
+
+    可作为上下文管理器使用，退出时关闭文件。
+    """
+
+    KEYS = ('images', 'depths', 'labels')
+
+    def __init__(self, path: str):
+        self.file = h5py.File(path, 'r')
+        self.arrays = {}
+        for key in self.KEYS:
+            if key not in self.file:
+                continue
+            dataset = self.file[key]
+            # 兼容帧维度在最后的存储方式 (3, 480, 640, N)
+            frame_axis = -1 if dataset.ndim == 4 and dataset.shape[0] == 3 else 0
+            self.arrays[key] = LazyMatArray(dataset, frame_axis)
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def __contains__(self, key):
+        return key in self.arrays
+
+    def keys(self):
+        return self.arrays.keys()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
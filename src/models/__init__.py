@@ -1,10 +1,18 @@
 """
 模型模块
-"""
-
-from .grounding_dino import GroundingDINOModel
-from .blip2 import BLIP2Model
 
-__all__ = ['GroundingDINOModel', 'BLIP2Model']
+类按需导入：只用到 ModelRegistry 时不会加载 torch / transformers
+"""
+from ..utils.lazy import lazy_exports
 
+# 公开名称 -> 所在子模块
+_LAZY_ATTRS = {
+    'GroundingDINOModel': 'grounding_dino',
+    'BLIP2Model': 'blip2',
+    'DECODING_PROFILES': 'decoding',
+    'resolve_decoding': 'decoding',
+    'ModelRegistry': 'registry',
+    'get_registry': 'registry',
+}
 
+__getattr__, __dir__, __all__ = lazy_exports(__name__, _LAZY_ATTRS)
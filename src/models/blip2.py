@@ -2,33 +2,199 @@
 BLIP-2 模型封装
 用于视觉问答和图像理解
 """
+import contextlib
+import os
+import re
 import torch
 from PIL import Image
-from typing import Optional, List
+from typing import Dict, Optional, List, Union
 import warnings
+from ..utils.cache import LRUCache, image_hash
+from ..utils.profiling import get_profiler
+from .decoding import (EARLY_STOP_KEYS, max_new_tokens_for, resolve_decoding,
+                       should_stop, trim_answer)
 warnings.filterwarnings('ignore')
 
 
+# fp16: CUDA 半精度（CPU 上回退 fp32）
+# bf16: CUDA 上加载 bf16 权重；CPU 上保留 fp32 权重，在支持 bf16 的 CPU 上 autocast 计算
+# int8 / int8-qformer: CPU 动态量化 OPT（及 Q-Former）的线性层
+PRECISIONS = ("fp16", "fp32", "bf16", "int8", "int8-qformer")
+
+
+def cpu_supports_bf16() -> bool:
+    """CPU 是否有原生 bf16 指令（AVX512-BF16 / AMX），否则 bf16 autocast 反而更慢"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def quantize_linear_int8(module: torch.nn.Module) -> torch.nn.Module:
+    """
+    将模块中的 nn.Linear 原地替换为 int8 动态量化版本（权重 int8，激活运行时量化）
+
+    Args:
+        module: 待量化的模块
+
+    Returns:
+        量化后的模块
+    """
+    from torch.ao.quantization import quantize_dynamic
+    # inplace 避免复制一份 fp32 权重
+    return quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _transformers_version() -> tuple:
+    """transformers 主次版本号，如 (4, 39)"""
+    import transformers
+    return tuple(int(part) for part in re.findall(r"\d+", transformers.__version__)[:2])
+
+
+def answer_stopping_criteria(tokenizer, stop: Optional[List[str]] = None,
+                             max_words: Optional[int] = None):
+    """
+    停止序列 / 答案词数的提前停止条件
+
+    每个序列（束搜索时为每个束）单独判断。transformers >= 4.39 接受逐序列的结果：
+    贪心 / 采样时已停止的序列之后只填充 pad，束搜索则要等所有束都满足条件才结束；
+    更早的版本只接受单个布尔值，整批全部满足时才提前返回。
+    两种情况下停止序列之后仍可能有多余的 token，答案的截断由 trim_answer 完成。
+
+    Args:
+        tokenizer: 用于解码已生成 token 的分词器
+        stop: 停止序列
+        max_words: 答案词数上限
+
+    Returns:
+        StoppingCriteriaList
+    """
+    from transformers import StoppingCriteria, StoppingCriteriaList
+    per_sequence = _transformers_version() >= (4, 39)
+
+    class AnswerStoppingCriteria(StoppingCriteria):
+        def __init__(self):
+            self.start = None
+
+        def __call__(self, input_ids, scores, **kwargs):
+            # 第一次调用时只多出一个新 token，之前的部分是提示
+            if self.start is None:
+                self.start = input_ids.shape[1] - 1
+            texts = tokenizer.batch_decode(input_ids[:, self.start:], skip_special_tokens=True)
+            done = [should_stop(text, stop, max_words) for text in texts]
+            if not per_sequence:
+                # 旧版 StoppingCriteriaList 对结果调用 bool()，多元素张量会报错
+                return all(done)
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([AnswerStoppingCriteria()])
+
+
 class BLIP2Model:
     """BLIP-2 模型封装类"""
     
+    # ModelRegistry 传入模型路径时使用的构造参数名
+    registry_path_arg = "model_name"
+    
     def __init__(self, model_name: str = "Salesforce/blip2-opt-2.7b", 
-                 device: str = "cuda", precision: str = "fp16"):
+                 device: str = "cuda", precision: str = "fp16",
+                 embedding_cache_mb: int = 256,
+                 quantized_cache_dir: str = None):
         """
         初始化 BLIP-2 模型
         
         Args:
             model_name: HuggingFace 模型名称
             device: 设备类型
-            precision: 精度类型 ("fp16" 或 "fp32")
+            precision: 精度类型，见 PRECISIONS
+            embedding_cache_mb: 图像嵌入缓存容量（MB），为 0 时禁用
+            quantized_cache_dir: int8 量化模型的缓存目录，首次量化后保存，
+                                 之后直接加载（不再读取 fp32 权重）；None 表示不缓存
         """
+        if precision not in PRECISIONS:
+            raise ValueError(f"未知精度类型: {precision}，可选: {', '.join(PRECISIONS)}")
         self.device = device if torch.cuda.is_available() else "cpu"
         self.model_name = model_name
         self.precision = precision
+        self.quantized_cache_dir = quantized_cache_dir
+        # 实际生效的精度（CUDA / CPU 不支持时回退）
+        self.effective_precision = self._resolve_precision()
+        self.autocast_dtype = (torch.bfloat16 if self.effective_precision == "bf16"
+                               and self.device == "cpu" else None)
         self.processor = None
         self.model = None
+        # 图像内容哈希 -> Q-Former 投影后的查询嵌入
+        self.embedding_cache = LRUCache(embedding_cache_mb * 1024**2)
         self._load_model()
     
+    def _resolve_precision(self) -> str:
+        """按设备能力确定实际精度"""
+        precision = self.precision
+        if self.device == "cuda":
+            if precision.startswith("int8"):
+                print("警告: int8 动态量化只支持 CPU，CUDA 上使用 fp16")
+                return "fp16"
+            return precision
+        if precision == "fp16":
+            return "fp32"
+        if precision == "bf16" and not cpu_supports_bf16():
+            print("警告: CPU 不支持 bf16 指令，使用 fp32")
+            return "fp32"
+        return precision
+    
+    def _autocast(self):
+        """CPU bf16 模式下的 autocast 上下文，其他模式为空上下文"""
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast("cpu", dtype=self.autocast_dtype)
+    
+    def _quantized_cache_path(self) -> Optional[str]:
+        """量化模型缓存文件路径（包含 torch / transformers 版本，版本变化时重新量化）"""
+        if not self.quantized_cache_dir:
+            return None
+        import transformers
+        name = re.sub(r"[^\w.-]+", "_", self.model_name.strip("/"))
+        return os.path.join(
+            self.quantized_cache_dir,
+            f"{name}-{self.effective_precision}-torch{torch.__version__}"
+            f"-transformers{transformers.__version__}.pt"
+        )
+    
+    def _load_quantized(self, model_cls):
+        """
+        加载 int8 动态量化模型
+        
+        缓存存在时直接反序列化量化后的模块；否则加载 fp32 权重、量化并保存。
+        缓存文件由本进程写入，使用 pickle 格式（weights_only=False），
+        不要将缓存目录指向不受信任的文件。
+        """
+        cache_path = self._quantized_cache_path()
+        if cache_path and os.path.exists(cache_path):
+            print(f"加载量化模型缓存: {cache_path}")
+            try:
+                # 未量化部分（视觉编码器等）的张量直接映射缓存文件
+                return torch.load(cache_path, map_location="cpu", weights_only=False, mmap=True)
+            except (RuntimeError, TypeError):
+                # torch < 2.1 不支持 mmap
+                return torch.load(cache_path, map_location="cpu", weights_only=False)
+        
+        model = model_cls.from_pretrained(
+            self.model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True
+        )
+        model.eval()
+        print("正在进行 int8 动态量化...")
+        model.language_model = quantize_linear_int8(model.language_model)
+        if self.effective_precision == "int8-qformer":
+            model.qformer = quantize_linear_int8(model.qformer)
+        
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            torch.save(model, tmp_path)
+            os.replace(tmp_path, cache_path)
+            print(f"量化模型已缓存: {cache_path}")
+        return model
+    
     def _load_model(self):
         """加载模型和处理器"""
         try:
@@ -38,19 +204,37 @@ class BLIP2Model:
             self.processor = Blip2Processor.from_pretrained(self.model_name)
             
             # 根据精度选择加载方式
-            if self.precision == "fp16" and self.device == "cuda":
+            precision = self.effective_precision
+            if precision.startswith("int8"):
+                self.model = self._load_quantized(Blip2ForConditionalGeneration)
+            elif precision in ("fp16", "bf16") and self.device == "cuda":
                 self.model = Blip2ForConditionalGeneration.from_pretrained(
                     self.model_name,
-                    torch_dtype=torch.float16,
+                    torch_dtype=torch.float16 if precision == "fp16" else torch.bfloat16,
                     device_map="auto"
                 )
+            elif self.device == "cuda":
+                # 权重从文件直接加载到 GPU，不在 CPU 上保留完整副本
+                self.model = Blip2ForConditionalGeneration.from_pretrained(
+                    self.model_name,
+                    torch_dtype=torch.float32,
+                    device_map={"": self.device}
+                )
             else:
+                # 先在 meta 上构建再从 safetensors 映射权重，不做随机初始化
                 self.model = Blip2ForConditionalGeneration.from_pretrained(
                     self.model_name,
-                    torch_dtype=torch.float32
-                ).to(self.device)
+                    torch_dtype=torch.float32,
+                    low_cpu_mem_usage=True
+                )
             
             self.model.eval()
+            # language_model 在 generate 中每个解码步调用一次
+            get_profiler().instrument_submodules(self.model, {
+                'vision_model': "generate.vision",
+                'qformer': "generate.qformer",
+                'language_model': "generate.decoder_step",
+            })
             print("模型加载完成!")
             
         except ImportError:
@@ -64,58 +248,312 @@ class BLIP2Model:
             self.processor = None
     
     def generate(self, image: Image.Image, prompt: str, 
-                 max_length: int = 50) -> str:
+                 max_length: Optional[int] = None,
+                 decoding: Union[str, Dict, None] = None) -> str:
         """
         生成回答
         
         Args:
             image: PIL Image 对象
             prompt: 问题或提示
-            max_length: 最大生成长度
+            max_length: 可选，提示与生成合计的最大长度（覆盖解码配置的 max_new_tokens）
+            decoding: 解码配置名或字典，见 decoding.DECODING_PROFILES，None 为默认的 beam3
             
         Returns:
             生成的文本
         """
+        config = resolve_decoding(decoding)
         if self.model is None or self.processor is None:
             return self._mock_generate(prompt)
         
         try:
-            inputs = self.processor(
-                images=image,
-                text=prompt,
-                return_tensors="pt"
-            ).to(self.device)
-            
-            generated_ids = self.model.generate(
-                **inputs,
-                max_length=max_length,
-                num_beams=3
-            )
-            
-            generated_text = self.processor.batch_decode(
-                generated_ids, 
-                skip_special_tokens=True
-            )[0].strip()
-            
-            return generated_text
+            return self._generate_batch([image], [prompt], max_length, config)[0]
             
         except Exception as e:
             print(f"生成失败: {e}")
             return self._mock_generate(prompt)
     
-    def answer_question(self, image: Image.Image, question: str) -> str:
+    def _encode_image(self, image: Image.Image) -> torch.Tensor:
+        """
+        运行 ViT + Q-Former + 投影层，得到语言模型的查询嵌入
+        
+        结果按图像内容哈希缓存，同一帧的多个问题只编码一次。
+        
+        Args:
+            image: PIL Image 对象
+            
+        Returns:
+            查询嵌入，形状 (1, num_query_tokens, hidden_size)
+        """
+        return self._encode_images([image])
+    
+    def _encode_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """
+        批量编码图像，相同内容的图像只编码一次
+        
+        Args:
+            images: PIL Image 列表
+            
+        Returns:
+            查询嵌入，形状 (len(images), num_query_tokens, hidden_size)
+        """
+        # 同一对象只计算一次哈希
+        keys_by_id = {}
+        keys = []
+        for image in images:
+            if id(image) not in keys_by_id:
+                keys_by_id[id(image)] = image_hash(image)
+            keys.append(keys_by_id[id(image)])
+        
+        embeds = {}
+        missing = {}
+        for key, image in zip(keys, images):
+            if key in embeds or key in missing:
+                continue
+            cached = self.embedding_cache.get(key)
+            if cached is not None:
+                embeds[key] = cached
+            else:
+                missing[key] = image
+        
+        if missing:
+            model = self.model
+            with get_profiler().stage("generate.preprocess") as stage:
+                pixel_values = self.processor.image_processor(
+                    list(missing.values()), return_tensors="pt"
+                ).pixel_values.to(self.device, model.dtype)
+                stage.add_tensor(pixel_values)
+            
+            with torch.no_grad(), self._autocast():
+                image_embeds = model.vision_model(
+                    pixel_values, return_dict=True
+                ).last_hidden_state
+                image_attention_mask = torch.ones(
+                    image_embeds.size()[:-1], dtype=torch.long,
+                    device=image_embeds.device
+                )
+                query_tokens = model.query_tokens.expand(image_embeds.shape[0], -1, -1)
+                query_output = model.qformer(
+                    query_embeds=query_tokens,
+                    encoder_hidden_states=image_embeds,
+                    encoder_attention_mask=image_attention_mask,
+                    return_dict=True
+                ).last_hidden_state
+                # Q-Former 保持 fp32，需转回视觉编码器的精度
+                if query_output.dtype != image_embeds.dtype:
+                    query_output = query_output.to(image_embeds.dtype)
+                language_model_inputs = model.language_projection(query_output)
+            
+            for i, key in enumerate(missing):
+                # 复制出独立存储：切片视图会让缓存条目持有整批的输出
+                embeds[key] = language_model_inputs[i:i + 1].clone()
+                self.embedding_cache.put(key, embeds[key])
+        
+        return torch.cat([embeds[key] for key in keys], dim=0)
+    
+    def _image_token_index(self) -> Optional[int]:
+        """新版 transformers 在文本前插入图像占位 token，旧版直接拼接嵌入"""
+        return getattr(self.model.config, "image_token_index", None)
+    
+    def _tokenize_prompts(self, prompts: List[str]):
+        """
+        对提示文本分词（不处理图像）
+        
+        Returns:
+            (input_ids, attention_mask)
+        """
+        tokenizer = self.processor.tokenizer
+        # 解码器只能在左侧填充，保证每个样本的最后一个 token 紧邻生成位置
+        tokenizer.padding_side = "left"
+        encoding = tokenizer(prompts, return_tensors="pt", padding=True)
+        input_ids = encoding.input_ids
+        attention_mask = encoding.attention_mask
+        
+        image_token_index = self._image_token_index()
+        if image_token_index is not None:
+            num_query_tokens = self.model.config.num_query_tokens
+            image_ids = torch.full(
+                (input_ids.shape[0], num_query_tokens), image_token_index,
+                dtype=input_ids.dtype
+            )
+            input_ids = torch.cat([image_ids, input_ids], dim=1)
+            attention_mask = torch.cat(
+                [torch.ones_like(image_ids), attention_mask], dim=1
+            )
+        
+        return input_ids.to(self.device), attention_mask.to(self.device)
+    
+    def _generate_from_embeds(self, language_model_inputs: torch.Tensor,
+                              input_ids: torch.Tensor,
+                              attention_mask: torch.Tensor,
+                              **generate_kwargs) -> torch.Tensor:
+        """
+        从查询嵌入开始只运行 OPT 解码器
+        
+        等价于 Blip2ForConditionalGeneration.generate 中视觉编码之后的部分。
+        """
+        model = self.model
+        inputs_embeds = model.get_input_embeddings()(input_ids)
+        language_model_inputs = language_model_inputs.to(
+            inputs_embeds.device, inputs_embeds.dtype
+        )
+        
+        image_token_index = self._image_token_index()
+        if image_token_index is not None:
+            special_image_mask = (input_ids == image_token_index).unsqueeze(-1)
+            inputs_embeds = inputs_embeds.masked_scatter(
+                special_image_mask.expand_as(inputs_embeds), language_model_inputs
+            )
+        else:
+            inputs_embeds = torch.cat([language_model_inputs, inputs_embeds], dim=1)
+            attention_mask = torch.cat([
+                torch.ones(language_model_inputs.shape[:-1], dtype=attention_mask.dtype,
+                           device=attention_mask.device),
+                attention_mask
+            ], dim=1)
+        
+        inputs = {"inputs_embeds": inputs_embeds, "attention_mask": attention_mask}
+        if image_token_index is not None and not model.language_model.config.is_encoder_decoder:
+            inputs["input_ids"] = input_ids
+        
+        with torch.no_grad(), self._autocast():
+            outputs = model.language_model.generate(**inputs, **generate_kwargs)
+        # 传入 input_ids 时输出以提示开头，只保留新生成的部分
+        if "input_ids" in inputs:
+            outputs = outputs[:, input_ids.shape[1]:]
+        return outputs
+    
+    def _generate_kwargs(self, config: Dict, max_length: Optional[int],
+                         input_ids: torch.Tensor) -> Dict:
+        """
+        解码配置转换为 generate 参数（停止序列和词数上限转换为 StoppingCriteria）
+        
+        max_length 换算为 max_new_tokens：language_model.generate 是否把查询嵌入
+        计入 max_length 随 transformers 版本而变，直接传入会使生成预算不确定。
+        """
+        kwargs = {key: value for key, value in config.items() if key not in EARLY_STOP_KEYS}
+        if max_length is not None:
+            prompt_length = input_ids.shape[1]
+            if self._image_token_index() is not None:
+                prompt_length -= self.model.config.num_query_tokens
+            kwargs.pop('max_length', None)
+            kwargs['max_new_tokens'] = max_new_tokens_for(max_length, prompt_length)
+        if config.get('stop') or config.get('max_words'):
+            kwargs['stopping_criteria'] = answer_stopping_criteria(
+                self.processor.tokenizer, config.get('stop'), config.get('max_words')
+            )
+        return kwargs
+    
+    def generate_batch(self, images: List[Image.Image], prompts: List[str],
+                       max_length: Optional[int] = None, max_batch_size: int = 8,
+                       decoding: Union[str, Dict, None] = None) -> List[str]:
+        """
+        批量生成回答
+        
+        提示左侧填充后一次调用 generate；批内相同的图像只编码一次。
+        
+        Args:
+            images: PIL Image 列表
+            prompts: 提示列表，与 images 一一对应
+            max_length: 可选，提示与生成合计的最大长度（覆盖解码配置的 max_new_tokens）
+            max_batch_size: 单次 generate 的最大样本数
+            decoding: 解码配置名或字典，None 为默认的 beam3
+            
+        Returns:
+            生成的文本列表，顺序与输入一致
+        """
+        if len(images) != len(prompts):
+            raise ValueError(f"图像数量 ({len(images)}) 与提示数量 ({len(prompts)}) 不一致")
+        config = resolve_decoding(decoding)
+        
+        if self.model is None or self.processor is None:
+            return [self._mock_generate(prompt) for prompt in prompts]
+        
+        texts = []
+        for start in range(0, len(prompts), max_batch_size):
+            batch_images = images[start:start + max_batch_size]
+            batch_prompts = prompts[start:start + max_batch_size]
+            try:
+                texts.extend(self._generate_batch(batch_images, batch_prompts,
+                                                  max_length, config))
+            except Exception as e:
+                print(f"批量生成失败: {e}")
+                texts.extend(self._mock_generate(prompt) for prompt in batch_prompts)
+        
+        return texts
+    
+    def _generate_batch(self, images: List[Image.Image], prompts: List[str],
+                        max_length: Optional[int], config: Dict) -> List[str]:
+        """编码图像、分词、解码并还原文本（各阶段分别计时）"""
+        profiler = get_profiler()
+        with profiler.stage("generate", batch=len(prompts)):
+            with profiler.stage("generate.encode_image") as stage:
+                language_model_inputs = self._encode_images(images)
+                stage.add_tensor(language_model_inputs)
+            
+            with profiler.stage("generate.tokenize") as stage:
+                input_ids, attention_mask = self._tokenize_prompts(prompts)
+                stage.add_tensor(input_ids, attention_mask)
+            
+            with profiler.stage("generate.decode",
+                                num_beams=config.get('num_beams', 1)) as stage:
+                generated_ids = self._generate_from_embeds(
+                    language_model_inputs,
+                    input_ids,
+                    attention_mask,
+                    **self._generate_kwargs(config, max_length, input_ids)
+                )
+                stage.add_tensor(generated_ids)
+            profiler.increment("generate.prompts", len(prompts))
+            pad_token_id = self.processor.tokenizer.pad_token_id
+            if pad_token_id is not None:
+                profiler.increment("generate.new_tokens",
+                                   int((generated_ids != pad_token_id).sum()))
+            
+            with profiler.stage("generate.detokenize"):
+                return [
+                    trim_answer(text, config.get('stop'), config.get('max_words'))
+                    for text in self.processor.batch_decode(
+                        generated_ids, skip_special_tokens=True
+                    )
+                ]
+    
+    def answer_batch(self, images: List[Image.Image], questions: List[str],
+                     max_batch_size: int = 8,
+                     decoding: Union[str, Dict, None] = None) -> List[str]:
+        """
+        批量回答问题
+        
+        Args:
+            images: PIL Image 列表
+            questions: 问题列表，与 images 一一对应
+            max_batch_size: 单次 generate 的最大样本数
+            decoding: 解码配置名或字典
+            
+        Returns:
+            答案列表，顺序与输入一致
+        """
+        prompts = [f"Question: {question} Answer:" for question in questions]
+        return self.generate_batch(images, prompts, max_batch_size=max_batch_size,
+                                   decoding=decoding)
+    
+    def answer_question(self, image: Image.Image, question: str,
+                        max_length: Optional[int] = None,
+                        decoding: Union[str, Dict, None] = None) -> str:
         """
         回答关于图像的问题
         
         Args:
             image: PIL Image 对象
             question: 问题文本
+            max_length: 可选，提示与生成合计的最大长度
+            decoding: 解码配置名或字典
             
         Returns:
             答案
         """
         prompt = f"Question: {question} Answer:"
-        return self.generate(image, prompt)
+        return self.generate(image, prompt, max_length=max_length, decoding=decoding)
     
     def describe_image(self, image: Image.Image) -> str:
         """
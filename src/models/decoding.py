@@ -0,0 +1,136 @@
+"""
+BLIP-2 解码配置
+按任务或请求选择解码策略（贪心 / 束搜索 / 采样）和提前停止条件
+
+配置是传给 generate 的参数字典，另有两个由本项目处理的键：
+    stop: 停止序列列表，生成的答案中出现任一序列即停止，并从答案中截去
+    max_words: 答案词数上限，超过即停止并截断（VQA 答案通常只有一到三个词）
+"""
+import copy
+import json
+import re
+from typing import Dict, List, Optional, Union
+
+
+DECODING_PROFILES = {
+    # 原默认行为：3 束搜索，适合图像描述等长文本
+    "beam3": {'num_beams': 3, 'do_sample': False, 'max_new_tokens': 50},
+    "greedy": {'num_beams': 1, 'do_sample': False, 'max_new_tokens': 50},
+    # 短答案：贪心，换行或句末句号（后跟空白）处停止，最多 5 个词；
+    # 小数点（如 "3.5"）不是停止序列，答案末尾的句号由 trim_answer 去掉
+    "greedy-short": {'num_beams': 1, 'do_sample': False, 'max_new_tokens': 10,
+                     'stop': ["\n", ". "], 'max_words': 5},
+    "sampling": {'num_beams': 1, 'do_sample': True, 'top_p': 0.9, 'temperature': 0.7,
+                 'max_new_tokens': 50},
+}
+DEFAULT_DECODING = "beam3"
+
+# 不传给 generate 的键
+EARLY_STOP_KEYS = ("stop", "max_words")
+
+_BEAM_PATTERN = re.compile(r"beam(\d+)")
+
+
+def resolve_decoding(decoding: Union[str, Dict, None] = None) -> Dict:
+    """
+    解析解码配置
+
+    Args:
+        decoding: 配置名（DECODING_PROFILES 中的键，或 "beam<N>" 如 beam5）、
+                  字典（'profile' 指定基础配置，其余键覆盖）或 None（默认配置）
+
+    Returns:
+        新的配置字典
+
+    Raises:
+        ValueError: 未知的配置名或参数
+    """
+    if decoding is None:
+        decoding = DEFAULT_DECODING
+    if isinstance(decoding, dict):
+        overrides = dict(decoding)
+        config = resolve_decoding(overrides.pop('profile', DEFAULT_DECODING))
+        config.update(overrides)
+    elif not isinstance(decoding, str):
+        raise ValueError(f"解码配置应为名称或字典: {decoding!r}")
+    elif decoding in DECODING_PROFILES:
+        config = copy.deepcopy(DECODING_PROFILES[decoding])
+    elif _BEAM_PATTERN.fullmatch(decoding):
+        config = dict(DECODING_PROFILES["beam3"],
+                      num_beams=int(_BEAM_PATTERN.fullmatch(decoding).group(1)))
+    else:
+        raise ValueError(f"未知解码配置: {decoding}，"
+                         f"可选: {', '.join(DECODING_PROFILES)} 或 beam<N>")
+
+    if isinstance(config.get('stop'), str):
+        config['stop'] = [config['stop']]
+    if config.get('num_beams', 1) < 1:
+        raise ValueError(f"num_beams 必须为正整数: {config['num_beams']}")
+    if config.get('max_words') is not None and config['max_words'] < 1:
+        raise ValueError(f"max_words 必须为正整数: {config['max_words']}")
+    return config
+
+
+def should_stop(text: str, stop: Optional[List[str]] = None,
+                max_words: Optional[int] = None) -> bool:
+    """已生成的答案是否满足提前停止条件（与 trim_answer 的截断规则一致）"""
+    text = text.lstrip()
+    if any(sequence in text for sequence in stop or ()):
+        return True
+    # 多出一个词才能确定前 max_words 个词已经完整
+    return max_words is not None and len(text.split()) > max_words
+
+
+def max_new_tokens_for(max_length: int, prompt_length: int) -> int:
+    """
+    将提示与生成合计的 max_length 换算为新生成 token 数
+
+    查询嵌入（图像 token）不计入长度，与 Blip2ForConditionalGeneration.generate
+    按 num_query_tokens 偏移 max_length 的做法一致，且不随 transformers 版本变化。
+
+    Args:
+        max_length: 提示与生成合计的最大 token 数
+        prompt_length: 文本提示的 token 数（批内填充后的长度）
+
+    Returns:
+        至少为 1 的新 token 数上限
+    """
+    return max(1, max_length - prompt_length)
+
+
+def decoding_key(config: Dict) -> str:
+    """解码配置的规范化字符串（用于批内分组和结果缓存键）"""
+    return json.dumps(config, sort_keys=True, ensure_ascii=False)
+
+
+def trim_answer(text: str, stop: Optional[List[str]] = None,
+                max_words: Optional[int] = None) -> str:
+    """
+    按停止序列和词数上限截断答案
+
+    以空白结尾的停止序列（如 ". "）在生成结束处同样生效：答案 "yes." 截为 "yes"，
+    "3.5" 保持不变。生成过程中不能这样判断（"3." 之后可能还有 "5"），should_stop 不做此处理。
+
+    Args:
+        text: 生成的文本（不含提示）
+        stop: 停止序列，在第一次出现处截断
+        max_words: 保留的最多词数
+
+    Returns:
+        截断并去除首尾空白的答案
+    """
+    # 答案开头的空白（如 OPT 常先输出换行）不算停止序列
+    text = text.lstrip()
+    for sequence in stop or ():
+        index = text.find(sequence)
+        if index >= 0:
+            text = text[:index]
+        elif sequence.rstrip() and sequence != sequence.rstrip():
+            stripped = text.rstrip()
+            if stripped.endswith(sequence.rstrip()):
+                text = stripped[:-len(sequence.rstrip())]
+    if max_words is not None:
+        words = text.split()
+        if len(words) > max_words:
+            text = " ".join(words[:max_words])
+    return text.strip()
@@ -2,17 +2,76 @@
 Grounding DINO 模型封装
 用于物体检测和定位
 """
+import hashlib
 import torch
 import numpy as np
 from PIL import Image
 from typing import List, Tuple, Dict
 import warnings
+from ..utils.boxes import postprocess_detections
+from ..utils.cache import LRUCache
+from ..utils.detections import Detections
+from ..utils.profiling import get_profiler
+from ..utils.weights import build_with_state_dict, load_checkpoint
 warnings.filterwarnings('ignore')
 
 
+# 进程级文本特征缓存：(模型标识, 分词结果摘要) -> BERT 输出
+_text_feature_cache = LRUCache(64 * 1024**2)
+
+
+def _digest_text_inputs(kwargs: Dict) -> str:
+    """对 BERT 输入（由规范化后的提示唯一确定）计算摘要"""
+    h = hashlib.blake2b(digest_size=16)
+    for name in sorted(kwargs):
+        value = kwargs[name]
+        if isinstance(value, torch.Tensor):
+            h.update(name.encode())
+            h.update(str(tuple(value.shape)).encode())
+            h.update(value.detach().cpu().numpy().tobytes())
+    return h.hexdigest()
+
+
+def enable_text_feature_cache(bert: torch.nn.Module, model_key: str,
+                              cache: LRUCache = None):
+    """
+    为文本编码器启用特征缓存
+    
+    替换实例的 forward（不改变 state_dict 键名）。推理模式下相同的提示
+    直接返回缓存的 last_hidden_state，训练或需要梯度时不使用缓存。
+    
+    Args:
+        bert: GroundingDINO 的文本编码器（model.bert）
+        model_key: 模型标识，区分不同权重
+        cache: 使用的缓存，默认为进程级缓存
+    """
+    cache = cache if cache is not None else _text_feature_cache
+    original_forward = bert.forward
+    
+    def cached_forward(*args, **kwargs):
+        if args or bert.training or torch.is_grad_enabled():
+            return original_forward(*args, **kwargs)
+        key = (model_key, _digest_text_inputs(kwargs))
+        output = cache.get(key)
+        if output is None:
+            hidden = original_forward(**kwargs)["last_hidden_state"]
+            output = {'last_hidden_state': hidden}
+            cache.put(key, hidden)
+        else:
+            output = {'last_hidden_state': output}
+        return output
+    
+    bert.forward = cached_forward
+
+
 class GroundingDINOModel:
     """Grounding DINO 模型封装类"""
     
+    # 文本编码器（BERT）的最大 token 数，与 GroundingDINO 配置中的 max_text_len 一致
+    MAX_TEXT_LEN = 256
+    # ModelRegistry 传入模型路径时使用的构造参数名
+    registry_path_arg = "model_path"
+    
     def __init__(self, model_path: str = None, device: str = "cuda"):
         """
         初始化 Grounding DINO 模型
@@ -22,6 +81,7 @@ class GroundingDINOModel:
             device: 设备类型 ("cuda" 或 "cpu")
         """
         self.device = device if torch.cuda.is_available() else "cpu"
+        self.model_path = model_path
         self.model = None
         self._load_model(model_path)
     
@@ -31,24 +91,32 @@ class GroundingDINOModel:
             # 尝试导入 groundingdino
             from groundingdino.models import build_model
             from groundingdino.util.slconfig import SLConfig
-            from groundingdino.util.utils import clean_state_dict
             
             # 使用默认配置
             config_file = "groundingdino/config/GroundingDINO_SwinB.cfg.py"
             args = SLConfig.fromfile(config_file)
             args.device = self.device
             
-            self.model = build_model(args)
-            
             if model_path:
-                checkpoint = torch.load(model_path, map_location="cpu")
-                load_res = self.model.load_state_dict(
-                    clean_state_dict(checkpoint['model']), strict=False
-                )
+                # 权重内存映射，参数直接引用映射的张量（.pth 或 convert_checkpoint.py 转换的 .safetensors）
+                state_dict = load_checkpoint(model_path)
+                self.model, load_res = build_with_state_dict(lambda: build_model(args), state_dict)
+                del state_dict
                 print(f"模型加载完成: {load_res}")
+            else:
+                self.model = build_model(args)
             
             self.model.eval()
             self.model = self.model.to(self.device)
+            enable_text_feature_cache(
+                self.model.bert, f"{model_path}:{self.device}"
+            )
+            # 剖析关闭时钩子只做一次判断
+            get_profiler().instrument_submodules(self.model, {
+                'backbone': "detect.backbone",
+                'bert': "detect.text_encoder",
+                'transformer': "detect.transformer",
+            })
             
         except ImportError:
             print("警告: 无法导入 groundingdino，将使用简化版本")
@@ -59,7 +127,8 @@ class GroundingDINOModel:
             self.model = None
     
     def detect(self, image: Image.Image, text_prompt: str, 
-               box_threshold: float = 0.3, text_threshold: float = 0.25) -> List[Dict]:
+               box_threshold: float = 0.3, text_threshold: float = 0.25,
+               nms_threshold: float = 0.5) -> Detections:
         """
         检测图像中的物体
         
@@ -68,9 +137,11 @@ class GroundingDINOModel:
             text_prompt: 文本提示，如 "chair . table . lamp"
             box_threshold: 边界框阈值
             text_threshold: 文本阈值
+            nms_threshold: 同类别 NMS 的 IoU 阈值，None 表示不去重
             
         Returns:
-            检测结果列表，每个元素包含:
+            Detections（按分数降序），boxes 为像素坐标 xyxy。
+            迭代或 to_list() 得到兼容的字典形式:
             {
                 'bbox': [x1, y1, x2, y2],
                 'score': float,
@@ -82,32 +153,290 @@ class GroundingDINOModel:
             return self._mock_detect(image, text_prompt)
         
         try:
-            from groundingdino.util.inference import load_image, predict, annotate
-            
-            image_source, image = load_image(image)
-            boxes, logits, phrases = predict(
-                model=self.model,
-                image=image,
-                caption=text_prompt,
-                box_threshold=box_threshold,
-                text_threshold=text_threshold
-            )
+            from groundingdino.util.inference import predict
             
-            results = []
-            for box, logit, phrase in zip(boxes, logits, phrases):
-                results.append({
-                    'bbox': box.tolist(),
-                    'score': float(logit),
-                    'label': phrase
-                })
+            profiler = get_profiler()
+            with profiler.stage("detect", batch=1):
+                with profiler.stage("detect.preprocess") as stage:
+                    image_tensor = self._preprocess(image)
+                    stage.add_tensor(image_tensor)
+                
+                with profiler.stage("detect.forward") as stage:
+                    boxes, logits, phrases = predict(
+                        model=self.model,
+                        image=image_tensor,
+                        caption=self._preprocess_caption(text_prompt),
+                        box_threshold=box_threshold,
+                        text_threshold=text_threshold
+                    )
+                    stage.add_tensor(boxes, logits)
+                
+                profiler.increment("detect.images")
+                with profiler.stage("detect.postprocess"):
+                    names = list(dict.fromkeys(phrases))
+                    label_ids = [names.index(phrase) for phrase in phrases]
+                    post = postprocess_detections(
+                        boxes.cpu().numpy(), logits.cpu().numpy(), label_ids,
+                        image_size=image.size, iou_threshold=nms_threshold
+                    )
             
-            return results
+            return Detections(post['boxes'], post['scores'], post['labels'], names)
             
         except Exception as e:
             print(f"检测失败: {e}")
             return self._mock_detect(image, text_prompt)
     
-    def _mock_detect(self, image: Image.Image, text_prompt: str) -> List[Dict]:
+    def detect_batch(self, images: List[Image.Image], captions,
+                     box_threshold: float = 0.3, text_threshold: float = 0.25,
+                     max_batch_size: int = 8,
+                     nms_threshold: float = 0.5) -> List[Detections]:
+        """
+        批量检测多张图像中的物体
+        
+        不同尺寸的图像填充后堆叠（附带掩码），每批只做一次前向传播；
+        logits 到边界框的后处理对整批做张量运算。
+        
+        Args:
+            images: PIL Image 列表
+            captions: 文本提示列表（与 images 一一对应），或所有图像共用的单个提示
+            box_threshold: 边界框阈值
+            text_threshold: 文本阈值
+            max_batch_size: 单次前向传播的最大图像数
+            nms_threshold: 同类别 NMS 的 IoU 阈值，None 表示不去重
+            
+        Returns:
+            与 images 顺序一致的检测结果列表，每个元素格式同 detect
+        """
+        if isinstance(captions, str):
+            captions = [captions] * len(images)
+        if len(images) != len(captions):
+            raise ValueError(f"图像数量 ({len(images)}) 与提示数量 ({len(captions)}) 不一致")
+        
+        if self.model is None:
+            return [self._mock_detect(image, caption)
+                    for image, caption in zip(images, captions)]
+        
+        results = []
+        for start in range(0, len(images), max_batch_size):
+            batch_images = images[start:start + max_batch_size]
+            batch_captions = captions[start:start + max_batch_size]
+            try:
+                results.extend(self._detect_batch(
+                    batch_images, batch_captions, box_threshold, text_threshold,
+                    nms_threshold
+                ))
+            except Exception as e:
+                print(f"批量检测失败: {e}")
+                results.extend(self._mock_detect(image, caption)
+                               for image, caption in zip(batch_images, batch_captions))
+        
+        return results
+    
+    def _detect_batch(self, images: List[Image.Image], captions: List[str],
+                      box_threshold: float, text_threshold: float,
+                      nms_threshold: float = 0.5) -> List[Detections]:
+        """对一批图像执行一次前向传播并向量化后处理"""
+        profiler = get_profiler()
+        with profiler.stage("detect", batch=len(images)):
+            with profiler.stage("detect.preprocess") as stage:
+                captions = [self._preprocess_caption(caption) for caption in captions]
+                # 模型内部通过 nested_tensor_from_tensor_list 填充不同尺寸并生成掩码
+                tensors = [self._preprocess(image).to(self.device) for image in images]
+                stage.add_tensor(tensors)
+            
+            with profiler.stage("detect.forward") as stage:
+                with torch.no_grad():
+                    outputs = self.model(tensors, captions=captions)
+                stage.add_tensor(outputs["pred_logits"], outputs["pred_boxes"])
+            
+            profiler.increment("detect.images", len(images))
+            with profiler.stage("detect.postprocess"):
+                return self._postprocess_batch(images, captions, outputs,
+                                               box_threshold, text_threshold,
+                                               nms_threshold)
+    
+    def _postprocess_batch(self, images: List[Image.Image], captions: List[str],
+                           outputs: Dict, box_threshold: float, text_threshold: float,
+                           nms_threshold: float) -> List[Detections]:
+        """logits 到检测结果：短语匹配、阈值过滤、坐标转换和 NMS"""
+        logits = outputs["pred_logits"].sigmoid()  # (B, num_queries, max_text_len)
+        boxes = outputs["pred_boxes"]              # (B, num_queries, 4)
+        
+        token_phrase, phrase_names = self._token_phrase_map(captions, logits.shape[-1])
+        token_phrase = token_phrase.to(logits.device)
+        
+        # 每个查询选取得分最高的短语 token，再映射为短语
+        scores = logits.max(dim=-1).values
+        phrase_logits = logits.masked_fill((token_phrase < 0)[:, None, :], -1.0)
+        best_token = phrase_logits.argmax(dim=-1)
+        best_token_score = phrase_logits.gather(-1, best_token[..., None]).squeeze(-1)
+        phrase_idx = token_phrase.gather(1, best_token)
+        
+        keep = (scores > box_threshold) & (best_token_score > text_threshold)
+        batch_idx, query_idx = keep.nonzero(as_tuple=True)
+        
+        # 整批一次完成坐标转换和按（图像, 短语）分组的 NMS
+        batch_idx_np = batch_idx.cpu().numpy()
+        sizes = np.array([image.size for image in images], dtype=np.float32)
+        post = postprocess_detections(
+            boxes[batch_idx, query_idx].cpu().numpy(),
+            scores[batch_idx, query_idx].cpu().numpy(),
+            phrase_idx[batch_idx, query_idx].cpu().numpy(),
+            image_size=sizes[batch_idx_np], groups=batch_idx_np,
+            iou_threshold=nms_threshold
+        )
+        
+        image_of = batch_idx_np[post['index']]
+        results = []
+        for b in range(len(images)):
+            mask = image_of == b
+            results.append(Detections(post['boxes'][mask], post['scores'][mask],
+                                      post['labels'][mask], phrase_names[b]))
+        
+        return results
+    
+    def _token_phrase_map(self, captions: List[str], max_text_len: int):
+        """
+        构造 token 到短语的映射
+        
+        Returns:
+            (token_phrase, phrase_names)
+            token_phrase: LongTensor (B, max_text_len)，非短语 token 为 -1
+            phrase_names: 每个提示的短语名称列表
+        """
+        tokenizer = self.model.tokenizer
+        token_phrase = torch.full((len(captions), max_text_len), -1, dtype=torch.long)
+        phrase_names = []
+        
+        for b, caption in enumerate(captions):
+            # 按 "." 切分短语并记录字符区间
+            spans, names = [], []
+            pos = 0
+            for part in caption.split('.'):
+                name = part.strip()
+                if name:
+                    start = caption.index(name, pos)
+                    spans.append((start, start + len(name)))
+                    names.append(name)
+                pos += len(part) + 1
+            phrase_names.append(names)
+            
+            offsets = tokenizer(
+                caption, return_offsets_mapping=True
+            )["offset_mapping"][:max_text_len]
+            for t, (char_start, char_end) in enumerate(offsets):
+                if char_end <= char_start:
+                    continue  # 特殊 token
+                for p, (span_start, span_end) in enumerate(spans):
+                    if span_start <= char_start and char_end <= span_end:
+                        token_phrase[b, t] = p
+                        break
+        
+        return token_phrase, phrase_names
+    
+    def _preprocess(self, image: Image.Image) -> torch.Tensor:
+        """与 groundingdino.util.inference.load_image 相同的预处理（输入为 PIL 图像）"""
+        import groundingdino.datasets.transforms as T
+        
+        transform = T.Compose([
+            T.RandomResize([800], max_size=1333),
+            T.ToTensor(),
+            T.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+        ])
+        image_tensor, _ = transform(image.convert('RGB'), None)
+        return image_tensor
+    
+    @staticmethod
+    def _preprocess_caption(caption: str) -> str:
+        """规范化文本提示：小写、合并空白并以 "." 结尾，使等价提示命中同一缓存"""
+        caption = " ".join(caption.lower().split())
+        return caption if caption.endswith(".") else caption + " ."
+    
+    @staticmethod
+    def text_cache_stats() -> Dict:
+        """文本特征缓存的命中率等统计信息"""
+        return _text_feature_cache.stats()
+    
+    def build_captions(self, object_names: List[str],
+                       max_text_len: int = None) -> List[str]:
+        """
+        将多个物体名称合并为尽量少的文本提示
+        
+        每个提示形如 "chair . table . lamp ."，token 数不超过文本编码器上限。
+        采用首次适应递减（first-fit decreasing）装箱，使分块数尽可能少。
+        
+        Args:
+            object_names: 物体名称列表
+            max_text_len: token 上限，默认使用 MAX_TEXT_LEN
+            
+        Returns:
+            文本提示列表
+        """
+        max_text_len = max_text_len or self.MAX_TEXT_LEN
+        # [CLS] 和 [SEP] 各占一个 token
+        budget = max_text_len - 2
+        
+        names = []
+        for name in object_names:
+            name = name.strip().lower()
+            if name and name not in names:
+                names.append(name)
+        
+        # 每个名称额外占用一个 "." 分隔符 token
+        costs = {name: self._count_tokens(name) + 1 for name in names}
+        
+        bins = []  # [剩余容量, 名称列表]
+        for name in sorted(names, key=lambda n: costs[n], reverse=True):
+            for b in bins:
+                if b[0] >= costs[name]:
+                    b[0] -= costs[name]
+                    b[1].append(name)
+                    break
+            else:
+                bins.append([budget - costs[name], [name]])
+        
+        # 保持原始顺序，便于调试
+        order = {name: i for i, name in enumerate(names)}
+        return [" . ".join(sorted(b[1], key=order.get)) + " ." for b in bins]
+    
+    def _count_tokens(self, text: str) -> int:
+        """统计文本在文本编码器中的 token 数"""
+        tokenizer = getattr(self.model, 'tokenizer', None)
+        if tokenizer is not None:
+            return len(tokenizer.tokenize(text))
+        # 无分词器时按单词数粗略估计（WordPiece 通常不少于单词数）
+        return max(1, len(text.split()))
+    
+    @staticmethod
+    def match_label(phrase: str, object_names: List[str]) -> str:
+        """
+        将检测得到的短语匹配到最接近的物体名称
+        
+        Args:
+            phrase: 模型输出的短语（可能是名称的一部分或多个名称拼接）
+            object_names: 候选物体名称列表
+            
+        Returns:
+            匹配的物体名称，无法匹配时返回 None
+        """
+        phrase = phrase.strip().lower()
+        if not phrase:
+            return None
+        
+        names = [name.strip().lower() for name in object_names]
+        if phrase in names:
+            return object_names[names.index(phrase)]
+        
+        # 按单词重叠程度选择最佳匹配
+        phrase_words = set(phrase.split())
+        best, best_overlap = None, 0
+        for original, name in zip(object_names, names):
+            overlap = len(phrase_words & set(name.split()))
+            if overlap > best_overlap:
+                best, best_overlap = original, overlap
+        return best
+    
+    def _mock_detect(self, image: Image.Image, text_prompt: str) -> Detections:
         """模拟检测结果（用于演示）"""
         import random
         width, height = image.size
@@ -128,6 +457,6 @@ class GroundingDINOModel:
                 'label': obj
             })
         
-        return results
+        return Detections.from_list(results)
 
 
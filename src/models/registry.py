@@ -0,0 +1,200 @@
+"""
+模型注册表
+进程内共享模型实例，避免多个任务重复加载相同权重
+"""
+import os
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from ..utils.singleflight import SingleFlight
+
+
+def _normalize_device(device: str) -> str:
+    """将不可用的 CUDA 设备归一化为 CPU，与模型类的回退逻辑保持一致"""
+    if device and device.startswith("cuda"):
+        try:
+            import torch
+            if not torch.cuda.is_available():
+                return "cpu"
+        except ImportError:
+            return "cpu"
+    return device
+
+
+def get_rss_bytes() -> int:
+    """
+    获取当前进程的常驻内存（RSS）
+
+    Returns:
+        常驻内存字节数，无法获取时返回 0
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # 非 Linux 平台只能退化为峰值 RSS（macOS 单位为字节，其余为 KB）
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+    except ImportError:
+        return 0
+
+
+class ModelRegistry:
+    """
+    模型注册表
+
+    以 (模型类, 模型路径, 设备, 精度, 其他构造参数) 为键缓存模型实例，并进行引用计数。
+    构造参数不同（如 quantized_cache_dir）的 acquire 得到各自的实例。
+    引用计数归零时释放模型。
+
+    模型路径按模型类的 registry_path_arg 属性传给构造函数（默认 model_path）。
+    加载按键合并：同一模型的并发 acquire 只加载一次，
+    加载期间不持有注册表锁，其他模型的 acquire/release/stats 不受阻塞。
+    """
+
+    def __init__(self):
+        self._entries: Dict[tuple, dict] = {}
+        self._lock = threading.RLock()
+        self._loads = SingleFlight()
+
+    @staticmethod
+    def make_key(model_cls, model_path: str = None, device: str = "cuda",
+                 precision: str = None, **kwargs) -> tuple:
+        """构造注册表键（其他构造参数按名称排序，值为 None 的参数视为未传）"""
+        options = tuple(sorted((name, repr(value)) for name, value in kwargs.items()
+                               if value is not None))
+        return (model_cls.__name__, model_path, _normalize_device(device), precision, options)
+
+    def acquire(self, model_cls, model_path: str = None, device: str = "cuda",
+                precision: str = None, **kwargs):
+        """
+        获取模型实例，不存在时加载
+
+        Args:
+            model_cls: 模型类，如 GroundingDINOModel、BLIP2Model
+            model_path: 模型权重路径或 HuggingFace 模型名称
+            device: 设备类型
+            precision: 精度类型（模型不支持时为 None）
+            **kwargs: 传给模型构造函数的其他参数
+
+        Returns:
+            共享的模型实例
+        """
+        key = self.make_key(model_cls, model_path, device, precision, **kwargs)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry['refcount'] += 1
+                    return entry['model']
+            # 加载完成后条目已登记，下一轮循环取得引用（期间被 clear 时重新加载）
+            self._loads.do(key, lambda: self._load(model_cls, key, model_path, device,
+                                                   precision, kwargs))
+
+    def _load(self, model_cls, key: tuple, model_path: str, device: str,
+              precision: str, kwargs: dict) -> dict:
+        """加载模型并登记到注册表（引用计数为 0），记录加载耗时与内存占用"""
+        init_kwargs = dict(kwargs)
+        init_kwargs['device'] = device
+        # 路径为 None 时使用构造函数的默认值
+        if model_path is not None:
+            init_kwargs[getattr(model_cls, 'registry_path_arg', 'model_path')] = model_path
+        if precision is not None:
+            init_kwargs['precision'] = precision
+
+        rss_before = get_rss_bytes()
+        start = time.perf_counter()
+        model = model_cls(**init_kwargs)
+        load_time = time.perf_counter() - start
+        rss_after = get_rss_bytes()
+
+        print(f"[registry] 已加载 {key[0]} ({model_path or 'default'}, "
+              f"{key[2]}): {load_time:.2f}s, "
+              f"+{max(0, rss_after - rss_before) / 1024**2:.1f} MB")
+
+        entry = {
+            'model': model,
+            'refcount': 0,
+            'load_time': load_time,
+            'memory_bytes': max(0, rss_after - rss_before),
+        }
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def release(self, model) -> bool:
+        """
+        释放一次对模型的引用，引用计数归零时从注册表移除
+
+        Args:
+            model: acquire 返回的模型实例
+
+        Returns:
+            模型是否已被卸载
+        """
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry['model'] is model:
+                    entry['refcount'] -= 1
+                    if entry['refcount'] <= 0:
+                        del self._entries[key]
+                        self._free(entry['model'])
+                        return True
+                    return False
+        return False
+
+    @staticmethod
+    def _free(model):
+        """删除模型权重并回收显存"""
+        model.model = None
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def clear(self):
+        """卸载所有模型（忽略引用计数）"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._free(entry['model'])
+
+    def stats(self) -> List[Dict]:
+        """
+        获取已加载模型的统计信息
+
+        Returns:
+            列表，每个元素包含 model, path, device, precision, options,
+            refcount, load_time, memory_bytes
+        """
+        with self._lock:
+            return [
+                {
+                    'model': key[0],
+                    'path': key[1],
+                    'device': key[2],
+                    'precision': key[3],
+                    'options': dict(key[4]),
+                    'refcount': entry['refcount'],
+                    'load_time': entry['load_time'],
+                    'memory_bytes': entry['memory_bytes'],
+                }
+                for key, entry in self._entries.items()
+            ]
+
+
+_default_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    """获取进程级默认模型注册表"""
+    return _default_registry
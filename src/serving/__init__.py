@@ -0,0 +1,23 @@
+"""
+推理服务模块
+
+按需导入子模块：客户端（src.serving.client）只依赖标准库，
+命令行脚本作为客户端运行时不会加载 PIL / numpy / torch
+"""
+from ..utils.lazy import lazy_exports
+
+# 公开名称 -> 所在子模块
+_LAZY_ATTRS = {
+    'run_batch': 'batch',
+    'read_manifest': 'batch',
+    'scan_directory': 'batch',
+    'InferenceClient': 'client',
+    'ServerUnavailableError': 'client',
+    'BatchScheduler': 'scheduler',
+    'QueueFullError': 'scheduler',
+    'DeadlineExceededError': 'scheduler',
+    'InferenceService': 'service',
+    'RequestError': 'service',
+}
+
+__getattr__, __dir__, __all__ = lazy_exports(__name__, _LAZY_ATTRS)
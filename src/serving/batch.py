@@ -0,0 +1,209 @@
+"""
+批处理模式：对 JSONL 清单或图像目录批量推理，结果流式写入 JSONL
+
+- 后台线程池预取并解码图像，与模型推理重叠
+- 按任务分组，每组调用批量推理接口
+- 启动时读取已有输出，跳过已完成的请求（断点续跑）
+"""
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Set
+
+from PIL import Image
+
+from .service import InferenceService, RequestError, TASKS
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def read_manifest(manifest_path: str) -> Iterator[Dict]:
+    """
+    读取 JSONL 清单
+
+    每行一个请求: {"id": ..., "task": ..., "image": ..., "text": ...}
+    缺少 id 时使用行号；相对图像路径相对于清单所在目录。
+    无法解析的行以行号为 id 产出带 error 字段的请求，由 run_batch 记为失败。
+    """
+    manifest_path = Path(manifest_path)
+    base_dir = manifest_path.parent
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError(f"应为 JSON 对象，实际为 {type(request).__name__}")
+            except ValueError as e:
+                yield {'id': str(line_no), 'error': f"解析清单第 {line_no} 行失败: {e}"}
+                continue
+            request.setdefault("id", str(line_no))
+            image = request.get("image")
+            if image and not os.path.isabs(image):
+                request["image"] = str(base_dir / image)
+            yield request
+
+
+def scan_directory(image_dir: str, task: str, text: str) -> Iterator[Dict]:
+    """
+    为目录中的每张图像生成同一个请求
+
+    Args:
+        image_dir: 图像目录（递归扫描）
+        task: 任务类型
+        text: 文本提示或问题
+    """
+    image_dir = Path(image_dir)
+    for path in sorted(image_dir.rglob("*")):
+        if path.suffix.lower() in IMAGE_EXTENSIONS:
+            yield {
+                'id': str(path.relative_to(image_dir)),
+                'task': task,
+                'image': str(path),
+                'text': text,
+            }
+
+
+def load_completed_ids(output_path: str) -> Set[str]:
+    """
+    读取已有输出中完成的请求 id，并截掉崩溃时写了一半的末行
+
+    Returns:
+        已完成（含失败记录）的请求 id 集合
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        # 末行不完整时截断到最后一个换行符
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+
+    for line in data.decode('utf-8').splitlines():
+        try:
+            completed.add(str(json.loads(line)["id"]))
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+    return completed
+
+
+def _load_image(path: str) -> Image.Image:
+    image = Image.open(path)
+    image.load()
+    return image.convert('RGB')
+
+
+def _group_batches(requests: List[Dict], batch_size: int) -> List[List[Dict]]:
+    """按任务分组后切分批次，保持组内原始顺序"""
+    by_task = {name: [] for name in TASKS}
+    batches = []
+    for request in requests:
+        task = request.get("task")
+        if task not in by_task:
+            # 未知任务单独成批，由 handle_batch 返回错误
+            batches.append([request])
+            continue
+        by_task[task].append(request)
+    for task_requests in by_task.values():
+        for start in range(0, len(task_requests), batch_size):
+            batches.append(task_requests[start:start + batch_size])
+    return batches
+
+
+def run_batch(service: InferenceService, requests: Iterator[Dict], output_path: str,
+              batch_size: int = 8, num_workers: int = 4, prefetch_batches: int = 2,
+              resume: bool = True) -> Dict:
+    """
+    批量推理并将结果流式写入 JSONL
+
+    Args:
+        service: 推理服务
+        requests: 请求迭代器（来自 read_manifest 或 scan_directory）
+        output_path: 输出 JSONL 路径
+        batch_size: 每次批量推理的请求数
+        num_workers: 图像解码线程数
+        prefetch_batches: 提前解码的批次数
+        resume: 是否跳过输出文件中已完成的请求
+
+    Returns:
+        统计信息: {'total', 'skipped', 'completed', 'failed'}
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    completed = load_completed_ids(str(output_path)) if resume else set()
+    requests = list(requests)
+    pending = [r for r in requests if str(r["id"]) not in completed]
+    stats = {'total': len(requests), 'skipped': len(requests) - len(pending),
+             'completed': 0, 'failed': 0}
+    if stats['skipped']:
+        print(f"跳过已完成的请求: {stats['skipped']}")
+
+    # 清单中无法解析的行直接记为失败，不参与推理
+    invalid = [r for r in pending if 'error' in r]
+    batches = _group_batches([r for r in pending if 'error' not in r], batch_size)
+    mode = 'a' if resume else 'w'
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool, \
+            open(output_path, mode, encoding='utf-8') as out:
+        for request in invalid:
+            stats['failed'] += 1
+            out.write(json.dumps({'id': request["id"], 'task': None, 'text': "",
+                                  'error': request['error']}, ensure_ascii=False) + "\n")
+        out.flush()
+
+        inflight = deque()
+
+        def _prefetch(batch):
+            futures = [pool.submit(_load_image, r["image"]) if r.get("image") else None
+                       for r in batch]
+            inflight.append((batch, futures))
+
+        batch_iter = iter(batches)
+        for batch in batch_iter:
+            _prefetch(batch)
+            if len(inflight) > prefetch_batches:
+                break
+
+        while inflight:
+            batch, futures = inflight.popleft()
+            next_batch = next(batch_iter, None)
+            if next_batch is not None:
+                _prefetch(next_batch)
+
+            images, valid, lines = [], [], []
+            for request, future in zip(batch, futures):
+                try:
+                    if future is None:
+                        raise RequestError("请求缺少 image 字段")
+                    images.append(future.result())
+                    valid.append(request)
+                except Exception as e:
+                    lines.append({'id': request["id"], 'task': request.get("task"),
+                                  'text': request.get("text", ""),
+                                  'error': f"加载图像失败: {e}"})
+
+            if valid:
+                lines.extend(service.handle_batch(valid, images))
+
+            for line in lines:
+                if 'error' in line:
+                    stats['failed'] += 1
+                else:
+                    stats['completed'] += 1
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            out.flush()
+
+            done = stats['completed'] + stats['failed']
+            print(f"\r进度: {done}/{len(pending)}", end='', flush=True)
+
+    print()
+    return stats
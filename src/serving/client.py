@@ -0,0 +1,112 @@
+"""
+推理服务客户端
+只依赖标准库，命令行脚本无需导入 torch 即可发送请求；
+http.client 在首次请求时才导入，不影响 --help 等纯参数解析的启动时间
+"""
+import json
+
+
+DEFAULT_SERVER_URL = "http://127.0.0.1:8765"
+
+
+class ServerUnavailableError(ConnectionError):
+    """无法连接推理服务器"""
+
+
+_unix_connection_class = None
+
+
+def _unix_http_connection(socket_path: str, timeout: float = None):
+    """创建通过 Unix socket 发送 HTTP 请求的连接（类在首次使用时定义）"""
+    global _unix_connection_class
+    if _unix_connection_class is None:
+        import http.client
+        import socket
+
+        class _UnixHTTPConnection(http.client.HTTPConnection):
+            def __init__(self, socket_path: str, timeout: float = None):
+                super().__init__("localhost", timeout=timeout)
+                self.socket_path = socket_path
+
+            def connect(self):
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                if self.timeout is not None:
+                    self.sock.settimeout(self.timeout)
+                self.sock.connect(self.socket_path)
+
+        _unix_connection_class = _UnixHTTPConnection
+    return _unix_connection_class(socket_path, timeout=timeout)
+
+
+class InferenceClient:
+    """推理服务客户端类"""
+
+    def __init__(self, url: str = DEFAULT_SERVER_URL, socket_path: str = None,
+                 timeout: float = 300.0):
+        """
+        初始化客户端
+
+        Args:
+            url: 服务器地址，如 "http://127.0.0.1:8765"
+            socket_path: Unix socket 路径，指定时忽略 url
+            timeout: 请求超时（秒）
+        """
+        self.url = url
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _connection(self, timeout: float):
+        if self.socket_path:
+            return _unix_http_connection(self.socket_path, timeout=timeout)
+        import http.client
+        from urllib.parse import urlparse
+        parsed = urlparse(self.url)
+        return http.client.HTTPConnection(parsed.hostname, parsed.port or 80,
+                                          timeout=timeout)
+
+    def _request(self, method: str, path: str, payload: dict = None,
+                 timeout: float = None) -> dict:
+        body = None
+        headers = {}
+        if payload is not None:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            headers["Content-Type"] = "application/json; charset=utf-8"
+
+        conn = self._connection(timeout or self.timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = json.loads(response.read() or b"{}")
+        except OSError as e:
+            # ConnectionError、FileNotFoundError（socket 不存在）和超时都是 OSError
+            raise ServerUnavailableError(f"无法连接推理服务器: {e}") from e
+        finally:
+            conn.close()
+
+        if response.status != 200:
+            raise RuntimeError(data.get('error', f"HTTP {response.status}"))
+        return data
+
+    def is_available(self, timeout: float = 0.5) -> bool:
+        """检查服务器是否可用"""
+        try:
+            self._request("GET", "/health", timeout=timeout)
+            return True
+        except (ServerUnavailableError, RuntimeError):
+            return False
+
+    def health(self) -> dict:
+        """获取服务器状态"""
+        return self._request("GET", "/health")
+
+    def infer(self, request: dict) -> dict:
+        """
+        发送推理请求
+
+        Args:
+            request: 请求字典，格式同 InferenceService.handle
+
+        Returns:
+            响应字典
+        """
+        return self._request("POST", "/infer", request)
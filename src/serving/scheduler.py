@@ -0,0 +1,231 @@
+"""
+动态批处理调度器
+按模型排队请求，凑满批次或等待超时后一次调用批量推理接口
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+
+class QueueFullError(RuntimeError):
+    """队列已满（背压），调用方应稍后重试"""
+
+
+class DeadlineExceededError(TimeoutError):
+    """请求在截止时间前未完成"""
+
+
+class _ModelQueue:
+    """单个模型的请求队列与统计"""
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int, max_wait_ms: float, max_queue_size: int):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.worker: asyncio.Task = None
+        self.executor: ThreadPoolExecutor = None
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self.expired = 0
+
+
+class BatchScheduler:
+    """
+    基于 asyncio 的动态批处理调度器
+
+    每个模型一个队列和一个工作协程。工作协程取到第一个请求后，
+    最多再等待 max_wait_ms 凑批，批次满 max_batch_size 立即派发。
+    批量推理函数在该模型自己的线程池中执行，不阻塞事件循环，
+    一个模型的长批次也不会阻塞其他模型已就绪的批次。
+    """
+
+    def __init__(self, max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 max_queue_size: int = 256, num_workers: int = 1):
+        """
+        初始化调度器
+
+        Args:
+            max_batch_size: 默认最大批次大小
+            max_wait_ms: 默认最长凑批等待时间（毫秒）
+            max_queue_size: 默认每个队列的最大长度，超出时拒绝请求
+            num_workers: 每个模型队列执行批量推理的线程数
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue_size = max_queue_size
+        self.num_workers = num_workers
+        self._queues: Dict[str, _ModelQueue] = {}
+
+    def register(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = None, max_wait_ms: float = None,
+                 max_queue_size: int = None):
+        """
+        注册模型队列（需在事件循环中调用）
+
+        Args:
+            name: 队列名称，如 "grounding_dino"、"blip2"
+            batch_fn: 批量推理函数，输入请求列表，返回等长结果列表
+            max_batch_size: 覆盖默认最大批次大小
+            max_wait_ms: 覆盖默认最长等待时间
+            max_queue_size: 覆盖默认队列长度
+        """
+        queue = _ModelQueue(
+            name, batch_fn,
+            max_batch_size or self.max_batch_size,
+            self.max_wait_ms if max_wait_ms is None else max_wait_ms,
+            max_queue_size or self.max_queue_size,
+        )
+        queue.executor = ThreadPoolExecutor(max_workers=self.num_workers,
+                                            thread_name_prefix=f"batch-{name}")
+        queue.worker = asyncio.get_running_loop().create_task(self._worker(queue))
+        self._queues[name] = queue
+
+    async def submit(self, name: str, item: Any, deadline_ms: float = None) -> Any:
+        """
+        提交请求并等待结果
+
+        Args:
+            name: 队列名称
+            item: 传给批量推理函数的单个请求
+            deadline_ms: 截止时间（毫秒，相对当前时刻），None 表示不限
+
+        Returns:
+            该请求对应的结果
+
+        Raises:
+            QueueFullError: 队列已满
+            DeadlineExceededError: 超过截止时间
+        """
+        queue = self._queues.get(name)
+        if queue is None:
+            raise KeyError(f"未注册的模型队列: {name}")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        deadline = None if deadline_ms is None else time.monotonic() + deadline_ms / 1000.0
+
+        try:
+            queue.queue.put_nowait((item, future, deadline))
+        except asyncio.QueueFull:
+            queue.rejected += 1
+            raise QueueFullError(f"{name} 队列已满 ({queue.queue.maxsize})")
+
+        if deadline is None:
+            return await future
+        try:
+            return await asyncio.wait_for(future, timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            queue.expired += 1
+            raise DeadlineExceededError(f"{name} 请求超过截止时间 {deadline_ms}ms")
+
+    async def _worker(self, queue: _ModelQueue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.queue.get()]
+            batch_deadline = loop.time() + queue.max_wait
+            while len(batch) < queue.max_batch_size:
+                remaining = batch_deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # 丢弃已取消（调用方超时）或已过期的请求
+            now = time.monotonic()
+            live = []
+            for item, future, deadline in batch:
+                if future.done():
+                    continue
+                if deadline is not None and deadline <= now:
+                    queue.expired += 1
+                    future.set_exception(DeadlineExceededError(
+                        f"{queue.name} 请求在派发前已过期"))
+                    continue
+                live.append((item, future))
+            if not live:
+                continue
+
+            try:
+                results = await loop.run_in_executor(
+                    queue.executor, queue.batch_fn, [item for item, _ in live]
+                )
+                if len(results) != len(live):
+                    raise RuntimeError(f"{queue.name} 批量推理返回 {len(results)} 个结果，"
+                                       f"期望 {len(live)} 个")
+            except Exception as e:
+                for _, future in live:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            queue.batches += 1
+            queue.items += len(live)
+            for (_, future), result in zip(live, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Dict]:
+        """各队列的深度、批次数、平均批次大小、拒绝数与过期数"""
+        return {
+            name: {
+                'queue_depth': q.queue.qsize(),
+                'batches': q.batches,
+                'items': q.items,
+                'avg_batch_size': q.items / q.batches if q.batches else 0.0,
+                'rejected': q.rejected,
+                'expired': q.expired,
+            }
+            for name, q in self._queues.items()
+        }
+
+    async def close(self):
+        """停止所有工作协程并关闭线程池"""
+        for queue in self._queues.values():
+            queue.worker.cancel()
+        await asyncio.gather(*(q.worker for q in self._queues.values()),
+                             return_exceptions=True)
+        for queue in self._queues.values():
+            queue.executor.shutdown(wait=False)
+        self._queues.clear()
+
+
+class SchedulerThread:
+    """
+    在后台线程中运行调度器的事件循环，供多线程 HTTP 服务器同步调用
+    """
+
+    def __init__(self, scheduler: BatchScheduler):
+        self.scheduler = scheduler
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def register(self, name: str, batch_fn: Callable[[List[Any]], List[Any]], **kwargs):
+        """在事件循环线程中注册模型队列"""
+        async def _register():
+            self.scheduler.register(name, batch_fn, **kwargs)
+        asyncio.run_coroutine_threadsafe(_register(), self.loop).result()
+
+    def submit(self, name: str, item: Any, deadline_ms: float = None) -> Any:
+        """同步提交请求并阻塞等待结果"""
+        return asyncio.run_coroutine_threadsafe(
+            self.scheduler.submit(name, item, deadline_ms), self.loop
+        ).result()
+
+    def stats(self) -> Dict[str, Dict]:
+        return self.scheduler.stats()
+
+    def close(self):
+        """停止调度器和事件循环线程"""
+        asyncio.run_coroutine_threadsafe(self.scheduler.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
@@ -0,0 +1,177 @@
+"""
+常驻推理服务器
+通过 HTTP（TCP 或 Unix socket）接收 JSON 请求，模型只加载一次
+
+接口:
+    GET  /health          服务状态
+    GET  /metrics         分阶段计时（Prometheus 文本格式，需开启 profiling）
+    GET  /trace           分阶段计时（Chrome trace JSON，需开启 profiling）
+    POST /infer           请求体为 InferenceService.handle 接受的 JSON
+    POST /<task>          同 /infer，task 由路径指定
+"""
+import json
+import os
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ..utils.profiling import get_profiler
+from .scheduler import DeadlineExceededError, QueueFullError
+from .service import InferenceService, RequestError, TASKS
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """HTTP 请求处理器，service 由服务器实例提供"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def address_string(self):
+        # Unix socket 的客户端地址为空字符串
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: int, text: str, content_type: str):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.server.service.health())
+        elif self.path == "/metrics":
+            self._send_text(200, get_profiler().to_prometheus(),
+                            "text/plain; version=0.0.4; charset=utf-8")
+        elif self.path == "/trace":
+            self._send_json(200, get_profiler().chrome_trace())
+        else:
+            self._send_json(404, {'error': f"未知路径: {self.path}"})
+
+    def do_POST(self):
+        path = self.path.strip("/")
+        if path != "infer" and path not in TASKS:
+            self._send_json(404, {'error': f"未知路径: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if path in TASKS and isinstance(request, dict):
+                request.setdefault("task", path)
+            response = self.server.service.handle(request)
+        except (RequestError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except QueueFullError as e:
+            self._send_json(503, {'error': str(e)})
+            return
+        except DeadlineExceededError as e:
+            self._send_json(504, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': f"推理失败: {e}"})
+            return
+
+        self._send_json(200, response)
+
+
+class InferenceHTTPServer(ThreadingHTTPServer):
+    """基于 TCP 的多线程推理服务器"""
+
+    daemon_threads = True
+
+    def __init__(self, address, service: InferenceService, verbose: bool = False):
+        self.service = service
+        self.verbose = verbose
+        super().__init__(address, InferenceRequestHandler)
+
+
+class InferenceUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """基于 Unix socket 的多线程推理服务器"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: InferenceService, verbose: bool = False):
+        self.service = service
+        self.verbose = verbose
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, InferenceRequestHandler)
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def create_server(service: InferenceService, host: str = "127.0.0.1",
+                  port: int = 8765, socket_path: str = None,
+                  verbose: bool = False):
+    """
+    创建推理服务器（不启动）
+
+    Args:
+        service: 推理服务
+        host: 监听地址
+        port: 监听端口
+        socket_path: Unix socket 路径，指定时忽略 host/port
+        verbose: 是否打印访问日志
+
+    Returns:
+        服务器实例，调用 serve_forever() 启动
+    """
+    if socket_path:
+        return InferenceUnixServer(socket_path, service, verbose=verbose)
+    return InferenceHTTPServer((host, port), service, verbose=verbose)
+
+
+def serve(service: InferenceService, host: str = "127.0.0.1", port: int = 8765,
+          socket_path: str = None, preload: bool = True, batching: bool = None,
+          verbose: bool = False):
+    """
+    启动推理服务器并阻塞运行
+
+    Args:
+        service: 推理服务
+        host: 监听地址
+        port: 监听端口
+        socket_path: Unix socket 路径
+        preload: 是否在启动时预先加载所有模型
+        batching: 是否启用动态批处理，None 时读取 serving.batching 配置
+        verbose: 是否打印访问日志
+    """
+    if preload:
+        for name in TASKS:
+            service.get_task(name)
+
+    if batching is None:
+        batching = service.serving_config.get('batching', False)
+    if batching:
+        service.enable_batching()
+
+    server = create_server(service, host, port, socket_path, verbose)
+    address = socket_path or f"http://{host}:{port}"
+    print(f"推理服务已启动: {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n推理服务已停止")
+    finally:
+        server.server_close()
+        service.close()
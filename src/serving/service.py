@@ -0,0 +1,570 @@
+"""
+推理服务：统一处理 grounding、counting、VQA 请求
+服务进程只加载一次模型，供 HTTP 服务器和批处理模式复用
+"""
+import base64
+import io
+import os
+import threading
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from ..models.decoding import decoding_key, resolve_decoding
+from ..utils.cache import ResultCache, image_hash
+from ..utils.config import load_config
+from ..utils.detections import Detections
+from ..utils.profiling import get_profiler
+from ..utils.singleflight import SingleFlight
+
+
+TASKS = ("grounding", "counting", "vqa")
+
+# 各任务在响应中的结果字段
+RESULT_FIELDS = {'grounding': 'results', 'counting': 'count', 'vqa': 'answer'}
+
+
+class RequestError(ValueError):
+    """请求格式或参数错误"""
+
+
+def configure_profiler(profiling_config: Dict):
+    """
+    按 config.yaml 的 profiling 配置设置进程级剖析器
+
+    环境变量 HOME_ROBOT_PROFILE=1 已开启时不会被配置关闭。
+
+    Args:
+        profiling_config: profiling 配置字典
+    """
+    profiler = get_profiler()
+    profiler.configure(
+        enabled=profiler.enabled or bool(profiling_config.get('enabled', False)),
+        trace=profiling_config.get('trace'),
+        max_trace_events=profiling_config.get('max_trace_events'),
+        sync_cuda=profiling_config.get('sync_cuda'),
+    )
+
+
+def decode_image(request: Dict) -> Image.Image:
+    """
+    从请求中读取图像
+
+    支持 "image"（本地路径）或 "image_b64"（base64 编码的图像文件）。
+    """
+    if request.get("image_b64"):
+        data = base64.b64decode(request["image_b64"])
+        return Image.open(io.BytesIO(data)).convert('RGB')
+
+    path = request.get("image")
+    if not path:
+        raise RequestError("请求缺少 image 或 image_b64 字段")
+    if not os.path.exists(path):
+        raise RequestError(f"图像文件不存在: {path}")
+    return Image.open(path).convert('RGB')
+
+
+class InferenceService:
+    """推理服务类，按需创建任务并在进程内常驻"""
+
+    def __init__(self, device: str = "cuda", grounding_model: str = None,
+                 blip2_model: str = "Salesforce/blip2-opt-2.7b",
+                 precision: str = "fp16", task_config: Dict = None,
+                 serving_config: Dict = None, result_cache: ResultCache = None,
+                 models: Dict = None, quantized_cache_dir: str = None):
+        """
+        初始化推理服务
+
+        Args:
+            device: 设备类型
+            grounding_model: Grounding DINO 模型路径
+            blip2_model: BLIP-2 模型名称
+            precision: BLIP-2 精度类型（fp16 / fp32 / bf16 / int8 / int8-qformer）
+            task_config: config.yaml 中的 tasks 配置（阈值等默认值）
+            serving_config: config.yaml 中的 serving 配置（动态批处理参数）
+            result_cache: 结果缓存，None 表示不缓存
+            models: 可选，预先构造的模型实例 {'grounding_dino': ..., 'blip2': ...}，
+                    提供时不再加载对应模型（基准测试替身等）
+            quantized_cache_dir: BLIP-2 int8 量化模型的缓存目录
+        """
+        self.device = device
+        self.grounding_model = grounding_model
+        self.blip2_model = blip2_model
+        self.precision = precision
+        self.quantized_cache_dir = quantized_cache_dir
+        self.task_config = task_config or {}
+        self.serving_config = serving_config or {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self.scheduler = None
+        self.scene_index = None
+        self.result_cache = result_cache
+        self.models = models or {}
+        # 相同图像与查询的并发请求只计算一次
+        self.inflight = SingleFlight() if self.serving_config.get('coalesce', True) else None
+
+    @classmethod
+    def from_config(cls, config_path: str = "config.yaml",
+                    device: str = None) -> "InferenceService":
+        """
+        根据配置文件创建服务
+
+        Args:
+            config_path: 配置文件路径
+            device: 覆盖配置中的设备类型
+        """
+        config = load_config(config_path)
+        configure_profiler(config.get('profiling', {}))
+        model_config = config.get('model', {})
+        cache_config = config.get('cache', {})
+        result_cache = None
+        if cache_config.get('enabled', False):
+            result_cache = ResultCache(
+                max_bytes=int(cache_config.get('memory_mb', 64)) * 1024**2,
+                db_path=cache_config.get('db_path'),
+            )
+        grounding_model = model_config.get('grounding_model')
+        # 配置中的权重文件不存在时交给模型类回退处理
+        if grounding_model and not os.path.exists(grounding_model):
+            grounding_model = None
+        return cls(
+            device=device or model_config.get('device', "cuda"),
+            grounding_model=grounding_model,
+            blip2_model=model_config.get('blip2_model', "Salesforce/blip2-opt-2.7b"),
+            precision=model_config.get('precision', "fp16"),
+            task_config=config.get('tasks', {}),
+            serving_config=config.get('serving', {}),
+            result_cache=result_cache,
+            quantized_cache_dir=model_config.get('quantized_cache_dir'),
+        )
+
+    def get_task(self, name: str):
+        """获取任务实例，首次使用时加载模型"""
+        if name not in TASKS:
+            raise RequestError(f"未知任务: {name}，可选: {', '.join(TASKS)}")
+
+        with self._lock:
+            task = self._tasks.get(name)
+            if task is None:
+                if name == "grounding":
+                    from ..tasks.grounding import GroundingTask
+                    task = GroundingTask(model_path=self.grounding_model,
+                                         device=self.device,
+                                         model=self.models.get('grounding_dino'))
+                elif name == "counting":
+                    from ..tasks.counting import CountingTask
+                    task = CountingTask(model_path=self.grounding_model,
+                                        device=self.device,
+                                        model=self.models.get('grounding_dino'))
+                else:
+                    from ..tasks.vqa import VQATask
+                    task = VQATask(model_name=self.blip2_model,
+                                   device=self.device,
+                                   precision=self.precision,
+                                   quantized_cache_dir=self.quantized_cache_dir,
+                                   model=self.models.get('blip2'),
+                                   decoding=self._decoding({}),
+                                   max_batch_size=self.task_config.get('vqa', {}).get(
+                                       'max_batch_size'),
+                                   config_path=None)
+                self._tasks[name] = task
+            return task
+
+    def get_scene_index(self):
+        """
+        获取场景索引（tasks.scene_index.enabled 为 true 时），未启用时返回 None
+
+        启用后 grounding/counting 请求由索引回答，不再逐条调用模型。
+        """
+        config = self.task_config.get('scene_index', {})
+        if not config.get('enabled', False):
+            return None
+
+        with self._lock:
+            if self.scene_index is None:
+                from ..tasks.scene_index import SceneIndex
+                self.scene_index = SceneIndex(
+                    model_path=self.grounding_model,
+                    device=self.device,
+                    vocabulary=config.get('vocabulary'),
+                    index_threshold=config.get('index_threshold', 0.1),
+                    max_images=config.get('max_images', 1024),
+                    index_path=config.get('index_path'),
+                    model=self.models.get('grounding_dino'),
+                )
+            return self.scene_index
+
+    def _scene_index_batch(self, items: List[tuple]) -> List[Detections]:
+        """经场景索引批量查询，items 格式同 _detect_batch"""
+        from ..tasks.scene_index import parse_object_names
+        index = self.get_scene_index()
+        return [index.query(parse_object_names(caption), image, threshold)
+                for image, caption, threshold in items]
+
+    def enable_batching(self, max_batch_size: int = None, max_wait_ms: float = None,
+                        max_queue_size: int = None):
+        """
+        启用动态批处理：并发请求按模型排队并合并为批量推理
+
+        参数未指定时读取 serving 配置。
+        """
+        from .scheduler import BatchScheduler, SchedulerThread
+
+        config = self.serving_config
+        scheduler = BatchScheduler(
+            max_batch_size=max_batch_size or config.get('max_batch_size', 8),
+            max_wait_ms=max_wait_ms if max_wait_ms is not None
+            else config.get('max_wait_ms', 10.0),
+            max_queue_size=max_queue_size or config.get('max_queue_size', 256),
+        )
+        self.scheduler = SchedulerThread(scheduler)
+        self.scheduler.register("grounding_dino", self._detect_batch)
+        self.scheduler.register("blip2", self._answer_batch)
+
+    def _detect_batch(self, items: List[tuple]) -> List[Detections]:
+        """批量检测，items 为 (image, caption, box_threshold) 列表"""
+        model = self.get_task("grounding").model
+        results = [None] * len(items)
+        # detect_batch 只接受单个阈值，按阈值分组
+        groups = {}
+        for i, (_, _, threshold) in enumerate(items):
+            groups.setdefault(threshold, []).append(i)
+        for threshold, indices in groups.items():
+            detections = model.detect_batch(
+                [items[i][0] for i in indices],
+                [items[i][1] for i in indices],
+                box_threshold=threshold,
+                max_batch_size=len(indices)
+            )
+            for i, dets in zip(indices, detections):
+                results[i] = dets
+        return results
+
+    def _answer_batch(self, items: List[tuple]) -> List[str]:
+        """批量问答，items 为 (image, question, decoding) 列表"""
+        task = self.get_task("vqa")
+        model = task.model
+        results = [None] * len(items)
+        # 一次 generate 只能使用一种解码配置，按配置分组
+        groups = {}
+        for i, (_, _, decoding) in enumerate(items):
+            groups.setdefault(decoding_key(decoding), []).append(i)
+        for indices in groups.values():
+            answers = model.answer_batch(
+                [items[i][0] for i in indices],
+                [items[i][1] for i in indices],
+                max_batch_size=task.max_batch_size,
+                decoding=items[indices[0]][2]
+            )
+            for i, answer in zip(indices, answers):
+                results[i] = answer
+        return results
+
+    def _model_version(self, name: str) -> str:
+        """结果缓存使用的模型版本标识（模型、精度与代码版本）"""
+        from .. import __version__
+        injected = self.models.get("blip2" if name == "vqa" else "grounding_dino")
+        if injected is not None:
+            return f"{getattr(injected, 'version', type(injected).__name__)}:{__version__}"
+        if name == "vqa":
+            return f"blip2:{self.blip2_model}:{self.precision}:{__version__}"
+        version = f"groundingdino:{self.grounding_model}:{__version__}"
+        if self.task_config.get('scene_index', {}).get('enabled', False):
+            version += ":scene_index"
+        return version
+
+    def _cache_key(self, name: str, request: Dict, image: Image.Image) -> str:
+        if name == "vqa":
+            params = {'decoding': decoding_key(self._decoding(request))}
+        else:
+            params = {'threshold': self._threshold(name, request)}
+        return ResultCache.make_key(image_hash(image), name, request.get("text", ""),
+                                    params, self._model_version(name))
+
+    def _threshold(self, name: str, request: Dict) -> float:
+        """请求中的阈值优先，其次是配置文件，最后是默认值 0.3"""
+        if request.get("threshold") is not None:
+            return float(request["threshold"])
+        return float(self.task_config.get(name, {}).get('threshold', 0.3))
+
+    def _deadline_ms(self, request: Dict) -> Optional[float]:
+        """请求中的 deadline_ms 优先，其次是 serving.deadline_ms，None 表示不限"""
+        deadline_ms = request.get("deadline_ms")
+        if deadline_ms is None:
+            deadline_ms = self.serving_config.get('deadline_ms')
+        if deadline_ms is None:
+            return None
+        try:
+            deadline_ms = float(deadline_ms)
+        except (TypeError, ValueError):
+            raise RequestError(f"deadline_ms 应为数值（毫秒）: {deadline_ms!r}")
+        if not deadline_ms > 0:
+            raise RequestError(f"deadline_ms 必须为正数: {deadline_ms}")
+        return deadline_ms
+
+    def _decoding(self, request: Dict) -> Dict:
+        """
+        VQA 解码配置：请求中的配置名优先，其次是 tasks.vqa.decoding，最后是模型默认值
+
+        请求只能选择预定义的配置名（见 src.models.decoding），不能直接传 generate 参数。
+        """
+        decoding = request.get("decoding")
+        if decoding is not None and not isinstance(decoding, str):
+            raise RequestError(f"decoding 应为解码配置名: {decoding!r}")
+        if decoding is None:
+            decoding = self.task_config.get('vqa', {}).get('decoding')
+        try:
+            return resolve_decoding(decoding)
+        except ValueError as e:
+            raise RequestError(str(e))
+
+    def handle(self, request: Dict) -> Dict:
+        """
+        处理单个请求
+
+        Args:
+            request: 字典，包含
+                task: "grounding" / "counting" / "vqa"
+                image 或 image_b64: 图像
+                text: 文本提示（grounding/counting）或问题（vqa）
+                threshold: 可选，检测阈值
+                decoding: 可选，VQA 解码配置名（greedy / greedy-short / beam3 / beam<N> / sampling）
+                deadline_ms: 可选，启用批处理调度时的截止时间（毫秒，正数）
+
+        Returns:
+            grounding: {'task', 'text', 'results': [...]}
+            counting:  {'task', 'text', 'count': int}
+            vqa:       {'task', 'text', 'answer': str}
+            'meta': {'cache': "memory" / "disk" / None（启用结果缓存时）,
+                     'coalesced': 是否与进行中的相同请求合并}
+        """
+        if not isinstance(request, dict):
+            raise RequestError("请求必须是 JSON 对象")
+
+        name = request.get("task")
+        task = self.get_task(name)
+        text = request.get("text", "")
+        if not text:
+            raise RequestError(f"{name} 任务需要 text 字段")
+        if name == "vqa":
+            self._decoding(request)
+        self._deadline_ms(request)
+
+        profiler = get_profiler()
+        with profiler.stage("request.decode_image"):
+            image = decode_image(request)
+        response = {'task': name, 'text': text}
+        field = RESULT_FIELDS[name]
+
+        key = None
+        meta = {}
+        if self.result_cache is not None or self.inflight is not None:
+            key = self._cache_key(name, request, image)
+        if self.result_cache is not None:
+            cached, tier = self.result_cache.get(key)
+            if tier is not None:
+                profiler.increment(f"result_cache.{tier}_hits")
+                response[field] = cached
+                response['meta'] = {'cache': tier, 'coalesced': False}
+                return response
+            meta['cache'] = None
+
+        scene_index = self.get_scene_index() if name != "vqa" else None
+
+        def compute():
+            result = {}
+            with profiler.stage(f"request.{name}"):
+                if scene_index is not None:
+                    self._handle_direct(name, scene_index, text, image, request, result)
+                elif self.scheduler is not None:
+                    self._handle_batched(name, text, image, request, result)
+                else:
+                    self._handle_direct(name, task, text, image, request, result)
+            if self.result_cache is not None:
+                self.result_cache.put(key, result[field])
+            return result[field]
+
+        if self.inflight is not None:
+            # 合并后的请求共享首个请求的计算（包括其 deadline_ms）
+            response[field], meta['coalesced'] = self.inflight.do(key, compute)
+        else:
+            response[field] = compute()
+        if meta:
+            response['meta'] = meta
+        return response
+
+    def _handle_direct(self, name: str, task, text: str, image: Image.Image,
+                       request: Dict, response: Dict) -> Dict:
+        """直接调用任务接口"""
+        if name == "grounding":
+            response['results'] = task.ground(
+                text, image, box_threshold=self._threshold(name, request)
+            ).to_list()
+        elif name == "counting":
+            response['count'] = task.count(
+                text, image, threshold=self._threshold(name, request)
+            )
+        else:
+            response['answer'] = task.answer(text, image, decoding=self._decoding(request))
+
+        return response
+
+    def handle_batch(self, requests: List[Dict], images: List[Image.Image]) -> List[Dict]:
+        """
+        批量处理已解码图像的请求
+
+        检测类请求（grounding/counting）合并为一次 detect_batch，
+        VQA 请求合并为一次 answer_batch。单个请求出错时返回
+        {'id', 'task', 'error'}，不影响其他请求。
+
+        Args:
+            requests: 请求列表，格式同 handle（可带 id 字段）
+            images: 与 requests 一一对应的 PIL 图像
+
+        Returns:
+            响应列表，顺序与输入一致，请求带 id 时响应也带 id
+        """
+        responses = [None] * len(requests)
+        detect_items, detect_indices = [], []
+        vqa_items, vqa_indices = [], []
+        keys = [None] * len(requests)
+
+        for i, (request, image) in enumerate(zip(requests, images)):
+            name = request.get("task")
+            text = request.get("text", "")
+            response = {'task': name, 'text': text}
+            if "id" in request:
+                response = {'id': request["id"], **response}
+            responses[i] = response
+
+            if name not in TASKS:
+                response['error'] = f"未知任务: {name}"
+            elif not text:
+                response['error'] = f"{name} 任务需要 text 字段"
+            elif name == "vqa" and self._decoding_error(request, response):
+                continue
+            elif self.result_cache is not None and self._lookup(i, request, image,
+                                                                  response, keys):
+                continue
+            elif name == "vqa":
+                vqa_items.append((image, text, self._decoding(request)))
+                vqa_indices.append(i)
+            else:
+                detect_items.append((image, text, self._threshold(name, request)))
+                detect_indices.append(i)
+
+        detect_fn = (self._scene_index_batch if self.get_scene_index() is not None
+                     else self._detect_batch)
+        profiler = get_profiler()
+        for items, indices, batch_fn, stage in (
+                (detect_items, detect_indices, detect_fn, "request.detect_batch"),
+                (vqa_items, vqa_indices, self._answer_batch, "request.vqa_batch")):
+            if not items:
+                continue
+            try:
+                with profiler.stage(stage, batch=len(items)):
+                    outputs = batch_fn(items)
+            except Exception as e:
+                for i in indices:
+                    responses[i]['error'] = f"推理失败: {e}"
+                continue
+            for i, item, output in zip(indices, items, outputs):
+                response = responses[i]
+                if response['task'] == "grounding":
+                    response['results'] = output.to_list()
+                elif response['task'] == "counting":
+                    response['count'] = len(output.filter(item[2]))
+                else:
+                    response['answer'] = output
+                if keys[i] is not None:
+                    self.result_cache.put(keys[i], response[RESULT_FIELDS[response['task']]])
+                    response['meta'] = {'cache': None}
+
+        return responses
+
+    def _decoding_error(self, request: Dict, response: Dict) -> bool:
+        """解码配置无效时在响应中记录错误并返回 True"""
+        try:
+            self._decoding(request)
+        except RequestError as e:
+            response['error'] = str(e)
+            return True
+        return False
+
+    def _lookup(self, i: int, request: Dict, image: Image.Image,
+                response: Dict, keys: List) -> bool:
+        """查询结果缓存，命中时填充响应并返回 True，否则记录缓存键"""
+        name = response['task']
+        key = self._cache_key(name, request, image)
+        cached, tier = self.result_cache.get(key)
+        if tier is not None:
+            response[RESULT_FIELDS[name]] = cached
+            response['meta'] = {'cache': tier}
+            return True
+        keys[i] = key
+        return False
+
+    def _handle_batched(self, name: str, text: str, image: Image.Image,
+                        request: Dict, response: Dict) -> Dict:
+        """经调度器排队，与其他并发请求合并为批量推理"""
+        deadline_ms = self._deadline_ms(request)
+
+        if name == "vqa":
+            response['answer'] = self.scheduler.submit(
+                "blip2", (image, text, self._decoding(request)), deadline_ms
+            )
+            return response
+
+        threshold = self._threshold(name, request)
+        results = self.scheduler.submit(
+            "grounding_dino", (image, text, threshold), deadline_ms
+        )
+        if name == "grounding":
+            response['results'] = results.to_list()
+        else:
+            response['count'] = len(results.filter(threshold))
+        return response
+
+    def health(self) -> Dict:
+        """服务状态：已加载的任务与模型统计"""
+        from ..models.registry import get_registry
+        health = {
+            'status': "ok",
+            'tasks': sorted(self._tasks),
+            'models': get_registry().stats(),
+        }
+        caches = {}
+        for name in ("grounding", "counting"):
+            if name in self._tasks:
+                caches['grounding_text'] = self._tasks[name].model.text_cache_stats()
+        if "vqa" in self._tasks:
+            caches['blip2_image'] = self._tasks["vqa"].model.embedding_cache.stats()
+        if self.result_cache is not None:
+            caches['results'] = self.result_cache.stats()
+        if caches:
+            health['caches'] = caches
+        if self.scene_index is not None:
+            health['scene_index'] = self.scene_index.stats()
+        if self.inflight is not None:
+            health['coalescing'] = self.inflight.stats()
+        if self.scheduler is not None:
+            health['scheduler'] = self.scheduler.stats()
+        health['profiling'] = get_profiler().enabled
+        return health
+
+    def close(self):
+        """释放所有任务持有的模型"""
+        if self.scheduler is not None:
+            self.scheduler.close()
+            self.scheduler = None
+        if self.result_cache is not None:
+            self.result_cache.close()
+        if self.scene_index is not None:
+            if self.scene_index.index_path:
+                self.scene_index.save()
+            self.scene_index.close()
+            self.scene_index = None
+        with self._lock:
+            for task in self._tasks.values():
+                task.close()
+            self._tasks.clear()
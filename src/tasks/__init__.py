@@ -1,11 +1,16 @@
 """
 任务模块
-"""
-
-from .grounding import GroundingTask
-from .counting import CountingTask
-from .vqa import VQATask
 
-__all__ = ['GroundingTask', 'CountingTask', 'VQATask']
+任务类按需导入，导入本包本身不会加载模型依赖
+"""
+from ..utils.lazy import lazy_exports
 
+# 公开名称 -> 所在子模块
+_LAZY_ATTRS = {
+    'GroundingTask': 'grounding',
+    'CountingTask': 'counting',
+    'VQATask': 'vqa',
+    'SceneIndex': 'scene_index',
+}
 
+__getattr__, __dir__, __all__ = lazy_exports(__name__, _LAZY_ATTRS)
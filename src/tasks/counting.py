@@ -1,24 +1,38 @@
 """
 Counting 任务：统计图像中物体的数量
 """
+import numpy as np
 from PIL import Image
 from typing import Union
 import os
 from ..models.grounding_dino import GroundingDINOModel
+from ..models.registry import get_registry
 
 
 class CountingTask:
     """Counting 任务类"""
     
-    def __init__(self, model_path: str = None, device: str = "cuda"):
+    def __init__(self, model_path: str = None, device: str = "cuda", model=None):
         """
         初始化 Counting 任务
         
         Args:
             model_path: Grounding DINO 模型路径
             device: 设备类型
+            model: 可选，直接使用的模型实例（接口同 GroundingDINOModel），
+                   不经过注册表，如基准测试中的替身模型
         """
-        self.model = GroundingDINOModel(model_path=model_path, device=device)
+        self._shared = model is None
+        self.model = model if model is not None else get_registry().acquire(
+            GroundingDINOModel, model_path=model_path, device=device
+        )
+    
+    def close(self):
+        """释放对共享模型的引用"""
+        if self.model is not None:
+            if self._shared:
+                get_registry().release(self.model)
+            self.model = None
     
     def count(self, object_name: str, image: Union[str, Image.Image],
               threshold: float = 0.3) -> int:
@@ -47,19 +61,24 @@ class CountingTask:
             box_threshold=threshold
         )
         
-        # 统计数量
-        count = len([r for r in results if r['score'] >= threshold])
+        # 统计数量（detect 已按类别做 NMS，重叠的重复框只计一次）
+        count = len(results.filter(threshold))
         
         return count
     
     def count_multiple(self, object_names: list, 
-                      image: Union[str, Image.Image]) -> dict:
+                      image: Union[str, Image.Image],
+                      threshold: float = 0.3,
+                      single_pass: bool = True) -> dict:
         """
         统计多个物体的数量
         
         Args:
             object_names: 物体名称列表
             image: 图像路径或 PIL Image 对象
+            threshold: 检测阈值
+            single_pass: 是否将所有名称合并为一个提示只做一次检测
+                         （超出文本长度上限时自动分块）
             
         Returns:
             字典，键为物体名称，值为数量
@@ -67,10 +86,27 @@ class CountingTask:
         if isinstance(image, str):
             image = Image.open(image).convert('RGB')
         
-        counts = {}
-        for obj_name in object_names:
-            counts[obj_name] = self.count(obj_name, image)
+        if not single_pass:
+            counts = {}
+            for obj_name in object_names:
+                counts[obj_name] = self.count(obj_name, image, threshold)
+            return counts
+        
+        counts = {obj_name: 0 for obj_name in object_names}
+        for caption in self.model.build_captions(object_names):
+            results = self.model.detect(
+                image=image,
+                text_prompt=caption,
+                box_threshold=threshold
+            )
+            
+            # 按短语将检测结果拆分到各个物体名称（只对标签表做匹配）
+            results = results.filter(threshold).map_labels(
+                lambda phrase: self.model.match_label(phrase, object_names)
+            )
+            for obj_name, n in zip(results.label_names,
+                                   np.bincount(results.label_ids,
+                                               minlength=len(results.label_names))):
+                counts[obj_name] += int(n)
         
         return counts
-
-
@@ -5,23 +5,37 @@ from PIL import Image
 from typing import List, Dict, Union
 import os
 from ..models.grounding_dino import GroundingDINOModel
+from ..models.registry import get_registry
+from ..utils.detections import Detections
 
 
 class GroundingTask:
     """Grounding 任务类"""
     
-    def __init__(self, model_path: str = None, device: str = "cuda"):
+    def __init__(self, model_path: str = None, device: str = "cuda", model=None):
         """
         初始化 Grounding 任务
         
         Args:
             model_path: Grounding DINO 模型路径
             device: 设备类型
+            model: 可选，直接使用的模型实例（接口同 GroundingDINOModel），
+                   不经过注册表，如基准测试中的替身模型
         """
-        self.model = GroundingDINOModel(model_path=model_path, device=device)
+        self._shared = model is None
+        self.model = model if model is not None else get_registry().acquire(
+            GroundingDINOModel, model_path=model_path, device=device
+        )
+    
+    def close(self):
+        """释放对共享模型的引用"""
+        if self.model is not None:
+            if self._shared:
+                get_registry().release(self.model)
+            self.model = None
     
     def ground(self, text_prompt: str, image: Union[str, Image.Image],
-               box_threshold: float = 0.3) -> List[Dict]:
+               box_threshold: float = 0.3) -> Detections:
         """
         对图像中的物体进行定位
         
@@ -31,7 +45,7 @@ class GroundingTask:
             box_threshold: 边界框阈值
             
         Returns:
-            检测结果列表
+            检测结果（Detections，可按字典列表方式迭代）
         """
         # 加载图像
         if isinstance(image, str):
@@ -49,7 +63,7 @@ class GroundingTask:
         return results
     
     def ground_multiple(self, text_prompts: List[str], 
-                       image: Union[str, Image.Image]) -> Dict[str, List[Dict]]:
+                       image: Union[str, Image.Image]) -> Dict[str, Detections]:
         """
         对多个物体进行定位
         
@@ -0,0 +1,235 @@
+"""
+场景索引：每张图像只用家居词表检测一次，之后的 grounding/counting 查询直接查索引
+
+- 词表内的物体按阈值过滤索引中的检测结果，不调用模型
+- 词表外的物体实时检测，结果合并进该图像的索引
+- 可保存为 JSON，供离线评估重复使用
+"""
+import base64
+import json
+import os
+import threading
+from typing import Dict, List, Union
+
+from PIL import Image
+
+from ..models.grounding_dino import GroundingDINOModel
+from ..models.registry import get_registry
+from ..utils.cache import LRUCache, image_hash
+from ..utils.detections import Detections
+
+
+DEFAULT_VOCABULARY = [
+    "chair", "table", "sofa", "bed", "lamp", "television", "monitor",
+    "keyboard", "cup", "bottle", "bowl", "plate", "book", "pillow",
+    "cabinet", "door", "window", "sink", "refrigerator", "plant",
+]
+
+
+def parse_object_names(text_prompt: str) -> List[str]:
+    """
+    从文本提示中拆出物体名称
+
+    Args:
+        text_prompt: 如 "chair . table" 或 "chair, table"
+
+    Returns:
+        规范化（小写、去重、保持顺序）的物体名称列表
+    """
+    names = []
+    for part in text_prompt.replace(",", ".").split("."):
+        name = " ".join(part.lower().split())
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+class SceneIndex:
+    """场景索引类"""
+
+    def __init__(self, model_path: str = None, device: str = "cuda",
+                 vocabulary: List[str] = None, index_threshold: float = 0.1,
+                 max_images: int = 1024, index_path: str = None, model=None):
+        """
+        初始化场景索引
+
+        Args:
+            model_path: Grounding DINO 模型路径
+            device: 设备类型
+            vocabulary: 建索引时检测的物体名称，默认 DEFAULT_VOCABULARY
+            index_threshold: 建索引时的最低分数，低于此值的查询阈值回退实时检测
+            max_images: 内存中保留的图像索引数（LRU 淘汰）
+            index_path: 索引文件路径，存在时加载
+            model: 可选，直接使用的模型实例（接口同 GroundingDINOModel）
+        """
+        self._shared = model is None
+        self.model = model if model is not None else get_registry().acquire(
+            GroundingDINOModel, model_path=model_path, device=device
+        )
+        self.vocabulary = parse_object_names(" . ".join(vocabulary or DEFAULT_VOCABULARY))
+        self.index_threshold = index_threshold
+        # 每张图像一个条目: {'objects': 已检测过的名称列表, 'detections': Detections}
+        self._entries = LRUCache(max_images, sizeof=lambda entry: 1)
+        self._lock = threading.Lock()
+        self.index_path = index_path
+        if index_path and os.path.exists(index_path):
+            self.load(index_path)
+
+    def close(self):
+        """释放对共享模型的引用"""
+        if self.model is not None:
+            if self._shared:
+                get_registry().release(self.model)
+            self.model = None
+
+    def _detect(self, image: Image.Image, object_names: List[str],
+                threshold: float) -> Detections:
+        """实时检测一组物体，标签映射为物体名称"""
+        parts = []
+        for caption in self.model.build_captions(object_names):
+            results = self.model.detect(image=image, text_prompt=caption,
+                                        box_threshold=threshold)
+            parts.append(Detections.from_list(results).filter(threshold).map_labels(
+                lambda phrase: self.model.match_label(phrase, object_names)
+            ))
+        return Detections.concat(parts)
+
+    def _entry(self, image: Image.Image, object_names: List[str]) -> Dict:
+        """获取图像的索引条目，补齐尚未检测过的物体"""
+        key = image_hash(image)
+        entry = self._entries.get(key)
+        if entry is None:
+            detections = self._detect(image, self.vocabulary, self.index_threshold)
+            entry = {'objects': list(self.vocabulary), 'detections': detections}
+            self._entries.put(key, entry)
+
+        missing = [name for name in object_names if name not in entry['objects']]
+        if missing:
+            detections = self._detect(image, missing, self.index_threshold)
+            with self._lock:
+                missing = [name for name in missing if name not in entry['objects']]
+                entry['detections'] = Detections.concat(
+                    [entry['detections'], detections.filter(labels=missing)]
+                )
+                entry['objects'].extend(missing)
+        return entry
+
+    def index_image(self, image: Union[str, Image.Image]) -> str:
+        """
+        为图像建立索引（已索引时直接返回）
+
+        Returns:
+            图像内容哈希
+        """
+        image = _load(image)
+        self._entry(image, [])
+        return image_hash(image)
+
+    def query(self, object_names: List[str], image: Union[str, Image.Image],
+              threshold: float = 0.3) -> Detections:
+        """
+        查询图像中指定物体的检测结果
+
+        Args:
+            object_names: 物体名称列表
+            image: 图像路径或 PIL Image 对象
+            threshold: 分数阈值
+
+        Returns:
+            Detections，label 为物体名称
+        """
+        image = _load(image)
+        names = parse_object_names(" . ".join(object_names))
+        if threshold < self.index_threshold:
+            # 索引中没有低于 index_threshold 的结果，只能实时检测
+            return self._detect(image, names, threshold)
+
+        entry = self._entry(image, names)
+        return entry['detections'].filter(threshold, labels=names)
+
+    def ground(self, text_prompt: str, image: Union[str, Image.Image],
+               box_threshold: float = 0.3) -> Detections:
+        """接口同 GroundingTask.ground"""
+        return self.query(parse_object_names(text_prompt), image, box_threshold)
+
+    def count(self, object_name: str, image: Union[str, Image.Image],
+              threshold: float = 0.3) -> int:
+        """接口同 CountingTask.count"""
+        return len(self.query([object_name], image, threshold))
+
+    def count_multiple(self, object_names: List[str], image: Union[str, Image.Image],
+                       threshold: float = 0.3) -> Dict[str, int]:
+        """接口同 CountingTask.count_multiple"""
+        counts = {name: 0 for name in object_names}
+        normalized = {name: parse_object_names(name)[0] for name in object_names
+                      if parse_object_names(name)}
+        labels = self.query(list(normalized.values()), image, threshold).labels
+        for name, key in normalized.items():
+            counts[name] = labels.count(key)
+        return counts
+
+    def save(self, path: str = None):
+        """
+        将索引保存为 JSON（检测结果以 Detections 二进制格式经 base64 编码）
+
+        Args:
+            path: 输出路径，默认使用 index_path
+        """
+        path = path or self.index_path
+        with self._lock:
+            payload = {
+                'vocabulary': self.vocabulary,
+                'index_threshold': self.index_threshold,
+                'images': {
+                    key: {
+                        'objects': entry['objects'],
+                        'detections': base64.b64encode(
+                            entry['detections'].to_bytes()).decode('ascii'),
+                    }
+                    for key, entry in self._entries.items()
+                },
+            }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        """
+        加载 JSON 索引；建索引阈值不同时跳过（避免遗漏低分结果）
+
+        Args:
+            path: 索引文件路径
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        if payload.get('index_threshold') != self.index_threshold:
+            print(f"警告: 索引文件阈值 {payload.get('index_threshold')} 与当前 "
+                  f"{self.index_threshold} 不一致，不加载 {path}")
+            return
+        for key, entry in payload.get('images', {}).items():
+            self._entries.put(key, {
+                'objects': entry['objects'],
+                'detections': Detections.from_bytes(base64.b64decode(entry['detections'])),
+            })
+        print(f"已加载场景索引: {len(payload.get('images', {}))} 张图像")
+
+    def stats(self) -> Dict:
+        """索引统计：图像数、词表大小及命中率"""
+        stats = self._entries.stats()
+        return {
+            'images': stats['entries'],
+            'vocabulary': len(self.vocabulary),
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'hit_rate': stats['hit_rate'],
+        }
+
+
+def _load(image: Union[str, Image.Image]) -> Image.Image:
+    if isinstance(image, str):
+        if not os.path.exists(image):
+            raise FileNotFoundError(f"图像文件不存在: {image}")
+        image = Image.open(image).convert('RGB')
+    return image
@@ -2,39 +2,70 @@
 VQA 任务：视觉问答
 """
 from PIL import Image
-from typing import Union
+from typing import Dict, Union, List, Optional
 import os
 from ..models.blip2 import BLIP2Model
+from ..models.registry import get_registry
+from ..utils.config import load_config
 
 
 class VQATask:
     """VQA 任务类"""
     
     def __init__(self, model_name: str = "Salesforce/blip2-opt-2.7b",
-                 device: str = "cuda", precision: str = "fp16"):
+                 device: str = "cuda", precision: str = "fp16", model=None,
+                 quantized_cache_dir: str = None,
+                 decoding: Union[str, Dict, None] = None,
+                 max_batch_size: Optional[int] = None,
+                 config_path: Optional[str] = "config.yaml"):
         """
         初始化 VQA 任务
         
         Args:
             model_name: BLIP-2 模型名称
             device: 设备类型
-            precision: 精度类型
+            precision: 精度类型（fp16 / fp32 / bf16 / int8 / int8-qformer）
+            model: 可选，直接使用的模型实例（接口同 BLIP2Model），不经过注册表
+            quantized_cache_dir: int8 量化模型的缓存目录
+            decoding: 回答问题使用的解码配置（见 src.models.decoding），
+                      None 时使用配置文件的 tasks.vqa.decoding（与推理服务一致），
+                      仍未设置则为模型默认的 beam3；describe 始终使用模型默认配置
+            max_batch_size: answer_batch 单次生成的最大样本数，None 时使用配置文件的
+                            tasks.vqa.max_batch_size，仍未设置则为 8
+            config_path: 读取 tasks.vqa 配置的文件，None 表示不读取
         """
-        self.model = BLIP2Model(
-            model_name=model_name,
+        vqa_config = {}
+        if config_path and (decoding is None or max_batch_size is None):
+            vqa_config = load_config(config_path).get('tasks', {}).get('vqa', {})
+        self.decoding = decoding if decoding is not None else vqa_config.get('decoding')
+        self.max_batch_size = int(max_batch_size or vqa_config.get('max_batch_size', 8))
+        self._shared = model is None
+        self.model = model if model is not None else get_registry().acquire(
+            BLIP2Model,
+            model_path=model_name,
             device=device,
-            precision=precision
+            precision=precision,
+            quantized_cache_dir=quantized_cache_dir
         )
     
+    def close(self):
+        """释放对共享模型的引用"""
+        if self.model is not None:
+            if self._shared:
+                get_registry().release(self.model)
+            self.model = None
+    
     def answer(self, question: str, image: Union[str, Image.Image],
-               max_length: int = 50) -> str:
+               max_length: Optional[int] = None,
+               decoding: Union[str, Dict, None] = None) -> str:
         """
         回答关于图像的问题
         
         Args:
             question: 问题文本
             image: 图像路径或 PIL Image 对象
-            max_length: 最大答案长度
+            max_length: 可选，提示与答案合计的最大长度
+            decoding: 可选，覆盖任务的解码配置
             
         Returns:
             答案文本
@@ -46,10 +77,43 @@ class VQATask:
             image = Image.open(image).convert('RGB')
         
         # 生成答案
-        answer = self.model.answer_question(image, question)
+        answer = self.model.answer_question(
+            image, question, max_length=max_length, decoding=decoding or self.decoding
+        )
         
         return answer
     
+    def answer_batch(self, images: List[Union[str, Image.Image]],
+                     questions: List[str], max_batch_size: Optional[int] = None,
+                     decoding: Union[str, Dict, None] = None) -> List[str]:
+        """
+        批量回答问题
+        
+        Args:
+            images: 图像路径或 PIL Image 对象列表（可重复，如同一帧的多个问题）
+            questions: 问题列表，与 images 一一对应
+            max_batch_size: 单次生成的最大样本数，None 时使用任务的 max_batch_size
+            decoding: 可选，覆盖任务的解码配置
+            
+        Returns:
+            答案列表，顺序与输入一致
+        """
+        # 同一路径只加载一次，便于模型识别重复图像
+        loaded = {}
+        pil_images = []
+        for image in images:
+            if isinstance(image, str):
+                if image not in loaded:
+                    if not os.path.exists(image):
+                        raise FileNotFoundError(f"图像文件不存在: {image}")
+                    loaded[image] = Image.open(image).convert('RGB')
+                image = loaded[image]
+            pil_images.append(image)
+        
+        return self.model.answer_batch(pil_images, questions,
+                                       max_batch_size=max_batch_size or self.max_batch_size,
+                                       decoding=decoding or self.decoding)
+    
     def describe(self, image: Union[str, Image.Image]) -> str:
         """
         描述图像内容
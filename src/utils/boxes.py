@@ -0,0 +1,168 @@
+"""
+检测框后处理（NumPy 向量化）
+坐标转换、IoU、按类别 NMS / 框合并
+"""
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+
+def cxcywh_to_xyxy(boxes, image_size: Sequence = None) -> np.ndarray:
+    """
+    将 (cx, cy, w, h) 转换为 (x1, y1, x2, y2)
+
+    Args:
+        boxes: (N, 4) 数组；torch.Tensor 需先 .cpu()
+        image_size: 可选，归一化坐标对应的图像尺寸。(W, H) 表示所有框
+                    使用同一尺寸，(N, 2) 表示逐框尺寸（批量结果）
+
+    Returns:
+        (N, 4) float32 像素坐标，裁剪到图像范围内
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    half = boxes[:, 2:] / 2
+    xyxy = np.concatenate([boxes[:, :2] - half, boxes[:, :2] + half], axis=1)
+    if image_size is not None:
+        size = np.asarray(image_size, dtype=np.float32).reshape(-1, 2)
+        scale = np.tile(size, (1, 2))
+        xyxy = np.clip(xyxy * scale, 0, scale)
+    return xyxy
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    """(N, 4) xyxy 框的面积"""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """
+    两组 xyxy 框的 IoU 矩阵
+
+    Returns:
+        (N, M) 数组
+    """
+    boxes1 = np.asarray(boxes1, dtype=np.float32).reshape(-1, 4)
+    boxes2 = np.asarray(boxes2, dtype=np.float32).reshape(-1, 4)
+    lt = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    rb = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    union = box_area(boxes1)[:, None] + box_area(boxes2)[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def batched_nms(boxes, scores, groups=None, iou_threshold: float = 0.5,
+                merge: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按组（类别、图像）的贪心 NMS
+
+    不同组的框平移到互不重叠的区域后一次处理，循环次数等于保留的框数，
+    每次对剩余候选做向量化 IoU。安装了 torchvision 且不合并框时
+    直接调用 torchvision.ops.batched_nms。
+
+    Args:
+        boxes: (N, 4) xyxy
+        scores: (N,)
+        groups: 可选 (N,) 整数组号，只在同组内抑制
+        iou_threshold: IoU 超过该值的低分框被抑制
+        merge: 为 True 时，保留框的坐标替换为它与被抑制框按分数加权的平均
+
+    Returns:
+        (keep, boxes)：保留的索引（按分数降序）及对应的框
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64), boxes
+
+    if not merge:
+        try:
+            # torchvision 可用时使用其 C++/CUDA 实现，结果与下方 NumPy 版本一致
+            import torch
+            from torchvision.ops import batched_nms as tv_batched_nms
+            keep = tv_batched_nms(
+                torch.from_numpy(boxes), torch.from_numpy(scores),
+                torch.from_numpy(np.zeros(len(boxes), dtype=np.int64) if groups is None
+                                 else np.asarray(groups, dtype=np.int64).reshape(-1)),
+                iou_threshold
+            ).numpy()
+            return keep, boxes[keep]
+        except ImportError:
+            pass
+
+    # float64 避免组偏移较大时损失坐标精度
+    shifted = boxes.astype(np.float64)
+    if groups is not None:
+        groups = np.asarray(groups, dtype=np.int64).reshape(-1)
+        offset = float(boxes.max() - min(boxes.min(), 0)) + 1.0
+        shifted = shifted + (groups * offset)[:, None]
+
+    order = np.argsort(-scores, kind='stable')
+    areas = box_area(shifted)
+    keep, merged = [], []
+    remaining = order
+    while remaining.size:
+        i = remaining[0]
+        rest = remaining[1:]
+        lt = np.maximum(shifted[i, :2], shifted[rest, :2])
+        rb = np.minimum(shifted[i, 2:], shifted[rest, 2:])
+        wh = np.clip(rb - lt, 0, None)
+        inter = wh[:, 0] * wh[:, 1]
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        suppressed = iou > iou_threshold
+        keep.append(i)
+        if merge:
+            cluster = np.concatenate([[i], rest[suppressed]])
+            weights = scores[cluster][:, None]
+            merged.append((boxes[cluster] * weights).sum(axis=0) / weights.sum())
+        remaining = rest[~suppressed]
+
+    keep = np.asarray(keep, dtype=np.int64)
+    kept_boxes = np.stack(merged).astype(np.float32) if merge else boxes[keep]
+    return keep, kept_boxes
+
+
+def postprocess_detections(boxes, scores, labels, image_size: Sequence = None,
+                           groups=None, iou_threshold: float = 0.5,
+                           normalized_cxcywh: bool = True,
+                           merge: bool = False) -> Dict[str, np.ndarray]:
+    """
+    检测后处理：批量坐标转换 + 按类别 NMS
+
+    Args:
+        boxes: (N, 4) 原始框
+        scores: (N,) 分数
+        labels: (N,) 整数类别编号
+        image_size: (W, H) 或逐框 (N, 2) 图像尺寸
+        groups: 可选 (N,) 额外分组（如批内图像编号），与 labels 共同决定 NMS 分组
+        iou_threshold: NMS 阈值，None 表示不做 NMS
+        normalized_cxcywh: boxes 是否为模型输出的归一化 cxcywh
+        merge: 是否将被抑制的框加权合并到保留框
+
+    Returns:
+        结构数组字典: {'boxes': (K, 4) float32 像素 xyxy, 'scores': (K,) float32,
+                     'labels': (K,) int64, 'index': (K,) 在输入中的位置}，按分数降序
+    """
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    labels = np.asarray(labels, dtype=np.int64).reshape(-1)
+    if normalized_cxcywh:
+        boxes = cxcywh_to_xyxy(boxes, image_size)
+    else:
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+    if iou_threshold is None:
+        index = np.argsort(-scores, kind='stable')
+        kept_boxes = boxes[index]
+    else:
+        nms_groups = labels
+        if groups is not None:
+            groups = np.asarray(groups, dtype=np.int64).reshape(-1)
+            nms_groups = groups * (labels.max(initial=0) + 1) + labels
+        index, kept_boxes = batched_nms(boxes, scores, nms_groups, iou_threshold, merge)
+
+    return {
+        'boxes': kept_boxes,
+        'scores': scores[index],
+        'labels': labels[index],
+        'index': index,
+    }
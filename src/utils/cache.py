@@ -0,0 +1,224 @@
+"""
+缓存工具
+"""
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+def image_hash(image) -> str:
+    """
+    计算图像内容哈希（基于解码后的像素，而非文件字节）
+
+    Args:
+        image: PIL Image 对象
+
+    Returns:
+        十六进制哈希字符串
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def tensor_nbytes(value) -> int:
+    """估算缓存值占用的字节数（支持 torch.Tensor、numpy 数组及其元组）"""
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_nbytes(v) for v in value)
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return value.element_size() * value.nelement()
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    线程安全的 LRU 缓存，按字节数限制容量
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = tensor_nbytes):
+        """
+        初始化缓存
+
+        Args:
+            max_bytes: 缓存容量上限（字节），为 0 时禁用缓存
+            sizeof: 计算缓存值字节数的函数
+        """
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        """获取缓存值，命中时将其移到最近使用位置"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._data[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存（保留统计信息）"""
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def items(self) -> list:
+        """按从旧到新的顺序返回 (key, value) 快照，不影响命中统计"""
+        with self._lock:
+            return [(key, item[0]) for key, item in self._data.items()]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        """
+        获取缓存统计信息
+
+        Returns:
+            字典，包含 entries, bytes, max_bytes, hits, misses,
+            evictions, hit_rate
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+class ResultCache:
+    """
+    两级结果缓存：内存 LRU + 可选的 SQLite 磁盘存储
+
+    缓存值需可 JSON 序列化（检测结果、数量、答案）。
+    磁盘命中的条目会提升到内存中。
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024**2, db_path: str = None):
+        """
+        初始化结果缓存
+
+        Args:
+            max_bytes: 内存缓存容量（字节）
+            db_path: SQLite 数据库路径，None 表示只使用内存
+        """
+        self.memory = LRUCache(max_bytes, sizeof=lambda v: len(v))
+        self.db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.disk_hits = 0
+        if db_path:
+            import os
+            import sqlite3
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(image_digest: str, task: str, query: str, params: Dict,
+                 model_version: str) -> str:
+        """
+        构造缓存键
+
+        Args:
+            image_digest: 解码后图像的内容哈希（见 image_hash）
+            task: 任务名称
+            query: 文本提示或问题
+            params: 影响结果的参数（阈值等）
+            model_version: 模型及代码版本标识
+        """
+        import json
+        payload = json.dumps([image_digest, task, query, params, model_version],
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+    def get(self, key: str):
+        """
+        查询缓存
+
+        Returns:
+            (value, tier)，tier 为 "memory" / "disk"；未命中时为 (None, None)
+        """
+        import json
+        encoded = self.memory.get(key)
+        if encoded is not None:
+            return json.loads(encoded), "memory"
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value FROM results WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                self.memory.put(key, row[0])
+                return json.loads(row[0]), "disk"
+
+        return None, None
+
+    def put(self, key: str, value: Any):
+        """写入内存缓存，并在启用磁盘存储时持久化"""
+        import json
+        encoded = json.dumps(value, ensure_ascii=False)
+        self.memory.put(key, encoded)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)",
+                    (key, encoded)
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """内存缓存统计以及磁盘命中数"""
+        stats = self.memory.stats()
+        stats['disk_hits'] = self.disk_hits
+        stats['db_path'] = self.db_path
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
@@ -0,0 +1,23 @@
+"""
+配置文件读取
+只依赖标准库和 yaml，命令行脚本解析配置时不必导入 PIL / numpy / torch
+"""
+import os
+from typing import Dict
+
+
+def load_config(config_path: str) -> Dict:
+    """
+    加载 config.yaml，文件不存在时返回空配置
+
+    Args:
+        config_path: 配置文件路径
+
+    Returns:
+        配置字典
+    """
+    if not config_path or not os.path.exists(config_path):
+        return {}
+    import yaml
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
@@ -0,0 +1,193 @@
+"""
+检测结果容器（结构数组）
+boxes / scores / label_ids 为连续的 NumPy 数组，类别名称存放在共享的标签表中
+
+兼容原有的列表形式：迭代、按整数下标取值得到 {'bbox', 'score', 'label'} 字典，
+to_list() 返回完整的字典列表（JSON 输出使用）。
+"""
+import struct
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence
+
+import numpy as np
+
+
+_MAGIC = b"DET1"
+_HEADER = struct.Struct("<4sIII")  # magic, 检测数, 标签数, 标签表字节数
+
+
+class Detections:
+    """检测结果容器"""
+
+    __slots__ = ('boxes', 'scores', 'label_ids', 'label_names')
+
+    def __init__(self, boxes=None, scores=None, label_ids=None,
+                 label_names: Sequence[str] = ()):
+        """
+        Args:
+            boxes: (N, 4) 像素坐标 xyxy
+            scores: (N,) 分数
+            label_ids: (N,) 标签表中的下标
+            label_names: 标签表
+        """
+        self.boxes = np.asarray(boxes if boxes is not None else np.zeros((0, 4)),
+                                dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores if scores is not None else np.zeros(0),
+                                 dtype=np.float32).reshape(-1)
+        self.label_ids = np.asarray(label_ids if label_ids is not None else np.zeros(0),
+                                    dtype=np.int32).reshape(-1)
+        self.label_names = tuple(label_names)
+        if not len(self.boxes) == len(self.scores) == len(self.label_ids):
+            raise ValueError(f"数组长度不一致: boxes={len(self.boxes)}, "
+                             f"scores={len(self.scores)}, label_ids={len(self.label_ids)}")
+
+    @classmethod
+    def from_list(cls, results: Iterable[Dict]) -> "Detections":
+        """由 [{'bbox', 'score', 'label'}, ...] 构建"""
+        if isinstance(results, Detections):
+            return results
+        results = list(results)
+        names = list(dict.fromkeys(r['label'] for r in results))
+        index = {name: i for i, name in enumerate(names)}
+        return cls(
+            np.array([r['bbox'] for r in results], dtype=np.float32).reshape(-1, 4),
+            np.array([r['score'] for r in results], dtype=np.float32),
+            np.array([index[r['label']] for r in results], dtype=np.int32),
+            names,
+        )
+
+    @classmethod
+    def concat(cls, parts: Sequence["Detections"]) -> "Detections":
+        """拼接多个结果，合并标签表"""
+        parts = [Detections.from_list(p) for p in parts]
+        names, remaps = [], []
+        index = {}
+        for part in parts:
+            remap = np.empty(len(part.label_names), dtype=np.int32)
+            for i, name in enumerate(part.label_names):
+                if name not in index:
+                    index[name] = len(names)
+                    names.append(name)
+                remap[i] = index[name]
+            remaps.append(remap)
+        return cls(
+            np.concatenate([p.boxes for p in parts]) if parts else None,
+            np.concatenate([p.scores for p in parts]) if parts else None,
+            np.concatenate([r[p.label_ids] for p, r in zip(parts, remaps)]) if parts else None,
+            names,
+        )
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def _take(self, index) -> "Detections":
+        # 切片得到的是原数组的视图，布尔掩码/整数数组索引会复制
+        result = Detections.__new__(Detections)
+        result.boxes = self.boxes[index]
+        result.scores = self.scores[index]
+        result.label_ids = self.label_ids[index]
+        result.label_names = self.label_names
+        return result
+
+    def __getitem__(self, index):
+        """整数下标返回字典；切片、布尔掩码或下标数组返回 Detections"""
+        if isinstance(index, (int, np.integer)):
+            return {
+                'bbox': self.boxes[index].tolist(),
+                'score': float(self.scores[index]),
+                'label': self.label_names[self.label_ids[index]],
+            }
+        return self._take(index)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.to_list())
+
+    def __repr__(self) -> str:
+        return f"Detections(n={len(self)}, labels={list(self.label_names)})"
+
+    @property
+    def labels(self) -> List[str]:
+        """每个检测的类别名称"""
+        return [self.label_names[i] for i in self.label_ids.tolist()]
+
+    def label_mask(self, names: Iterable[str]) -> np.ndarray:
+        """类别属于 names 的布尔掩码"""
+        names = set(names)
+        table = np.array([name in names for name in self.label_names], dtype=bool)
+        return table[self.label_ids] if len(table) else np.zeros(len(self), dtype=bool)
+
+    def filter(self, threshold: float = None, labels: Iterable[str] = None) -> "Detections":
+        """
+        按分数阈值和类别过滤
+
+        Args:
+            threshold: 保留 score >= threshold 的检测
+            labels: 只保留这些类别
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if threshold is not None:
+            mask &= self.scores >= threshold
+        if labels is not None:
+            mask &= self.label_mask(labels)
+        return self._take(mask)
+
+    def map_labels(self, fn: Callable[[str], str]) -> "Detections":
+        """
+        按标签表逐项映射类别名称（只对标签表调用 fn，不逐个检测处理），
+        映射为 None 的类别被移除
+        """
+        mapped = [fn(name) for name in self.label_names]
+        names = list(dict.fromkeys(name for name in mapped if name is not None))
+        index = {name: i for i, name in enumerate(names)}
+        remap = np.array([index.get(name, -1) for name in mapped], dtype=np.int32)
+        label_ids = remap[self.label_ids] if len(remap) else self.label_ids
+        keep = label_ids >= 0
+        return Detections(self.boxes[keep], self.scores[keep], label_ids[keep], names)
+
+    def to_list(self) -> List[Dict]:
+        """列表形式：[{'bbox': [x1, y1, x2, y2], 'score': float, 'label': str}, ...]"""
+        return [
+            {'bbox': box, 'score': score, 'label': self.label_names[label]}
+            for box, score, label in zip(self.boxes.tolist(), self.scores.tolist(),
+                                         self.label_ids.tolist())
+        ]
+
+    def to_bytes(self) -> bytes:
+        """
+        紧凑二进制序列化
+
+        格式: 头部 (magic, N, 标签数, 标签表字节数) + 标签表（UTF-8，\\0 分隔）
+              + boxes float32 (N, 4) + scores float32 (N,) + label_ids int32 (N,)
+        """
+        table = "\0".join(self.label_names).encode('utf-8')
+        return b"".join([
+            _HEADER.pack(_MAGIC, len(self), len(self.label_names), len(table)),
+            table,
+            np.ascontiguousarray(self.boxes, dtype='<f4').tobytes(),
+            np.ascontiguousarray(self.scores, dtype='<f4').tobytes(),
+            np.ascontiguousarray(self.label_ids, dtype='<i4').tobytes(),
+        ])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Detections":
+        """反序列化 to_bytes 的输出（数组直接引用 data 的缓冲区，只读）"""
+        magic, n, num_labels, table_len = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError("不是 Detections 序列化数据")
+        offset = _HEADER.size
+        table = bytes(data[offset:offset + table_len]).decode('utf-8')
+        offset += table_len
+        boxes = np.frombuffer(data, dtype='<f4', count=n * 4, offset=offset).reshape(n, 4)
+        offset += n * 16
+        scores = np.frombuffer(data, dtype='<f4', count=n, offset=offset)
+        offset += n * 4
+        label_ids = np.frombuffer(data, dtype='<i4', count=n, offset=offset)
+
+        result = cls.__new__(cls)
+        result.boxes, result.scores, result.label_ids = boxes, scores, label_ids
+        result.label_names = tuple(table.split("\0")) if num_labels else ()
+        return result
+
+    @property
+    def nbytes(self) -> int:
+        """数组占用的字节数"""
+        return self.boxes.nbytes + self.scores.nbytes + self.label_ids.nbytes
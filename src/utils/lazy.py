@@ -0,0 +1,39 @@
+"""
+包级名称的按需导入（PEP 562）
+导入包本身不加载子模块，首次访问公开名称时才导入其所在子模块
+"""
+import sys
+from importlib import import_module
+from typing import Callable, Dict, List, Tuple
+
+
+def lazy_exports(module_name: str,
+                 mapping: Dict[str, str]) -> Tuple[Callable, Callable, List[str]]:
+    """
+    生成包的 __getattr__、__dir__ 和 __all__
+
+    用法（在包的 __init__.py 中）::
+
+        __getattr__, __dir__, __all__ = lazy_exports(__name__, {'Name': 'submodule'})
+
+    Args:
+        module_name: 包名（__name__）
+        mapping: 公开名称 -> 所在子模块（相对包名）
+
+    Returns:
+        (__getattr__, __dir__, __all__)
+    """
+    __all__ = list(mapping)
+
+    def __getattr__(name):
+        if name in mapping:
+            value = getattr(import_module(f".{mapping[name]}", module_name), name)
+            # 之后的访问不再经过 __getattr__
+            setattr(sys.modules[module_name], name, value)
+            return value
+        raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[module_name])) | set(__all__))
+
+    return __getattr__, __dir__, __all__
@@ -0,0 +1,444 @@
+"""
+分阶段性能剖析（默认关闭）
+记录 detect / generate 各阶段的墙钟时间、CPU 时间和张量字节数，
+导出 Prometheus 文本格式和 Chrome trace JSON（chrome://tracing 或 Perfetto 打开）
+
+    profiler = get_profiler()
+    profiler.enable()
+    with profiler.stage("detect.preprocess") as stage:
+        tensor = preprocess(image)
+        stage.add_tensor(tensor)
+    print(profiler.to_prometheus())
+    profiler.save_chrome_trace("trace.json")
+
+关闭时 stage() 返回共享的空上下文，只有一次属性判断的开销。
+设置环境变量 HOME_ROBOT_PROFILE=1 时进程启动即开启。
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Sequence
+
+from .cache import tensor_nbytes
+
+
+# 墙钟时间直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILE_ENV = "HOME_ROBOT_PROFILE"
+
+
+def output_nbytes(value, depth: int = 0) -> int:
+    """
+    模块输出中张量的总字节数（支持张量、元组/列表、字典及 ModelOutput）
+
+    Args:
+        value: forward 的返回值
+        depth: 当前递归深度，超过 3 层不再展开
+
+    Returns:
+        字节数，非张量对象计为 0
+    """
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return value.element_size() * value.nelement()
+    if depth >= 3:
+        return 0
+    if isinstance(value, dict):
+        return sum(output_nbytes(v, depth + 1) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(output_nbytes(v, depth + 1) for v in value)
+    return 0
+
+
+class Histogram:
+    """固定桶直方图（桶计数非累积，导出时再累加）"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """按桶内线性插值估计分位数（限制在观测到的最小/最大值之间）"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = max(self.buckets[i - 1] if i > 0 else 0.0, self.min)
+                upper = min(self.buckets[i] if i < len(self.buckets) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+class _StageStats:
+    __slots__ = ('wall', 'cpu_seconds', 'nbytes')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.wall = Histogram(buckets)
+        self.cpu_seconds = 0.0
+        self.nbytes = 0
+
+
+class _NullStage:
+    """关闭剖析时使用的空上下文"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_tensor(self, *tensors):
+        pass
+
+    def add_bytes(self, nbytes: int):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """一次阶段计时"""
+
+    __slots__ = ('profiler', 'name', 'args', 'nbytes', '_start', '_cpu')
+
+    def __init__(self, profiler: "Profiler", name: str, args: Dict):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.nbytes = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        self._cpu = time.thread_time_ns()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler.sync_cuda:
+            _cuda_synchronize()
+        self.profiler._record(self.name, self._start, time.perf_counter_ns() - self._start,
+                              time.thread_time_ns() - self._cpu, self.nbytes, self.args)
+        return False
+
+    def add_tensor(self, *tensors):
+        """累加本阶段产生的张量字节数"""
+        for tensor in tensors:
+            if tensor is not None:
+                self.nbytes += tensor_nbytes(tensor)
+
+    def add_bytes(self, nbytes: int):
+        self.nbytes += int(nbytes)
+
+
+def _cuda_synchronize():
+    try:
+        import torch
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            torch.cuda.synchronize()
+    except ImportError:
+        pass
+
+
+class Profiler:
+    """
+    分阶段计时器
+
+    每个阶段维护墙钟时间直方图、CPU 时间（调用线程，不含 PyTorch 内部线程池）
+    和张量字节数累计；开启 trace 时额外保存最近 max_trace_events 个事件。
+    """
+
+    def __init__(self, enabled: bool = False, trace: bool = True,
+                 max_trace_events: int = 100000, sync_cuda: bool = False,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        初始化剖析器
+
+        Args:
+            enabled: 是否开启
+            trace: 是否记录 Chrome trace 事件
+            max_trace_events: 保留的 trace 事件数上限（环形缓冲）
+            sync_cuda: 阶段结束时同步 CUDA，使 GPU 阶段的墙钟时间准确（降低吞吐）
+            buckets: 墙钟时间直方图的桶上界（秒）
+        """
+        self.enabled = enabled
+        self.trace = trace
+        self.sync_cuda = sync_cuda
+        self.buckets = tuple(buckets)
+        self._events = deque(maxlen=max_trace_events)
+        self._stages = {}
+        self._counters = {}
+        self._thread_names = {}
+        self._lock = threading.Lock()
+        self._epoch_ns = time.perf_counter_ns()
+
+    def configure(self, enabled: bool = None, trace: bool = None,
+                  max_trace_events: int = None, sync_cuda: bool = None):
+        """按 config.yaml 的 profiling 配置调整，None 表示保持不变"""
+        if trace is not None:
+            self.trace = trace
+        if sync_cuda is not None:
+            self.sync_cuda = sync_cuda
+        if max_trace_events is not None and max_trace_events != self._events.maxlen:
+            with self._lock:
+                self._events = deque(self._events, maxlen=max_trace_events)
+        if enabled is not None:
+            self.enabled = enabled
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """清空所有统计和 trace 事件"""
+        with self._lock:
+            self._events.clear()
+            self._stages.clear()
+            self._counters.clear()
+            self._thread_names.clear()
+            self._epoch_ns = time.perf_counter_ns()
+
+    def stage(self, name: str, **args):
+        """
+        阶段计时上下文
+
+        Args:
+            name: 阶段名称，如 "detect.preprocess"
+            **args: 附加到 trace 事件的参数（如批大小）
+
+        Returns:
+            上下文对象，可调用 add_tensor() 记录产生的张量
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, args)
+
+    def increment(self, name: str, value: float = 1):
+        """累加计数器（如处理的图像数）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def _record(self, name: str, start_ns: int, wall_ns: int, cpu_ns: int,
+                nbytes: int, args: Dict):
+        thread = threading.current_thread()
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = _StageStats(self.buckets)
+            stats.wall.observe(wall_ns / 1e9)
+            stats.cpu_seconds += cpu_ns / 1e9
+            stats.nbytes += nbytes
+            if self.trace:
+                self._thread_names[thread.ident] = thread.name
+                self._events.append((name, start_ns, wall_ns, cpu_ns, nbytes,
+                                     thread.ident, args))
+
+    def instrument(self, module, name: str) -> list:
+        """
+        通过 forward 钩子为 torch 模块计时（含输出张量字节数）
+
+        钩子常驻，关闭剖析时只做一次属性判断；同一模块可重入（线程内栈）。
+
+        Args:
+            module: torch.nn.Module
+            name: 阶段名称
+
+        Returns:
+            钩子句柄列表，调用 handle.remove() 可撤销
+        """
+        local = threading.local()
+
+        def pre_hook(mod, inputs):
+            if self.enabled:
+                stack = getattr(local, 'stack', None)
+                if stack is None:
+                    stack = local.stack = []
+                stack.append(_Stage(self, name, {}).__enter__())
+
+        def post_hook(mod, inputs, output):
+            stack = getattr(local, 'stack', None)
+            if stack:
+                stage = stack.pop()
+                stage.add_bytes(output_nbytes(output))
+                stage.__exit__(None, None, None)
+
+        handles = [module.register_forward_pre_hook(pre_hook)]
+        try:
+            # always_call 保证 forward 抛出异常时也出栈
+            handles.append(module.register_forward_hook(post_hook, always_call=True))
+        except TypeError:
+            handles.append(module.register_forward_hook(post_hook))
+        return handles
+
+    def instrument_submodules(self, model, names: Dict[str, str]) -> list:
+        """
+        为模型的若干子模块计时，不存在的属性跳过
+
+        Args:
+            model: torch.nn.Module
+            names: 属性名 -> 阶段名称，如 {'backbone': 'detect.backbone'}
+        """
+        handles = []
+        for attr, stage_name in names.items():
+            module = getattr(model, attr, None)
+            if module is not None and hasattr(module, "register_forward_hook"):
+                handles.extend(self.instrument(module, stage_name))
+        return handles
+
+    def stats(self) -> Dict:
+        """
+        各阶段汇总
+
+        Returns:
+            {'stages': {名称: {calls, wall_ms_total, wall_ms_mean, p50_ms, p95_ms,
+                              cpu_ms_total, bytes_total}}, 'counters': {...}}
+            分位数由直方图桶插值估计
+        """
+        with self._lock:
+            stages = {}
+            for name, stats in sorted(self._stages.items()):
+                wall = stats.wall
+                stages[name] = {
+                    'calls': wall.count,
+                    'wall_ms_total': round(wall.sum * 1000, 3),
+                    'wall_ms_mean': round(wall.sum * 1000 / max(wall.count, 1), 3),
+                    'p50_ms': round(wall.quantile(0.5) * 1000, 3),
+                    'p95_ms': round(wall.quantile(0.95) * 1000, 3),
+                    'cpu_ms_total': round(stats.cpu_seconds * 1000, 3),
+                    'bytes_total': stats.nbytes,
+                }
+            return {'enabled': self.enabled, 'stages': stages,
+                    'counters': dict(sorted(self._counters.items()))}
+
+    def to_prometheus(self, prefix: str = "home_robot") -> str:
+        """
+        导出 Prometheus 文本格式（exposition format 0.0.4）
+
+        Args:
+            prefix: 指标名前缀
+
+        Returns:
+            文本，供 GET /metrics 返回
+        """
+        with self._lock:
+            stages = sorted(self._stages.items())
+            counters = sorted(self._counters.items())
+
+        duration = f"{prefix}_stage_duration_seconds"
+        lines = [f"# HELP {duration} 各阶段墙钟时间",
+                 f"# TYPE {duration} histogram"]
+        for name, stats in stages:
+            label = f'stage="{_escape(name)}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets, stats.wall.counts):
+                cumulative += n
+                lines.append(f'{duration}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{duration}_bucket{{{label},le="+Inf"}} {stats.wall.count}')
+            lines.append(f'{duration}_sum{{{label}}} {stats.wall.sum:.9g}')
+            lines.append(f'{duration}_count{{{label}}} {stats.wall.count}')
+
+        cpu = f"{prefix}_stage_cpu_seconds_total"
+        lines += [f"# HELP {cpu} 各阶段调用线程的 CPU 时间",
+                  f"# TYPE {cpu} counter"]
+        lines += [f'{cpu}{{stage="{_escape(name)}"}} {stats.cpu_seconds:.9g}'
+                  for name, stats in stages]
+
+        nbytes = f"{prefix}_stage_tensor_bytes_total"
+        lines += [f"# HELP {nbytes} 各阶段产生的张量字节数",
+                  f"# TYPE {nbytes} counter"]
+        lines += [f'{nbytes}{{stage="{_escape(name)}"}} {stats.nbytes}'
+                  for name, stats in stages]
+
+        if counters:
+            events = f"{prefix}_events_total"
+            lines += [f"# HELP {events} 计数器",
+                      f"# TYPE {events} counter"]
+            lines += [f'{events}{{name="{_escape(name)}"}} {value:g}'
+                      for name, value in counters]
+        return "\n".join(lines) + "\n"
+
+    def chrome_trace(self) -> Dict:
+        """
+        Chrome trace 格式（Trace Event Format）的事件字典
+
+        每个阶段一个 "X"（完整）事件，时间单位微秒；嵌套阶段按时间自动嵌套显示。
+        """
+        pid = os.getpid()
+        with self._lock:
+            raw = list(self._events)
+            thread_names = dict(self._thread_names)
+            epoch = self._epoch_ns
+
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                   'args': {'name': name}} for tid, name in thread_names.items()]
+        for name, start_ns, wall_ns, cpu_ns, nbytes, tid, args in raw:
+            event_args = {'cpu_ms': round(cpu_ns / 1e6, 3)}
+            if nbytes:
+                event_args['bytes'] = nbytes
+            event_args.update(args)
+            events.append({
+                'name': name,
+                'cat': name.split(".", 1)[0],
+                'ph': 'X',
+                'ts': (start_ns - epoch) / 1000,
+                'dur': wall_ns / 1000,
+                'pid': pid,
+                'tid': tid,
+                'args': event_args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path: str):
+        """
+        保存 Chrome trace JSON
+
+        Args:
+            path: 输出路径
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False, default=str)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> Profiler:
+    """进程级剖析器（环境变量 HOME_ROBOT_PROFILE=1 时默认开启）"""
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                enabled = os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes")
+                _profiler = Profiler(enabled=enabled)
+    return _profiler
@@ -0,0 +1,87 @@
+"""
+请求合并（single-flight）
+相同键的并发调用只执行一次，其余调用等待并共享同一结果
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """一次进行中的计算"""
+
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    线程安全的请求合并器
+
+    第一个到达的调用者执行计算，计算期间到达的相同键调用阻塞等待，
+    完成后全部得到同一结果（或同一异常）。计算结束后键即被移除，
+    之后的调用会重新计算（结果复用由 ResultCache 负责）。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行或加入相同键的计算
+
+        Args:
+            key: 请求键
+            fn: 无参计算函数
+
+        Returns:
+            (result, shared)，shared 表示结果来自其他调用者的计算
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+    def stats(self) -> Dict:
+        """
+        获取合并统计
+
+        Returns:
+            字典，包含 inflight（进行中的键数）, executed, shared
+        """
+        with self._lock:
+            return {
+                'inflight': len(self._calls),
+                'executed': self.executed,
+                'shared': self.shared,
+            }
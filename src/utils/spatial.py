@@ -0,0 +1,280 @@
+"""
+检测框空间索引
+基于 NumPy 的均匀网格（CSR 存储），支持框相交、k 近邻和方位关系查询
+
+    index = SpatialIndex.from_detections(results)
+    index.intersect([x1, y1, x2, y2])      # 与框相交的检测
+    index.nearest(sofa_box, k=3)           # 最近的 3 个检测
+    index.relation(table_box, "left_of")   # 桌子左侧的检测
+"""
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+RELATIONS = ("left_of", "right_of", "above", "below")
+
+
+def box_gap_distance(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """
+    框之间的最小欧氏距离（相交时为 0）
+
+    Args:
+        box: (4,) xyxy
+        boxes: (N, 4) xyxy
+
+    Returns:
+        (N,) 距离
+    """
+    dx = np.maximum(0.0, np.maximum(boxes[:, 0] - box[2], box[0] - boxes[:, 2]))
+    dy = np.maximum(0.0, np.maximum(boxes[:, 1] - box[3], box[1] - boxes[:, 3]))
+    return np.hypot(dx, dy)
+
+
+def _as_box(box: Sequence[float]) -> np.ndarray:
+    box = np.asarray(box, dtype=np.float64).reshape(-1)
+    if box.size == 2:
+        # 点查询视为零面积框
+        box = np.concatenate([box, box])
+    if box.size != 4:
+        raise ValueError(f"查询框应为 [x1, y1, x2, y2] 或 [x, y]，收到 {box.size} 个值")
+    return box
+
+
+class SpatialIndex:
+    """
+    检测框空间索引
+
+    每个框登记到它覆盖的所有网格单元；单元到框编号的映射按单元排序后
+    以 CSR 形式保存（offsets + ids），查询时只取窗口覆盖的单元，
+    再对候选做向量化的精确判定。
+    """
+
+    def __init__(self, boxes, labels: Sequence[str] = None, cell_size: float = None,
+                 max_cells_per_box: int = 64):
+        """
+        构建索引
+
+        Args:
+            boxes: (N, 4) 像素坐标 xyxy
+            labels: 可选，长度为 N 的类别名称，用于按类别过滤
+            cell_size: 网格单元边长，默认由框尺寸中位数和分布范围估计
+            max_cells_per_box: 单个框最多登记的单元数（过大的框会放大单元尺寸）
+        """
+        self.boxes = np.ascontiguousarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if np.any(self.boxes[:, 2] < self.boxes[:, 0]) or np.any(self.boxes[:, 3] < self.boxes[:, 1]):
+            raise ValueError("框坐标应为 xyxy 且 x2 >= x1, y2 >= y1")
+        self.labels = np.asarray(labels if labels is not None else [""] * len(self.boxes),
+                                 dtype=object)
+        if len(self.labels) != len(self.boxes):
+            raise ValueError(f"labels 数量 {len(self.labels)} 与框数量 {len(self.boxes)} 不一致")
+        self._build(cell_size, max_cells_per_box)
+
+    @classmethod
+    def from_detections(cls, detections, **kwargs) -> "SpatialIndex":
+        """
+        由 GroundingTask.ground 的输出构建索引
+
+        Args:
+            detections: Detections，或 [{'bbox': [x1, y1, x2, y2], 'label': ..., ...}, ...]
+        """
+        if hasattr(detections, 'label_ids'):
+            return cls(detections.boxes, detections.labels, **kwargs)
+        boxes = np.array([d['bbox'] for d in detections], dtype=np.float64).reshape(-1, 4)
+        labels = [d.get('label', "") for d in detections]
+        return cls(boxes, labels, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def _build(self, cell_size: float, max_cells_per_box: int):
+        n = len(self.boxes)
+        if n == 0:
+            self.origin = np.zeros(2)
+            self.extent_max = np.zeros(2)
+            self.cell_size = 1.0
+            self.grid_shape = (1, 1)
+            self.offsets = np.zeros(2, dtype=np.int64)
+            self.ids = np.zeros(0, dtype=np.int64)
+            return
+
+        self.origin = self.boxes[:, :2].min(axis=0)
+        self.extent_max = self.boxes[:, 2:].max(axis=0)
+        extent = np.maximum(self.extent_max - self.origin, 1e-6)
+        if cell_size is None:
+            sizes = np.maximum(self.boxes[:, 2] - self.boxes[:, 0],
+                               self.boxes[:, 3] - self.boxes[:, 1])
+            # 单元约为典型框大小，同时整个网格不超过约 n 个单元
+            cell_size = max(float(np.median(sizes)),
+                            float(np.sqrt(extent[0] * extent[1] / n)))
+        cell_size = max(float(cell_size), 1e-6)
+
+        def cell_span(size):
+            lo = np.floor((self.boxes[:, :2] - self.origin) / size).astype(np.int64)
+            hi = np.floor((self.boxes[:, 2:] - self.origin) / size).astype(np.int64)
+            return lo, hi, hi - lo + 1
+
+        lo, hi, span = cell_span(cell_size)
+        while (span[:, 0] * span[:, 1]).max() > max_cells_per_box:
+            cell_size *= 2
+            lo, hi, span = cell_span(cell_size)
+
+        self.cell_size = cell_size
+        ncols, nrows = (np.floor(extent / cell_size).astype(np.int64) + 1).tolist()
+        self.grid_shape = (nrows, ncols)
+
+        # 展开每个框覆盖的单元
+        counts = span[:, 0] * span[:, 1]
+        box_ids = np.repeat(np.arange(n), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = lo[box_ids, 0] + local % span[box_ids, 0]
+        cy = lo[box_ids, 1] + local // span[box_ids, 0]
+        keys = cy * ncols + cx
+
+        order = np.argsort(keys, kind='stable')
+        self.ids = box_ids[order]
+        self.offsets = np.zeros(nrows * ncols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=nrows * ncols), out=self.offsets[1:])
+
+    def _candidates(self, window: np.ndarray) -> np.ndarray:
+        """窗口覆盖的网格单元中登记的框编号（去重）"""
+        nrows, ncols = self.grid_shape
+        lo = np.floor((window[:2] - self.origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((window[2:] - self.origin) / self.cell_size).astype(np.int64)
+        c1, r1 = np.maximum(lo, 0)
+        c2, r2 = np.minimum(hi, [ncols - 1, nrows - 1])
+        if c1 > c2 or r1 > r2:
+            return np.zeros(0, dtype=np.int64)
+        # 同一行内的单元在 CSR 中连续；跨多个单元的框会重复出现，需去重
+        rows = np.arange(r1, r2 + 1) * ncols
+        starts = self.offsets[rows + c1]
+        stops = self.offsets[rows + c2 + 1]
+        if len(rows) == 1:
+            return np.unique(self.ids[starts[0]:stops[0]])
+        lengths = stops - starts
+        pos = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return np.unique(self.ids[pos])
+
+    def _filter_label(self, ids: np.ndarray, label: str) -> np.ndarray:
+        if label is None:
+            return ids
+        return ids[self.labels[ids] == label]
+
+    def intersect(self, box: Sequence[float], label: str = None) -> np.ndarray:
+        """
+        与查询框相交（含边界接触）的检测
+
+        Args:
+            box: [x1, y1, x2, y2] 或点 [x, y]
+            label: 可选，只返回该类别
+
+        Returns:
+            检测编号数组（升序）
+        """
+        box = _as_box(box)
+        ids = self._candidates(box)
+        b = self.boxes[ids]
+        hit = ((b[:, 0] <= box[2]) & (b[:, 2] >= box[0]) &
+               (b[:, 1] <= box[3]) & (b[:, 3] >= box[1]))
+        return np.sort(self._filter_label(ids[hit], label))
+
+    def within(self, box: Sequence[float], radius: float,
+               label: str = None) -> np.ndarray:
+        """
+        与查询框距离不超过 radius 的检测（"附近"查询）
+
+        Returns:
+            检测编号数组，按距离升序
+        """
+        box = _as_box(box)
+        ids = self._candidates(box + np.array([-radius, -radius, radius, radius]))
+        ids = self._filter_label(ids, label)
+        dist = box_gap_distance(box, self.boxes[ids])
+        keep = dist <= radius
+        return ids[keep][np.argsort(dist[keep], kind='stable')]
+
+    def nearest(self, box: Sequence[float], k: int = 1, label: str = None,
+                exclude: Sequence[int] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k 近邻（框间最小距离，相交为 0）
+
+        从一个单元大小的半径开始逐步扩大搜索窗口，直到第 k 近的候选
+        落在窗口半径内，结果即为精确解。
+
+        Args:
+            box: 查询框或点
+            k: 近邻数
+            label: 可选，只在该类别中查找
+            exclude: 排除的检测编号（如查询框本身）
+
+        Returns:
+            (编号数组, 距离数组)，按距离升序，不足 k 个时返回全部
+        """
+        box = _as_box(box)
+        exclude = np.asarray(exclude, dtype=np.int64)
+        if k <= 0 or len(self) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        radius = self.cell_size
+        while True:
+            window = box + np.array([-radius, -radius, radius, radius])
+            # 窗口覆盖整个网格时候选即为全部检测
+            covers = bool(np.all(window[:2] <= self.origin) and np.all(window[2:] >= self.extent_max))
+            ids = self._filter_label(self._candidates(window), label)
+            if len(exclude):
+                ids = ids[~np.isin(ids, exclude)]
+            if len(ids) >= k or covers:
+                dist = box_gap_distance(box, self.boxes[ids])
+                top = np.argpartition(dist, k - 1)[:k] if len(ids) > k else np.arange(len(ids))
+                if covers or dist[top].max() <= radius:
+                    top = top[np.argsort(dist[top], kind='stable')]
+                    return ids[top], dist[top]
+            radius *= 2
+
+    def relation(self, box: Sequence[float], relation: str, label: str = None,
+                 max_distance: float = None) -> np.ndarray:
+        """
+        方位关系查询：中心点位于查询框某一侧之外的检测
+
+        Args:
+            box: 参照物的框
+            relation: "left_of" / "right_of" / "above" / "below"（图像坐标，y 向下）
+            label: 可选，只返回该类别
+            max_distance: 可选，只返回与参照物距离不超过该值的检测
+
+        Returns:
+            检测编号数组，按与参照物的距离升序
+        """
+        if relation not in RELATIONS:
+            raise ValueError(f"未知方位关系: {relation}，可选: {', '.join(RELATIONS)}")
+        box = _as_box(box)
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        reach = np.inf if max_distance is None else max_distance
+        lo, hi = self.origin, self.extent_max
+        # 距离上限同时约束垂直方向的范围
+        x1, y1 = np.maximum(lo, box[:2] - reach)
+        x2, y2 = np.minimum(hi, box[2:] + reach)
+        window = {
+            'left_of': [x1, y1, box[0], y2],
+            'right_of': [box[2], y1, x2, y2],
+            'above': [x1, y1, x2, box[1]],
+            'below': [x1, box[3], x2, y2],
+        }[relation]
+        window = np.array(window, dtype=np.float64)
+        ids = self._filter_label(self._candidates(window), label)
+        b = self.boxes[ids]
+        center = (b[:, :2] + b[:, 2:]) / 2
+        keep = {
+            'left_of': center[:, 0] < box[0],
+            'right_of': center[:, 0] > box[2],
+            'above': center[:, 1] < box[1],
+            'below': center[:, 1] > box[3],
+        }[relation]
+        ids = ids[keep]
+        dist = box_gap_distance(box, self.boxes[ids])
+        if max_distance is not None:
+            keep = dist <= max_distance
+            ids, dist = ids[keep], dist[keep]
+        return ids[np.argsort(dist, kind='stable')]
@@ -13,7 +13,7 @@ def visualize_results(image: Image.Image, results: List[Dict],
     
     Args:
         image: PIL Image 对象
-        results: 检测结果列表
+        results: 检测结果（Detections 或字典列表，bbox 为像素坐标 xyxy）
         output_path: 输出路径
     """
     # 创建副本用于绘制
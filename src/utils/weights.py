@@ -0,0 +1,194 @@
+"""
+低内存权重加载
+权重文件以内存映射方式读取，模块参数先建在 meta 设备上，再直接指向映射的张量，
+加载过程中不会同时存在「随机初始化的参数」和「读入内存的权重」两份拷贝
+
+    state_dict = load_checkpoint("weights.safetensors")
+    model, load_result = build_with_state_dict(lambda: build_model(args), state_dict)
+"""
+import contextlib
+import os
+import pickle
+import threading
+from itertools import chain
+from typing import Callable, Dict, Tuple
+
+import torch
+
+
+def _strip_prefix(state_dict: Dict[str, torch.Tensor], prefix: str = "module.") -> Dict:
+    """去掉 DataParallel / DDP 保存时的 "module." 前缀"""
+    return {(key[len(prefix):] if key.startswith(prefix) else key): value
+            for key, value in state_dict.items()}
+
+
+def load_checkpoint(path: str, mmap: bool = True) -> Dict[str, torch.Tensor]:
+    """
+    读取模型权重
+
+    .safetensors 文件直接内存映射；.pth 文件优先 torch.load(mmap=True, weights_only=True)，
+    旧版（非 zip）格式或包含非张量对象时依次回退。
+
+    Args:
+        path: 权重文件路径
+        mmap: 是否内存映射（张量按需从文件读入，且可被多个进程共享页缓存）
+
+    Returns:
+        state_dict（已去掉 "module." 前缀；checkpoint 中的 'model' 字段会被展开）
+    """
+    if path.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        return _strip_prefix(load_file(path, device="cpu"))
+
+    attempts = []
+    if mmap:
+        attempts += [{'mmap': True, 'weights_only': True}, {'mmap': True, 'weights_only': False}]
+    attempts += [{'weights_only': False}]
+    error = None
+    for kwargs in attempts:
+        try:
+            checkpoint = torch.load(path, map_location="cpu", **kwargs)
+            break
+        except (RuntimeError, TypeError, pickle.UnpicklingError) as e:
+            # torch < 2.1 不支持 mmap；旧格式不能映射；weights_only 拒绝非张量对象
+            error = e
+    else:
+        raise error
+
+    if isinstance(checkpoint, dict) and isinstance(checkpoint.get('model'), dict):
+        checkpoint = checkpoint['model']
+    return _strip_prefix(checkpoint)
+
+
+# init_empty_parameters 的状态：替换 register_parameter 的上下文数（进程级）
+# 和当前线程的嵌套深度（只有进入上下文的线程把参数放到 meta 上）
+_patch_lock = threading.Lock()
+_patch_users = 0
+_original_register_parameter = None
+_local = threading.local()
+
+
+def _register_parameter(module, name, param):
+    _original_register_parameter(module, name, param)
+    # 已在 meta 上的参数（如 tied weight 的再次注册）保持原对象，共享关系不变
+    if getattr(_local, 'depth', 0) and param is not None and not param.is_meta:
+        param = module._parameters[name]
+        module._parameters[name] = type(param)(
+            param.to("meta"), requires_grad=param.requires_grad
+        )
+
+
+@contextlib.contextmanager
+def init_empty_parameters():
+    """
+    构建模块时把参数放到 meta 设备（缓冲区照常创建）
+
+    不用 `with torch.device("meta")`：非持久缓冲区（如 position_ids）不在权重文件中，
+    放到 meta 上之后无法恢复。register_parameter 的替换是进程级的，但只对进入
+    上下文的线程生效：加载期间其他线程（调度线程、并发加载的其他模型）构建的模块不受影响。
+    """
+    global _patch_users, _original_register_parameter
+    with _patch_lock:
+        if _patch_users == 0:
+            _original_register_parameter = torch.nn.Module.register_parameter
+            torch.nn.Module.register_parameter = _register_parameter
+        _patch_users += 1
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+        with _patch_lock:
+            _patch_users -= 1
+            if _patch_users == 0:
+                torch.nn.Module.register_parameter = _original_register_parameter
+
+
+def _shared_parameters(model: torch.nn.Module):
+    """共享（tied）参数分组：同一参数对象在不同模块下的全部名称"""
+    groups = {}
+    for name, param in model.named_parameters(remove_duplicate=False):
+        groups.setdefault(id(param), []).append(name)
+    return [names for names in groups.values() if len(names) > 1]
+
+
+def _retie(model: torch.nn.Module, groups) -> None:
+    """assign=True 会按名称分别替换参数，重新让共享参数指向同一个张量"""
+    for names in groups:
+        param = model.get_parameter(names[0])
+        for name in names[1:]:
+            module_name, _, attr = name.rpartition(".")
+            setattr(model.get_submodule(module_name), attr, param)
+
+
+def _meta_tensors(model: torch.nn.Module):
+    return [name for name, tensor in chain(model.named_parameters(), model.named_buffers())
+            if tensor.is_meta]
+
+
+def build_with_state_dict(build_fn: Callable[[], torch.nn.Module],
+                          state_dict: Dict[str, torch.Tensor],
+                          strict: bool = False) -> Tuple[torch.nn.Module, object]:
+    """
+    构建模块并载入权重，参数直接引用 state_dict 中的张量（assign=True）
+
+    权重文件缺少部分参数、构建过程不支持 meta 参数或 torch 版本不支持 assign 时，回退为常规的
+    「构建 + 复制权重」方式，结果与之前的加载方式一致。
+
+    Args:
+        build_fn: 无参数的模型构建函数
+        state_dict: load_checkpoint 的返回值
+        strict: 传给 load_state_dict
+
+    Returns:
+        (model, load_state_dict 的返回值)
+    """
+    try:
+        with init_empty_parameters():
+            model = build_fn()
+        shared = _shared_parameters(model)
+        load_result = model.load_state_dict(state_dict, strict=strict, assign=True)
+        _retie(model, shared)
+        missing = _meta_tensors(model)
+        if not missing:
+            return model, load_result
+        print(f"警告: 权重文件缺少 {len(missing)} 个参数（如 {missing[0]}），改用常规方式加载")
+    except Exception as e:
+        # torch < 2.1 的 load_state_dict 没有 assign 参数；构建过程中对参数做计算的模块
+        # 在 meta 上也会失败。真正的构建错误会在下面的常规构建中再次抛出
+        print(f"警告: 无法直接映射参数（{type(e).__name__}: {e}），改用常规方式加载")
+
+    model = build_fn()
+    return model, model.load_state_dict(state_dict, strict=strict)
+
+
+def convert_checkpoint(src_path: str, dst_path: str) -> Dict:
+    """
+    将 .pth checkpoint 转换为 safetensors（可内存映射、加载时不执行 pickle）
+
+    Args:
+        src_path: 原始 .pth 文件
+        dst_path: 输出 .safetensors 文件
+
+    Returns:
+        {'tensors': 张量数, 'bytes': 总字节数}
+    """
+    from safetensors.torch import save_file
+
+    state_dict = load_checkpoint(src_path, mmap=True)
+    tensors, seen = {}, set()
+    for key, value in state_dict.items():
+        if not isinstance(value, torch.Tensor):
+            continue
+        # safetensors 不允许共享存储，重复引用的张量单独复制
+        storage = value.untyped_storage().data_ptr()
+        value = value.contiguous()
+        tensors[key] = value.clone() if storage in seen else value
+        seen.add(storage)
+
+    os.makedirs(os.path.dirname(os.path.abspath(dst_path)), exist_ok=True)
+    tmp_path = dst_path + ".tmp"
+    save_file(tensors, tmp_path, metadata={'source': os.path.basename(src_path)})
+    os.replace(tmp_path, dst_path)
+    return {'tensors': len(tensors),
+            'bytes': sum(t.element_size() * t.nelement() for t in tensors.values())}
@@ -69,7 +69,10 @@ def main():
         data_path=config['data']['dataset_path'],
         split="train",
         transform=transform,
-        image_size=config['data']['image_size']
+        image_size=config['data']['image_size'],
+        split_ratios=(config['data']['train_split'],
+                      config['data']['val_split'],
+                      config['data']['test_split'])
     )
     
     train_loader = DataLoader(